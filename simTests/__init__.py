@@ -0,0 +1,4 @@
+## Kinematic simulation of mobile robots with Klampt
+## The folder can be imported as a package (e.g. from the root of the repository: import simTests.buildWorld),
+## or its scripts run from this folder (python headlessSim.py simpleWorld.xml).
+## No module of the package imports klampt.vis or OpenGL, except kinematicSim.py and the replay of trajectoryLog.py.
@@ -0,0 +1,242 @@
+#!/usr/bin/python
+
+## Batch validity of robot configurations
+## validityChecker.check takes a (K x dof) array of configs of a robot wrapper (the reduced state, e.g. (x, y, yaw)
+## of kobuki/turtlebot, or full Klampt configs) and returns a boolean mask of the collision free configs and the
+## first colliding pair of each config (headlessSim.firstCollision: terrains, rigid objects, then self collisions).
+## The configs are split into chunks, checked by a pool of workers. Every worker holds its own copy of the world
+## (WorldModel, wrapper and colliders are not shared between threads), loaded once when the pool is created.
+## mode "process": multiprocessing pool (default). The Klampt bindings keep the GIL during the collision queries,
+##   so only processes check configs in parallel.
+## mode "thread": thread pool, for Klampt builds that release the GIL, or to keep the queries off the main thread.
+## workers = 1: the configs are checked in the calling thread.
+## worldValidity has the same check() on a world already loaded in this process (e.g. by a planner).
+## With stop=True the check ends at the first colliding config: the configs after it are skipped (False, None).
+## cancel() skips the remaining configs of the running check (e.g. from another thread).
+##
+## Execution (benchmark, from this folder):
+##   python batchValidity.py turtle.xml --robot turtlebot --num 10000 --workers 1 4
+
+import time
+import math
+import argparse
+import threading
+import multiprocessing
+import multiprocessing.pool
+import numpy as np
+import klampt.model.collide as collide
+try:
+    from . import headlessSim
+    from .broadPhase import broadPhaseCollider
+    from .selfCollision import selfCollider
+except (ImportError, ValueError):
+    import headlessSim
+    from broadPhase import broadPhaseCollider
+    from selfCollision import selfCollider
+
+modes = ["process", "thread"]
+
+## State of the workers of the pools, one per thread
+_local = threading.local()
+
+class worldValidity(object):
+    ## check() of validityChecker on a world of this process, with its collision checkers (no pool)
+    def __init__ (self, world, robot, collider = None, selfChecker = None):
+        ## robot: wrapper of world.robot(0), collider: collide.WorldCollider(world) by default
+        self.world = world
+        self.robot = robot
+        self.model = world.robot(0)
+        self.numFull = self.model.numLinks()
+        self.collider = collider if collider is not None else collide.WorldCollider(world)
+        self.selfChecker = selfChecker
+        self._stopIndex = multiprocessing.Value("l", 0)
+
+    def setConfig(self, q):
+        if len(q) == self.numFull:
+            self.model.setConfig([float(v) for v in q])
+        else:
+            self.robot.setConfig([float(v) for v in q])
+            self.robot.flush()
+
+    def _check(self, start, configs, stop, stopIndex):
+        ## Checks configs[k] (index start + k of the batch) until the end or the stop index
+        valid = []
+        pairs = []
+        for k in range(len(configs)):
+            if start + k > stopIndex.value:
+                break
+            self.setConfig(configs[k])
+            pair = headlessSim.firstCollision(self.world, self.collider, self.selfChecker)
+            valid.append(pair is None)
+            pairs.append(pair)
+            if pair is not None and stop:
+                with stopIndex.get_lock():
+                    if start + k < stopIndex.value:
+                        stopIndex.value = start + k
+                break
+        return start, valid, pairs
+
+    def check(self, configs, stop = False):
+        configs = np.atleast_2d(np.asarray(configs, dtype=float))
+        valid = np.zeros(len(configs), dtype=bool)
+        pairs = [None] * len(configs)
+        self._stopIndex.value = len(configs)
+        start,v,p = self._check(0, configs, stop, self._stopIndex)
+        valid[:len(v)] = v
+        pairs[:len(p)] = p
+        return valid, pairs
+
+    def firstInvalid(self, configs):
+        return _firstInvalid(*self.check(configs, stop=True))
+
+    def cancel(self):
+        self._stopIndex.value = -1
+
+def _loadWorker(options):
+    ## World, wrapper and colliders of one worker
+    world = headlessSim.loadWorld(options["worldFiles"], options["room"], options["meshCache"])
+    robot = headlessSim.makeRobot(world, options["robotType"])
+    robot.flush()
+    if options["proxy"] is not None:
+        try:
+            from .collisionProxy import applyProxies
+        except (ImportError, ValueError):
+            from collisionProxy import applyProxies
+        applyProxies(world.robot(0), options["proxy"], options["proxyMargin"])
+    collider = collide.WorldCollider(world)
+    if options["cellSize"] is not None:
+        collider = broadPhaseCollider(world, options["cellSize"], collider=collider)
+    selfChecker = selfCollider(world) if options["selfCache"] else None
+    return worldValidity(world, robot, collider, selfChecker)
+
+def _firstInvalid(valid, pairs):
+    invalid = np.flatnonzero(~valid)
+    return int(invalid[0]) if len(invalid) and pairs[invalid[0]] is not None else -1
+
+def _initWorker(options, stopIndex):
+    _local.worker = _loadWorker(options)
+    _local.stopIndex = stopIndex
+
+def _checkChunk(task):
+    start,configs,stop = task
+    return _local.worker._check(start, configs, stop, _local.stopIndex)
+
+class validityChecker(object):
+    def __init__ (self, worldFiles, robotType, room = "door", workers = None, mode = "process", meshCache = True,
+                  selfCache = False, proxy = None, proxyMargin = 0.0, cellSize = None):
+        ## worldFiles, room: loaded with headlessSim.loadWorld, robotType: wrapper of world.robot(0) (headlessSim.makeRobot)
+        ## workers: size of the pool (None: number of CPUs), 1 to check in the calling thread
+        ## selfCache, proxy, proxyMargin, cellSize: options of the colliders, as in headlessSim.py
+        if mode not in modes:
+            raise ValueError("Unknown mode "+str(mode))
+        options = {"worldFiles": list(worldFiles), "robotType": robotType, "room": room, "meshCache": meshCache,
+                   "selfCache": selfCache, "proxy": proxy, "proxyMargin": proxyMargin, "cellSize": cellSize}
+        self.mode = mode
+        self.workers = workers or multiprocessing.cpu_count()
+        ## Index of the first colliding config when stopping early, shared with the workers
+        self._stopIndex = multiprocessing.Value("l", 0)
+        self._pool = None
+        self._worker = None
+        if self.workers == 1:
+            self._worker = _loadWorker(options)
+        elif mode == "process":
+            if meshCache:
+                try:
+                    try:
+                        from . import meshCache as mc
+                    except (ImportError, ValueError):
+                        import meshCache as mc
+                    ## The forked workers share the pages of the cache entries read here
+                    mc.preload(options["worldFiles"])
+                except ImportError:
+                    pass
+            self._pool = multiprocessing.Pool(self.workers, _initWorker, (options, self._stopIndex))
+        else:
+            self._pool = multiprocessing.pool.ThreadPool(self.workers, _initWorker, (options, self._stopIndex))
+
+    def check(self, configs, stop = False, chunk = None):
+        ## configs: (K x dof) array. Returns the mask of the valid configs and the first colliding pair of each
+        ## config (None if valid or skipped)
+        ## stop: end the check at the first colliding config (in the order of the batch)
+        ## chunk: configs per task (default: 4 tasks per worker, at most 256 configs)
+        configs = np.atleast_2d(np.asarray(configs, dtype=float))
+        num = len(configs)
+        valid = np.zeros(num, dtype=bool)
+        pairs = [None] * num
+        self._stopIndex.value = num
+        if num == 0:
+            return valid, pairs
+        if self._worker is not None:
+            results = [self._worker._check(0, configs, stop, self._stopIndex)]
+        else:
+            if chunk is None:
+                chunk = max(1, min(256, num // (4 * self.workers)))
+            tasks = [(start, configs[start:start+chunk], stop) for start in range(0, num, chunk)]
+            results = self._pool.imap_unordered(_checkChunk, tasks)
+        for start,v,p in results:
+            valid[start:start+len(v)] = v
+            pairs[start:start+len(p)] = p
+        if stop and self._stopIndex.value < num:
+            ## Configs after the first colliding one may have been checked by other workers
+            first = self._stopIndex.value
+            valid[first:] = False
+            pairs[first+1:] = [None] * (num - first - 1)
+        return valid, pairs
+
+    def firstInvalid(self, configs):
+        ## Index of the first colliding config (e.g. of a trajectory), -1 if all are valid
+        return _firstInvalid(*self.check(configs, stop=True))
+
+    def cancel(self):
+        ## Skip the remaining configs of the running check (they are returned as invalid)
+        self._stopIndex.value = -1
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def randomConfigs(robotType, num, size = 8.0, seed = 0):
+    ## Uniform configs of the wrapper in a size x size square centered at the origin (random orientation)
+    rng = np.random.RandomState(seed)
+    xy = rng.uniform(-size/2.0, size/2.0, (num, 2))
+    if robotType == "sphero":
+        return np.column_stack([xy, np.full(num, 0.5), rng.uniform(0.0, 2*math.pi, (num, 3))])
+    return np.column_stack([xy, rng.uniform(-math.pi, math.pi, num)])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch validity of random configurations")
+    parser.add_argument("world", nargs="+", help="world file(s)")
+    parser.add_argument("--robot", default="sphero", choices=["sphero", "kobuki", "turtlebot"], help="robot wrapper (must match the world file)")
+    parser.add_argument("--room", default="door", choices=["door", "window", "none"], help="rooms added to the world")
+    parser.add_argument("--num", type=int, default=10000, help="number of configs")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="pool sizes")
+    parser.add_argument("--modes", nargs="+", default=modes, choices=modes, help="pools")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    configs = randomConfigs(args.robot, args.num, seed=args.seed)
+    reference = None
+    print('{0:>8} {1:>8} {2:>10} {3:>12} {4:>8} {5:>8}'.format("mode", "workers", "setup (s)", "configs/s", "valid", "match"))
+    for mode in args.modes:
+        for workers in args.workers:
+            if workers == 1 and mode != args.modes[0]:
+                continue
+            t = time.time()
+            checker = validityChecker(args.world, args.robot, args.room, workers, mode)
+            setup = time.time() - t
+            t = time.time()
+            valid,pairs = checker.check(configs)
+            elapsed = time.time() - t
+            checker.close()
+            if reference is None:
+                reference = valid
+            print('{0:>8} {1:>8} {2:>10.2f} {3:>12.0f} {4:>8} {5:>8}'.format(mode if workers > 1 else "serial", workers, setup,
+                  len(configs)/elapsed, int(valid.sum()), "yes" if (valid == reference).all() else "no"))
@@ -0,0 +1,270 @@
+#!/usr/bin/python
+
+## Benchmark suite of the robots of mobile_robots (kobuki, turtlebot, r2d2, sphero)
+##  1. load: world.readFile of the robot in a fresh process (Klampt keeps the meshes it has parsed)
+##  2. step: velControlKin / wheelControlKin (sphero: setConfig) with flush, and the full step of headlessSim.run
+##  3. build: buildWorld.getWalls against the number of walls, as a group or merged into one mesh
+##  4. collide: latency of the terrain, object and self collision queries, in free space (at least 1 m from the
+##     walls of the double room) and near the walls (at most 0.4 m, see collisionProxy.wallPoses)
+## Every metric is a median over repeats. The results are written to a JSON file (--out), with the unit and the
+## direction (lower or higher is better) of every metric. --compare BASELINE runs the suite (or reads --results)
+## and flags the metrics that are worse than the baseline by more than the threshold, the metrics of the baseline
+## that are missing from the results and the invalid (non-positive) values; the exit status is 1 if any is flagged.
+##
+## Execution (from this folder):
+##   python benchSuite.py --out baseline.json
+##   python benchSuite.py --compare baseline.json --out current.json
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import subprocess
+import klampt
+from klampt import WorldModel
+import klampt.model.collide as collide
+try:
+    from . import headlessSim
+    from . import buildWorld as bW
+    from .collisionProxy import robotFiles, wallPoses
+except (ImportError, ValueError):
+    ## Run as a script from this folder
+    import headlessSim
+    import buildWorld as bW
+    from collisionProxy import robotFiles, wallPoses
+
+robotsDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mobile_robots")
+floorFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "block.off")
+
+## Control profile of the full step of every robot
+stepControls = {"kobuki": "vel", "turtlebot": "vel", "r2d2": "vel", "sphero": "sphere"}
+
+## Clock of the latencies of single queries (a few microseconds)
+_clock = getattr(time, "perf_counter", time.time)
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values)//2]
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(int(p*len(values)), len(values) - 1)]
+
+def _metric(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+def robotWorld(name, room = True):
+    ## World with the robot, the floor of simpleWorld.xml and the double room of headlessSim.py
+    world = WorldModel()
+    if not world.readFile(os.path.join(robotsDir, robotFiles[name])):
+        raise RuntimeError("Unable to load robot "+name)
+    floor = world.loadTerrain(floorFile)
+    floor.geometry().scale(2)
+    if room:
+        bW.getDoubleRoomDoor(world, 8, 8, 1)
+    robot = headlessSim.makeRobot(world, name)
+    robot.flush()
+    return world, robot
+
+def freePoses(num, clearance = 1.0, seed = 0):
+    ## Random poses (x, y, yaw) at least clearance from the walls of the double room
+    rng = random.Random(seed)
+    poses = []
+    while len(poses) < num:
+        x = rng.uniform(-4 + clearance, 4 - clearance)
+        y = rng.uniform(-4 + clearance, 4 - clearance)
+        if abs(y) >= clearance:
+            poses.append((x, y, rng.uniform(-math.pi, math.pi)))
+    return poses
+
+def _setPose(robot, name, pose):
+    x,y,yaw = pose
+    if name == "sphero":
+        robot.setConfig([x, y, 0.5, yaw, 0.0, 0.0])
+    else:
+        robot.setConfig([x, y, yaw])
+    robot.flush()
+
+_probe = """
+import sys, time
+from klampt import WorldModel
+world = WorldModel()
+t = time.time()
+if not world.readFile(sys.argv[1]):
+    raise RuntimeError("Unable to load "+sys.argv[1])
+print("time %f" % (time.time() - t))
+"""
+
+def loadTime(name, repeat = 5):
+    ## Median time (s) of world.readFile of the robot in a fresh process
+    times = []
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable, "-c", _probe, os.path.join(robotsDir, robotFiles[name])], stderr=subprocess.STDOUT)
+        times.append(float([l for l in out.decode("utf-8").splitlines() if l.startswith("time ")][-1].split()[1]))
+    return _median(times)
+
+def stepRates(name, steps = 20000, repeat = 3, simTime = 20.0):
+    ## Steps per second of the kinematics (with flush) and of the full step of headlessSim.run
+    world,robot = robotWorld(name)
+    rates = {}
+    if name == "sphero":
+        kinematics = {"setConfig": lambda t, dt: headlessSim.sphereControl(robot, t, dt)}
+    else:
+        kinematics = {"velControlKin": lambda t, dt: robot.velControlKin(0.5*math.cos(t), math.sin(t), dt),
+                      "wheelControlKin": lambda t, dt: robot.wheelControlKin(math.sin(t), math.cos(t), dt)}
+    for label,step in sorted(kinematics.items()):
+        results = []
+        for r in range(repeat):
+            t0 = time.time()
+            for k in range(steps):
+                step(k*0.01, 0.01)
+                robot.flush()
+            results.append(steps/(time.time() - t0))
+        rates[label] = _median(results)
+    collider = collide.WorldCollider(world)
+    results = []
+    for r in range(repeat):
+        stats = headlessSim.run(world, robot, headlessSim.controls[stepControls[name]], collider, 0.01, simTime)
+        results.append(stats["stepsPerSec"])
+    rates["fullStep"] = _median(results)
+    return rates
+
+def randomWalls(num, seed = 0):
+    ## num walls of random lengths and orientations in a 40 x 40 m square (arguments of buildWorld.getWall)
+    rng = random.Random(seed)
+    return [(rng.uniform(0.5, 4.0), 0.01, 1.0, [rng.uniform(-20, 20), rng.uniform(-20, 20), 0], rng.uniform(0, math.pi)) for i in range(num)]
+
+def buildTime(num, merge, repeat = 3):
+    ## Median time (s) to build num walls and add them to a world as one rigid object
+    walls = randomWalls(num)
+    times = []
+    for r in range(repeat):
+        world = WorldModel()
+        t0 = time.time()
+        obj = world.makeRigidObject("walls")
+        obj.geometry().set(bW.getWalls(walls, merge))
+        times.append(time.time() - t0)
+    return _median(times)
+
+def collisionLatencies(name, poses, repeat = 2):
+    ## p50 and p99 (s) of the terrain, object and self collision queries over the poses
+    ## The first pass builds the collision data of the geometries, the last one is timed
+    world,robot = robotWorld(name)
+    model = world.robot(0)
+    terrain = world.terrain(0)
+    collider = collide.WorldCollider(world)
+    queries = [("terrain", lambda: any(True for _ in collider.robotTerrainCollisions(model, terrain))),
+               ("object", lambda: list(collider.robotObjectCollisions(model))),
+               ("self", lambda: list(collider.robotSelfCollisions(model)))]
+    for r in range(repeat):
+        samples = dict((q, []) for q,f in queries)
+        for pose in poses:
+            _setPose(robot, name, pose)
+            for q,f in queries:
+                t0 = _clock()
+                f()
+                samples[q].append(_clock() - t0)
+    return dict((q, (_percentile(s, 0.5), _percentile(s, 0.99))) for q,s in samples.items())
+
+def runSuite(robots, parts, repeat = 3, poses = 1000, steps = 20000, wallCounts = (10, 100, 1000), progress = True):
+    ## Returns the metrics {name: {"value", "unit", "better"}}
+    metrics = {}
+    def report(name, m):
+        metrics[name] = m
+        if progress:
+            print('{0:>40} {1:>14.4g} {2}'.format(name, m["value"], m["unit"]))
+    if "load" in parts:
+        for name in robots:
+            report(name + ".load", _metric(1000*loadTime(name, max(repeat, 3)), "ms", "lower"))
+    if "step" in parts:
+        for name in robots:
+            for label,rate in sorted(stepRates(name, steps, repeat).items()):
+                report(name + ".step." + label, _metric(rate, "steps/s", "higher"))
+    if "build" in parts:
+        for num in wallCounts:
+            for merge in (False, True):
+                report('buildWorld.{0}.{1}'.format("merged" if merge else "group", num), _metric(1000*buildTime(num, merge, repeat), "ms", "lower"))
+    if "collide" in parts:
+        poseSets = {"free": freePoses(poses), "wall": wallPoses(poses, 0.4)}
+        for name in robots:
+            for label in sorted(poseSets):
+                for q,(p50,p99) in sorted(collisionLatencies(name, poseSets[label]).items()):
+                    report('{0}.collide.{1}.{2}.p50'.format(name, q, label), _metric(1e6*p50, "us", "lower"))
+                    report('{0}.collide.{1}.{2}.p99'.format(name, q, label), _metric(1e6*p99, "us", "lower"))
+    return metrics
+
+def machineInfo():
+    return {"python": platform.python_version(), "platform": platform.platform(), "machine": platform.machine(),
+            "klampt": getattr(klampt, "__version__", "unknown"), "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+def writeResults(fn, metrics):
+    with open(fn, "w") as f:
+        json.dump({"info": machineInfo(), "metrics": metrics}, f, indent=1, sort_keys=True)
+
+def readResults(fn):
+    with open(fn) as f:
+        return json.load(f)["metrics"]
+
+## Status of the rows of compare() that fail the comparison
+failures = ("REGRESSION", "MISSING", "INVALID")
+
+def compare(baseline, current, threshold = 0.15):
+    ## Rows (name, baseline, current, change, status) of the metrics of either run
+    ## change is the relative improvement (positive) or degradation (negative) of the metric, None if not comparable
+    ## status: "" or "REGRESSION", "MISSING" (not in the current results), "NEW" (not in the baseline),
+    ## or "INVALID" (a value is not positive)
+    rows = []
+    for name in sorted(set(baseline) | set(current)):
+        old = baseline[name]["value"] if name in baseline else None
+        new = current[name]["value"] if name in current else None
+        if new is None:
+            rows.append((name, old, new, None, "MISSING"))
+        elif old is None:
+            rows.append((name, old, new, None, "NEW"))
+        elif old <= 0 or new <= 0:
+            rows.append((name, old, new, None, "INVALID"))
+        else:
+            ratio = new/old if baseline[name]["better"] == "higher" else old/new
+            rows.append((name, old, new, ratio - 1.0, "REGRESSION" if ratio < 1.0/(1.0 + threshold) else ""))
+    return rows
+
+def _cell(value, fmt):
+    return "-" if value is None else fmt.format(value)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark suite of the robots of mobile_robots")
+    parser.add_argument("--robots", nargs="+", default=["kobuki", "turtlebot", "r2d2", "sphero"], choices=sorted(robotFiles.keys()))
+    parser.add_argument("--parts", nargs="+", default=["load", "step", "build", "collide"], choices=["load", "step", "build", "collide"])
+    parser.add_argument("--repeat", type=int, default=3, help="repeats of every measurement (median)")
+    parser.add_argument("--poses", type=int, default=1000, help="poses of the collision queries, in free space and near the walls")
+    parser.add_argument("--steps", type=int, default=20000, help="steps of the kinematics")
+    parser.add_argument("--walls", type=int, nargs="+", default=[10, 100, 1000], help="numbers of walls of buildWorld")
+    parser.add_argument("--out", default=None, metavar="FILE", help="write the results to FILE (JSON)")
+    parser.add_argument("--compare", default=None, metavar="BASELINE", help="compare the results with a baseline file")
+    parser.add_argument("--results", default=None, metavar="FILE", help="compare these results instead of running the suite")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative degradation flagged as a regression")
+    parser.add_argument("--ignoremissing", action="store_true", help="do not fail on the metrics of the baseline missing from the results (e.g. other --parts)")
+    args = parser.parse_args()
+
+    if args.results is not None:
+        metrics = readResults(args.results)
+    else:
+        metrics = runSuite(args.robots, args.parts, args.repeat, args.poses, args.steps, args.walls)
+        if args.out is not None:
+            writeResults(args.out, metrics)
+    if args.compare is not None:
+        rows = compare(readResults(args.compare), metrics, args.threshold)
+        print('{0:>40} {1:>12} {2:>12} {3:>8}'.format("metric", "baseline", "current", "change"))
+        for name,old,new,change,status in rows:
+            print('{0:>40} {1:>12} {2:>12} {3:>8} {4}'.format(name, _cell(old, '{0:.4g}'), _cell(new, '{0:.4g}'),
+                  _cell(None if change is None else 100*change, '{0:.1f}%'), status))
+        counts = dict((s, sum(1 for r in rows if r[4] == s)) for s in failures + ("NEW",))
+        print('{0} metrics, {1} regressions, {2} missing, {3} invalid, {4} new (threshold {5:.0f}%)'.format(len(rows),
+              counts["REGRESSION"], counts["MISSING"], counts["INVALID"], counts["NEW"], 100*args.threshold))
+        failed = [r[0] for r in rows if r[4] in failures and not (args.ignoremissing and r[4] == "MISSING")]
+        if failed:
+            sys.exit(1)
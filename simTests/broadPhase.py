@@ -0,0 +1,161 @@
+#!/usr/bin/python
+
+## Broad phase collision checking in front of klampt's WorldCollider
+## The bounding boxes of the terrains and rigid objects are stored in a uniform grid over (x, y).
+## Group geometries (e.g. the walls of buildWorld.getDoubleRoomDoor) are split into their elements, so that
+## each wall has its own bounding box.
+## A link of a robot is only tested (narrow phase) against the elements whose bounding box overlaps its own.
+## The class broadPhaseCollider has the same robotTerrainCollisions, robotObjectCollisions and robotSelfCollisions
+## functions as collide.WorldCollider, so it can be used in its place in the simulation loop.
+## The static elements are indexed once, call build() again if a terrain or a rigid object is moved or added.
+
+import math
+import klampt.model.collide as collide
+
+def _overlaps(a, b):
+    ## True if the bounding boxes a and b ((bmin, bmax)) overlap
+    return (a[0][0] <= b[1][0] and a[1][0] >= b[0][0] and
+            a[0][1] <= b[1][1] and a[1][1] >= b[0][1] and
+            a[0][2] <= b[1][2] and a[1][2] >= b[0][2])
+
+class broadPhaseCollider(object):
+    def __init__ (self, world, cellSize = 1.0, margin = 0.0, maxCells = 256, collider = None):
+        ## cellSize: size of the grid cells (m)
+        ## margin: the bounding boxes of the links are grown by this distance
+        ## maxCells: elements covering more cells (e.g. the floor) are kept in a list that is always tested
+        self.world = world
+        self.cellSize = cellSize
+        self.margin = margin
+        self.maxCells = maxCells
+        self.collider = collider if collider is not None else collide.WorldCollider(world)
+        self.numCandidates = 0 ## Link-element pairs whose bounding boxes overlap (narrow phase tests)
+        self.numRejected = 0   ## Link-element pairs rejected by the grid or the bounding boxes
+        self.build()
+
+    def build(self):
+        ## Index the elements of all the terrains and rigid objects
+        ## Each element is (owner, owner kind, owner index, geometry, bounding box)
+        self.elements = []
+        self.grid = {}
+        self.large = []
+        self._count = {}
+        self._links = {}
+        for i in range(self.world.numTerrains()):
+            terrain = self.world.terrain(i)
+            self._addGeometry(terrain, "terrain", i, terrain.geometry(), None)
+        for i in range(self.world.numRigidObjects()):
+            obj = self.world.rigidObject(i)
+            self._addGeometry(obj, "object", i, obj.geometry(), obj.getTransform())
+
+    def _addGeometry(self, owner, kind, index, geom, T):
+        if geom.empty():
+            return
+        if geom.type() == "Group":
+            for e in range(geom.numElements()):
+                elem = geom.getElement(e)
+                if T is not None:
+                    elem.setCurrentTransform(T[0], T[1])
+                self._addGeometry(owner, kind, index, elem, None)
+            return
+        bb = geom.getBB()
+        k = len(self.elements)
+        self.elements.append((owner, kind, index, geom, bb))
+        for key in [(None, None), (kind, None), (kind, index)]:
+            self._count[key] = self._count.get(key, 0) + 1
+        imin,jmin = self._cell(bb[0])
+        imax,jmax = self._cell(bb[1])
+        if (imax - imin + 1) * (jmax - jmin + 1) > self.maxCells:
+            self.large.append(k)
+            return
+        for i in range(imin, imax + 1):
+            for j in range(jmin, jmax + 1):
+                self.grid.setdefault((i, j), []).append(k)
+
+    def _cell(self, pt):
+        return (int(math.floor(pt[0]/self.cellSize)), int(math.floor(pt[1]/self.cellSize)))
+
+    def query(self, bb):
+        ## Indices of the elements whose bounding box overlaps bb
+        imin,jmin = self._cell(bb[0])
+        imax,jmax = self._cell(bb[1])
+        found = set()
+        for i in range(imin, imax + 1):
+            for j in range(jmin, jmax + 1):
+                cell = self.grid.get((i, j))
+                if cell is not None:
+                    found.update(cell)
+        found.update(self.large)
+        return [k for k in sorted(found) if _overlaps(bb, self.elements[k][4])]
+
+    def _robotLinks(self, robot):
+        ## Links of the robot that have a geometry, cached per robot
+        key = robot.index
+        links = self._links.get(key)
+        if links is None:
+            links = []
+            for l in range(robot.numLinks()):
+                link = robot.link(l)
+                geom = link.geometry()
+                if not geom.empty():
+                    links.append((link, geom))
+            self._links[key] = links
+        return links
+
+    def candidatePairs(self, robot, kind = None, index = None):
+        ## Link-element pairs of the robot that pass the broad phase, as (link, link geometry, element index)
+        ## kind ("terrain" or "object") and index restrict the owners of the elements
+        ## The grid is queried once with the bounding box of the whole robot, then the
+        ## bounding boxes of the links are tested against the candidates
+        links = self._robotLinks(robot)
+        if not links:
+            return []
+        m = self.margin
+        bbs = []
+        for link,geom in links:
+            bb = geom.getBB()
+            bbs.append(([bb[0][0] - m, bb[0][1] - m, bb[0][2] - m], [bb[1][0] + m, bb[1][1] + m, bb[1][2] + m]))
+        robotBB = ([min(bb[0][0] for bb in bbs), min(bb[0][1] for bb in bbs), min(bb[0][2] for bb in bbs)],
+                   [max(bb[1][0] for bb in bbs), max(bb[1][1] for bb in bbs), max(bb[1][2] for bb in bbs)])
+        pairs = []
+        for k in self.query(robotBB):
+            e = self.elements[k]
+            if (kind is not None and e[1] != kind) or (index is not None and e[2] != index):
+                continue
+            for l,bb in enumerate(bbs):
+                if _overlaps(bb, e[4]):
+                    pairs.append((links[l][0], links[l][1], k))
+        self.numCandidates += len(pairs)
+        self.numRejected += len(links) * self._count.get((kind, index), 0) - len(pairs)
+        return pairs
+
+    def _collisions(self, robot, kind, index):
+        ## Narrow phase on the candidate pairs, each (link, owner) pair is reported once
+        reported = set()
+        for link,geom,k in self.candidatePairs(robot, kind, index):
+            owner = self.elements[k][0]
+            key = (link.getIndex(), self.elements[k][1], self.elements[k][2])
+            if key in reported:
+                continue
+            if self.elements[k][3].collides(geom):
+                reported.add(key)
+                yield (link, owner)
+
+    def _resolve(self, robot, item):
+        if not isinstance(robot, int):
+            robot = robot.index
+        robot = self.world.robot(robot)
+        if item is not None and not isinstance(item, int):
+            item = item.index
+        return robot, item
+
+    ## Same interface as collide.WorldCollider
+    def robotTerrainCollisions(self, robot, terrain = None):
+        robot,terrain = self._resolve(robot, terrain)
+        return self._collisions(robot, "terrain", terrain)
+
+    def robotObjectCollisions(self, robot, object = None):
+        robot,object = self._resolve(robot, object)
+        return self._collisions(robot, "object", object)
+
+    def robotSelfCollisions(self, robot = None):
+        return self.collider.robotSelfCollisions(robot)
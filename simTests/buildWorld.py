@@ -8,87 +8,195 @@
 ##  2. getWall_terrain: Attach a single wall to terrain
 ##  3. getDoubleRoomDoor: Build two rooms with a door on the separating wall
 ##  4. getDoubleRoomWindow: Build two rooms with a window on the separating wall
+##  5. getWalls: Get the geometry of many walls, either as a group or merged into a single mesh
+## A wall is described by the arguments of getWall: (dimX, dimY, dimZ, pos, rotZ)
+## The walls added to a world are also kept as oriented 2D segments (getWorldSegments), for the range sensors of rangeSensor.py
+## cube.off is parsed only once, the walls are built analytically from the cached template
+## Only the geometry classes of klampt are needed, klampt.vis is not imported (headless use)
 import sys
-from klampt import *
-from klampt import vis
-from klampt.robotsim import setRandomSeed
-from klampt.vis.glcommon import GLWidgetPlugin
-from klampt import RobotPoser
-from klampt.model import ik,coordinates
-from klampt.math import so3
-import time
+import os
 import math
+import weakref
+from klampt import Geometry3D, TriangleMesh
+
+## Unit cube used as the template of the walls, parsed once
+cubeFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cube.off")
+_cubeTemplate = None
+
+## Segments of the walls added to each world: world -> list of (x0, y0, x1, y1, zmin, zmax)
+_worldSegments = weakref.WeakKeyDictionary()
+
+def _readOFF(fn):
+    ## Minimal parser for the OFF files of the repository (triangles only)
+    with open(fn) as f:
+        tokens = f.read().split()
+    if tokens[0] != "OFF":
+        raise IOError("Not an OFF file: "+fn)
+    nV = int(tokens[1])
+    nF = int(tokens[2])
+    vertices = [[float(tokens[4+3*i+k]) for k in range(3)] for i in range(nV)]
+    triangles = []
+    idx = 4 + 3*nV
+    for i in range(nF):
+        n = int(tokens[idx])
+        if n != 3:
+            raise IOError("Only triangular faces are supported: "+fn)
+        triangles.append([int(tokens[idx+1]), int(tokens[idx+2]), int(tokens[idx+3])])
+        idx = idx + n + 1
+    return vertices, triangles
+
+def getCubeTemplate():
+    ## Parse cube.off once and return the cached (vertices, triangles)
+    global _cubeTemplate
+    if _cubeTemplate is None:
+        _cubeTemplate = _readOFF(cubeFile)
+    return _cubeTemplate
+
+def getWallVertices(dimX, dimY, dimZ, pos = [0, 0, 0], rotZ = 0):
+    ## Vertices of the wall: the unit cube scaled by (dimX, dimY, dimZ), rotated by rotZ (degrees) about z and translated to pos
+    ## Same result as loading cube.off and calling scale and transform on the geometry
+    c = math.cos(math.radians(rotZ))
+    s = math.sin(math.radians(rotZ))
+    vertices = []
+    for v in getCubeTemplate()[0]:
+        x = v[0] * dimX
+        y = v[1] * dimY
+        vertices.append([c*x - s*y + pos[0], s*x + c*y + pos[1], v[2] * dimZ + pos[2]])
+    return vertices
+
+def _setMesh(mesh, vertices, triangles):
+    ## Klampt >= 0.9 stores the meshes in numpy arrays, older versions in std::vector
+    if hasattr(mesh, "setVertices"):
+        import numpy as np
+        mesh.setVertices(np.array(vertices, dtype=float).reshape(-1, 3))
+        mesh.setIndices(np.array(triangles, dtype=np.int32).reshape(-1, 3))
+    else:
+        for v in vertices:
+            for x in v:
+                mesh.vertices.append(x)
+        for t in triangles:
+            for i in t:
+                mesh.indices.append(i)
 
 def getWall(dimX, dimY, dimZ, pos = [0, 0, 0], rotZ = 0):
-        ## Get the wall geometry
-	wall = Geometry3D()
-	wall.loadFile("cube.off") # The wall is based upon cube primitive of unit dimension
-        ## Not sure why the scaling is done through the rotation matrix, works though!
-	#wall.transform([dimX, 0, 0, 0, dimY, 0, 0, 0, dimZ], pos)
-        wall.scale(dimX, dimY, dimZ)
-        rotMat = so3.rotation((0, 0, 1), math.radians(rotZ))
-        wall.transform(rotMat, pos)
-        return wall
+    ## Get the wall geometry
+    ## The wall is based upon cube primitive of unit dimension. The box is built analytically
+    ## from the cached template instead of loading cube.off and transforming it
+    mesh = TriangleMesh()
+    _setMesh(mesh, getWallVertices(dimX, dimY, dimZ, pos, rotZ), getCubeTemplate()[1])
+    wall = Geometry3D()
+    wall.setTriangleMesh(mesh)
+    return wall
+
+def getWallsMesh(walls):
+    ## Merge the walls into a single triangle mesh
+    ## walls is a list of (dimX, dimY, dimZ, pos, rotZ)
+    cubeTriangles = getCubeTemplate()[1]
+    vertices = []
+    triangles = []
+    for w in walls:
+        offset = len(vertices)
+        vertices.extend(getWallVertices(*w))
+        for t in cubeTriangles:
+            triangles.append([t[0] + offset, t[1] + offset, t[2] + offset])
+    mesh = TriangleMesh()
+    _setMesh(mesh, vertices, triangles)
+    return mesh
+
+def getWalls(walls, merge = False):
+    ## Get the geometry of many walls
+    ## If merge is True, a single triangle mesh (one collision structure) is returned,
+    ## otherwise a group with one element per wall
+    geom = Geometry3D()
+    if merge:
+        geom.setTriangleMesh(getWallsMesh(walls))
+        return geom
+    geom.setGroup()
+    for i,w in enumerate(walls):
+        geom.setElement(i, getWall(*w))
+    return geom
+
+def wallSegments(dimX, dimY, dimZ, pos = [0, 0, 0], rotZ = 0):
+    ## Footprint of the wall on the (x, y) plane: the four sides of the rotated rectangle, as (x0, y0, x1, y1, zmin, zmax)
+    c = math.cos(math.radians(rotZ))
+    s = math.sin(math.radians(rotZ))
+    corners = [(c*x - s*y + pos[0], s*x + c*y + pos[1]) for x,y in [(0, 0), (dimX, 0), (dimX, dimY), (0, dimY)]]
+    return [corners[k] + corners[(k + 1) % 4] + (pos[2], pos[2] + dimZ) for k in range(4)]
+
+def recordWalls(world, walls):
+    ## Keep the segments of walls added to the world
+    segments = _worldSegments.setdefault(world, [])
+    for w in walls:
+        segments.extend(wallSegments(*w))
+
+def getWorldSegments(world):
+    ## Segments of all the walls added to the world by this module and by worldGen.buildLayout
+    return list(_worldSegments.get(world, []))
 
 def getWall_terrain(world, dimX, dimY, dimZ, pos = [0, 0, 0], nameWall="wall", color = [0.85, 0.85, 0.85, 1]):
-        ## Attach a single wall to the world
-        wall = getWall(dimX, dimY, dimZ, pos)
-	world_wall = world.makeTerrain(nameWall)
-	world_wall.geometry().set(wall)
-        r = color[0]
-        g = color[1]
-        b = color[2]
-        alpha = color[3]
-	world_wall.appearance().setColor(r, g, b, alpha)
-	return world_wall
-
-def getDoubleRoomDoor(world, dimX, dimY, dimZ, color = [0.85, 0.85, 0.85, 1], wall_thickness = 0.01):
-    ## Build a double room with a single door in the middle of the wall
+    ## Attach a single wall to the world
+    wall = getWall(dimX, dimY, dimZ, pos)
+    world_wall = world.makeTerrain(nameWall)
+    world_wall.geometry().set(wall)
+    recordWalls(world, [(dimX, dimY, dimZ, pos, 0)])
+    r = color[0]
+    g = color[1]
+    b = color[2]
+    alpha = color[3]
+    world_wall.appearance().setColor(r, g, b, alpha)
+    return world_wall
+
+def doubleRoomDoorWalls(dimX, dimY, dimZ, wall_thickness = 0.01):
+    ## Walls of a double room with a single door in the middle of the wall
     ## The width of the door is dimX/4
     x2 = dimX/2.0
     x8 = dimX/8.0
     y2 = dimY/2.0
-    w1 = getWall(dimX, wall_thickness, dimZ, [-x2, -y2, 0], 0)
-    w2 = getWall(wall_thickness, dimY, dimZ, [-x2, -y2, 0], 0)
-    w3 = getWall(dimX, wall_thickness, dimZ, [-x2, y2, 0], 0)
-    w4 = getWall(wall_thickness, dimY, dimZ, [x2, -y2, 0], 0)
-    w5 = getWall(3*x8, wall_thickness, dimZ, [-x2, 0, 0], 0)
-    w6 = getWall(3*x8, wall_thickness, dimZ, [x8, 0, 0], 0)
-    DRDgeom = Geometry3D()
-    DRDgeom.setGroup()
-    for i,elem in enumerate([w1, w2, w3, w4, w5, w6]):
-	g = Geometry3D(elem)
-	DRDgeom.setElement(i,g)
+    return [(dimX, wall_thickness, dimZ, [-x2, -y2, 0], 0),
+            (wall_thickness, dimY, dimZ, [-x2, -y2, 0], 0),
+            (dimX, wall_thickness, dimZ, [-x2, y2, 0], 0),
+            (wall_thickness, dimY, dimZ, [x2, -y2, 0], 0),
+            (3*x8, wall_thickness, dimZ, [-x2, 0, 0], 0),
+            (3*x8, wall_thickness, dimZ, [x8, 0, 0], 0)]
+
+def doubleRoomWindowWalls(dimX, dimY, dimZ, wall_thickness = 0.01):
+    ## Walls of a double room with a single window in the middle of the wall
+    ## The dimensions of the window are dimX/4, dimZ/3
+    x2 = dimX/2.0
+    x8 = dimX/8.0
+    y2 = dimY/2.0
+    z3 = dimZ/3.0
+    return [(dimX, wall_thickness, dimZ, [-x2, -y2, 0], 0),
+            (wall_thickness, dimY, dimZ, [-x2, -y2, 0], 0),
+            (dimX, wall_thickness, dimZ, [-x2, y2, 0], 0),
+            (wall_thickness, dimY, dimZ, [x2, -y2, 0], 0),
+            (dimX, wall_thickness, z3, [-x2, 0, 0], 0),
+            (3*x8, wall_thickness, z3, [-x2, 0, z3], 0),
+            (3*x8, wall_thickness, z3, [x8, 0, z3], 0),
+            (dimX, wall_thickness, z3, [-x2, 0, 2.0*z3], 0)]
+
+def getDoubleRoomDoor(world, dimX, dimY, dimZ, color = [0.85, 0.85, 0.85, 1], wall_thickness = 0.01, merge = False):
+    ## Build a double room with a single door in the middle of the wall
+    ## The width of the door is dimX/4
+    walls = doubleRoomDoorWalls(dimX, dimY, dimZ, wall_thickness)
+    DRDgeom = getWalls(walls, merge)
     drd_setup = world.makeRigidObject("DRD")
     drd_setup.geometry().set(DRDgeom)
+    recordWalls(world, walls)
     r = color[0]
     g = color[1]
     b = color[2]
     alpha = color[3]
     drd_setup.appearance().setColor(r, g, b, alpha)
 
-def getDoubleRoomWindow(world, dimX, dimY, dimZ, color = [0.85, 0.85, 0.85, 1], wall_thickness = 0.01):
+def getDoubleRoomWindow(world, dimX, dimY, dimZ, color = [0.85, 0.85, 0.85, 1], wall_thickness = 0.01, merge = False):
     ## Build a double room with a single window in the middle of the wall
-    ## The dimensions of the window are dimX/4, dimZ/3  
-    x2 = dimX/2.0
-    x8 = dimX/8.0
-    y2 = dimY/2.0
-    z3 = dimZ/3.0
-    w1 = getWall(dimX, wall_thickness, dimZ, [-x2, -y2, 0], 0)
-    w2 = getWall(wall_thickness, dimY, dimZ, [-x2, -y2, 0], 0)
-    w3 = getWall(dimX, wall_thickness, dimZ, [-x2, y2, 0], 0)
-    w4 = getWall(wall_thickness, dimY, dimZ, [x2, -y2, 0], 0)
-    w5 = getWall(dimX, wall_thickness, z3, [-x2, 0, 0], 0)
-    w6 = getWall(3*x8, wall_thickness, z3, [-x2, 0, z3], 0)
-    w7 = getWall(3*x8, wall_thickness, z3, [x8, 0, z3], 0)
-    w8 = getWall(dimX, wall_thickness, z3, [-x2, 0, 2.0*z3], 0)
-    DRDgeom = Geometry3D()
-    DRDgeom.setGroup()
-    for i,elem in enumerate([w1, w2, w3, w4, w5, w6, w7, w8]):
-	g = Geometry3D(elem)
-	DRDgeom.setElement(i,g)
+    ## The dimensions of the window are dimX/4, dimZ/3
+    walls = doubleRoomWindowWalls(dimX, dimY, dimZ, wall_thickness)
+    DRDgeom = getWalls(walls, merge)
     drd_setup = world.makeRigidObject("DRD")
     drd_setup.geometry().set(DRDgeom)
+    recordWalls(world, walls)
     r = color[0]
     g = color[1]
     b = color[2]
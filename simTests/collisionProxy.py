@@ -0,0 +1,452 @@
+#!/usr/bin/python
+
+## Simplified collision proxies of the links of the robots in mobile_robots (requires NumPy)
+## The render meshes of the links (poles, plates, Kinect mounts of turtlebot, legs, wheels and head of r2d2) are
+## replaced by cheaper geometries that contain them:
+##   hull: convex hull of each link mesh (TriangleMesh)
+##   spheres: at most maxSpheres spheres per link, covering all the triangles of the link (Group of spheres)
+##   footprint: for planar bases (kobuki, turtlebot, r2d2), one prism over the 2D convex hull of all the links
+##     projected on the ground, from the lowest to the highest point, on the link welded to the floating base.
+##     The other links are emptied. The footprint is computed at the current config of the robot.
+## margin grows every proxy by that distance (conservativeness): the radius of the spheres, the polygon and the
+## height of the footprint, the convex hull is the hull of the link mesh plus an icosahedron of inradius margin.
+## With margin >= 0 a proxy never misses a collision of the render mesh; it may report collisions that are
+## up to about margin + (proxy size - mesh size) away.
+## The proxies are computed once per robot model and shared by all the robots of that model.
+## Apply them before creating the collision checkers (WorldCollider, broadPhaseCollider, selfCollider).
+##
+## Execution (speed and accuracy of the proxies against the render meshes, poses sampled near the walls of the double room):
+##   python collisionProxy.py [--robots kobuki turtlebot r2d2 sphero] [--poses 2000] [--margin 0 0.02]
+
+import os
+import math
+import numpy as np
+from klampt import Geometry3D, GeometricPrimitive, TriangleMesh
+from klampt.math import se3
+try:
+    from . import buildWorld as bW
+    from .selfCollision import _modelKey
+except (ImportError, ValueError):
+    import buildWorld as bW
+    from selfCollision import _modelKey
+
+kinds = ["hull", "spheres", "footprint"]
+
+## Links 0-5 of the robots in mobile_robots are the floating base (x, y, z, rz, ry, rx)
+baseLink = 5
+
+## Proxies per robot model: (model key, kind, margin, maxSpheres) -> list of (link, proxy)
+_proxies = {}
+
+def _meshArrays(geom):
+    mesh = geom.getTriangleMesh()
+    return np.array(mesh.vertices, dtype=float).reshape(-1, 3), np.array(mesh.indices, dtype=np.int32).reshape(-1, 3)
+
+def convexHull(points):
+    ## Triangles (indices into points, counterclockwise seen from outside) of the 3D convex hull of points
+    ## Incremental construction; the points inside the current hull are skipped with one vectorized test
+    P = np.asarray(points, dtype=float)
+    scale = max(np.abs(P).max(), 1e-12)
+    eps = 1e-10 * scale
+    ## Initial tetrahedron from extreme points
+    i0 = int(np.argmin(P[:, 0]))
+    i1 = int(np.argmax(((P - P[i0])**2).sum(axis=1)))
+    d = P[i1] - P[i0]
+    i2 = int(np.argmax((np.cross(P - P[i0], d)**2).sum(axis=1)))
+    n = np.cross(P[i1] - P[i0], P[i2] - P[i0])
+    dist = (P - P[i0]).dot(n)
+    i3 = int(np.argmax(np.abs(dist)))
+    if abs(dist[i3]) <= eps * max(np.linalg.norm(n), 1e-12):
+        raise ValueError("Degenerate (planar) point set")
+    faces = [(i0, i1, i2), (i0, i2, i3), (i0, i3, i1), (i1, i3, i2)] if dist[i3] < 0 else \
+            [(i0, i2, i1), (i0, i3, i2), (i0, i1, i3), (i1, i2, i3)]
+    faces = np.array(faces)
+    def planes(F):
+        N = np.cross(P[F[:, 1]] - P[F[:, 0]], P[F[:, 2]] - P[F[:, 0]])
+        return N, (N * P[F[:, 0]]).sum(axis=1)
+    N,off = planes(faces)
+    ## Farthest points first, so that most of the others are inside early
+    center = P[[i0, i1, i2, i3]].mean(axis=0)
+    order = np.argsort(-((P - center)**2).sum(axis=1))
+    for p in order:
+        if p in (i0, i1, i2, i3):
+            continue
+        visible = N.dot(P[p]) - off > eps * np.sqrt((N**2).sum(axis=1))
+        if not visible.any():
+            continue
+        ## Horizon: directed edges of the visible faces whose reverse edge is not in a visible face
+        edges = set()
+        for a,b,c in faces[visible]:
+            edges.update([(a, b), (b, c), (c, a)])
+        horizon = [(a, b) for a,b in edges if (b, a) not in edges]
+        new = np.array([(a, b, p) for a,b in horizon])
+        faces = np.vstack([faces[~visible], new])
+        Nn,offn = planes(new)
+        N = np.vstack([N[~visible], Nn])
+        off = np.concatenate([off[~visible], offn])
+    return faces
+
+def _compact(points, triangles):
+    ## Only keep the vertices used by the triangles
+    used,inverse = np.unique(triangles.ravel(), return_inverse=True)
+    return points[used], inverse.reshape(-1, 3).astype(np.int32)
+
+def _icosahedron(inradius):
+    ## Vertices of an icosahedron whose inscribed sphere has the given radius
+    phi = 0.5 * (1 + math.sqrt(5))
+    V = []
+    for a in (-1, 1):
+        for b in (-phi, phi):
+            V += [(0, a, b), (a, b, 0), (b, 0, a)]
+    V = np.array(V, dtype=float)
+    V /= np.linalg.norm(V[0])
+    ## inradius / circumradius of the icosahedron
+    return V * inradius / 0.7946544722917661
+
+def hullProxy(vertices, triangles, margin = 0.0):
+    ## (vertices, triangles) of the convex hull of a link mesh, grown by margin
+    P = np.unique(np.round(vertices, 12), axis=0)
+    try:
+        P,T = _compact(P, convexHull(P))
+        if margin > 0:
+            P = (P[:, None, :] + _icosahedron(margin)[None, :, :]).reshape(-1, 3)
+            P,T = _compact(P, convexHull(P))
+    except ValueError:
+        ## Flat mesh: keep it (grown by margin as a box)
+        if margin > 0:
+            return boxProxy(vertices, margin)
+        return vertices, triangles
+    return P, T
+
+def boxProxy(vertices, margin = 0.0):
+    ## Axis-aligned box around the vertices, grown by margin
+    bmin = vertices.min(axis=0) - margin
+    bmax = vertices.max(axis=0) + margin
+    V = np.array([[bmin[0] if i & 1 == 0 else bmax[0], bmin[1] if i & 2 == 0 else bmax[1], bmin[2] if i & 4 == 0 else bmax[2]] for i in range(8)])
+    return V, convexHull(V)
+
+def _subdivide(tri, maxEdge):
+    ## Split the triangles (N x 3 x 3) at the middle of their longest edge until all the edges are at most maxEdge
+    done = []
+    while len(tri):
+        lengths = np.stack([np.linalg.norm(tri[:, (k + 1) % 3] - tri[:, k], axis=1) for k in range(3)], axis=1)
+        longest = lengths.argmax(axis=1)
+        small = lengths.max(axis=1) <= maxEdge
+        done.append(tri[small])
+        tri,longest = tri[~small], longest[~small]
+        ## Vertices a, b of the longest edge and c the opposite one
+        idx = np.arange(len(tri))
+        a = tri[idx, longest]
+        b = tri[idx, (longest + 1) % 3]
+        c = tri[idx, (longest + 2) % 3]
+        m = 0.5 * (a + b)
+        tri = np.concatenate([np.stack([a, m, c], axis=1), np.stack([m, b, c], axis=1)])
+    return np.concatenate(done)
+
+def sphereProxy(vertices, triangles, maxSpheres = 8, margin = 0.0):
+    ## List of spheres (center, radius) covering all the triangles of a link mesh
+    ## The triangles are first split into pieces smaller than the link, so that a sphere does not have to cover
+    ## e.g. the whole cap of a wheel. The pieces are split at the median of their centroids along the longest axis,
+    ## the group with the largest sphere first, until there are maxSpheres groups.
+    ## Each sphere contains the vertices of its pieces, hence the pieces.
+    size = np.linalg.norm(vertices.max(axis=0) - vertices.min(axis=0))
+    tri = _subdivide(vertices[triangles], size / (2.0 * maxSpheres))
+    centroids = tri.mean(axis=1)
+    def sphere(group):
+        pts = tri[group].reshape(-1, 3)
+        c = 0.5 * (pts.min(axis=0) + pts.max(axis=0))
+        return c, float(np.sqrt(((pts - c)**2).sum(axis=1).max()))
+    groups = [np.arange(len(tri))]
+    spheres = [sphere(groups[0])]
+    while len(groups) < maxSpheres:
+        k = max(range(len(groups)), key=lambda g: spheres[g][1] if len(groups[g]) > 1 else -1.0)
+        g = groups[k]
+        if len(g) <= 1:
+            break
+        ext = centroids[g].max(axis=0) - centroids[g].min(axis=0)
+        axis = int(np.argmax(ext))
+        order = g[np.argsort(centroids[g, axis])]
+        a,b = order[:len(order)//2], order[len(order)//2:]
+        groups[k:k+1] = [a, b]
+        spheres[k:k+1] = [sphere(a), sphere(b)]
+    return [(c, r + margin) for c,r in spheres]
+
+def convexPolygon(points):
+    ## Counterclockwise convex hull of 2D points (monotone chain)
+    pts = sorted(set(map(tuple, np.round(points, 12))))
+    if len(pts) < 3:
+        return np.array(pts)
+    def cross(o, a, b):
+        return (a[0] - o[0])*(b[1] - o[1]) - (a[1] - o[1])*(b[0] - o[0])
+    lower = []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in reversed(pts):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return np.array(lower[:-1] + upper[:-1])
+
+def offsetPolygon(polygon, margin):
+    ## Counterclockwise convex polygon grown by margin (each edge moved out by margin, mitered corners)
+    if margin <= 0:
+        return polygon
+    n = len(polygon)
+    edges = np.roll(polygon, -1, axis=0) - polygon
+    normals = np.stack([edges[:, 1], -edges[:, 0]], axis=1)
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+    out = []
+    for i in range(n):
+        n0,n1 = normals[i-1], normals[i]
+        ## Corner between the previous edge and edge i
+        bis = n0 + n1
+        out.append(polygon[i] + margin * bis / max(bis.dot(n1), 1e-9))
+    return np.array(out)
+
+def prism(polygon, zmin, zmax):
+    ## (vertices, triangles) of the prism over a counterclockwise convex polygon
+    n = len(polygon)
+    V = np.vstack([np.column_stack([polygon, np.full(n, zmin)]), np.column_stack([polygon, np.full(n, zmax)])])
+    T = []
+    for i in range(1, n - 1):
+        T.append((0, i + 1, i))
+        T.append((n, n + i, n + i + 1))
+    for i in range(n):
+        j = (i + 1) % n
+        T.append((i, j, n + j))
+        T.append((i, n + j, n + i))
+    return V, np.array(T, dtype=np.int32)
+
+def _weldedBase(robot):
+    ## First link with a geometry attached to the floating base by fixed joints only, None if there is none
+    qmin,qmax = robot.getJointLimits()
+    for i in range(baseLink + 1, robot.numLinks()):
+        if robot.link(i).geometry().empty():
+            continue
+        j = i
+        while j > baseLink and qmin[j] == qmax[j]:
+            j = robot.link(j).getParent()
+        if j == baseLink:
+            return i
+    return None
+
+def _robotPoints(robot, frame):
+    ## Vertices of all the link meshes of the robot, in the frame of link frame
+    Tinv = se3.inv(robot.link(frame).getTransform())
+    pts = []
+    for i in range(robot.numLinks()):
+        g = robot.link(i).geometry()
+        if g.empty() or g.type() != "TriangleMesh":
+            continue
+        T = se3.mul(Tinv, robot.link(i).getTransform())
+        V,_ = _meshArrays(g)
+        pts.append(V.dot(np.array(T[0]).reshape(3, 3)) + np.array(T[1]))
+    return np.vstack(pts)
+
+def footprintProxy(robot, margin = 0.0):
+    ## (link, vertices, triangles) of the footprint prism, in the frame of the link welded to the floating base
+    base = _weldedBase(robot)
+    if base is None:
+        raise ValueError("No link welded to the floating base of "+robot.getName())
+    pts = _robotPoints(robot, base)
+    polygon = offsetPolygon(convexPolygon(pts[:, :2]), margin)
+    V,T = prism(polygon, pts[:, 2].min() - margin, pts[:, 2].max() + margin)
+    return base, V, T
+
+def footprintPolygon(robot, margin = 0.0):
+    ## Counterclockwise 2D convex polygon of the robot projected on the ground, in the frame of the floating base
+    ## (x forward at yaw 0), grown by margin
+    return offsetPolygon(convexPolygon(_robotPoints(robot, baseLink)[:, :2]), margin)
+
+def footprintDiscs(polygon, spacing = 0.05):
+    ## Centres (N x 2) and radius of discs covering the polygon: the cells of a grid of the given spacing that
+    ## may touch the polygon, each covered by the disc through its corners
+    lo = polygon.min(axis=0)
+    hi = polygon.max(axis=0)
+    xs = np.arange(lo[0] + 0.5*spacing, hi[0] + spacing, spacing)
+    ys = np.arange(lo[1] + 0.5*spacing, hi[1] + spacing, spacing)
+    C = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+    radius = 0.5*math.sqrt(2.0)*spacing
+    ## Signed distance of the centres to the edges (positive outside), kept if the cell may touch the polygon
+    edges = np.roll(polygon, -1, axis=0) - polygon
+    normals = np.stack([edges[:, 1], -edges[:, 0]], axis=1)
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+    outside = ((C[:, None, :] - polygon[None, :, :]) * normals[None, :, :]).sum(axis=2).max(axis=1)
+    return C[outside <= radius], radius
+
+def footprintClear(grid, discs, poses):
+    ## True for the poses (K x 3: x, y, yaw) where the footprint discs are certainly free in the occupancyGrid grid
+    ## One vectorized query for all the poses
+    centres,radius = discs
+    poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+    c = np.cos(poses[:, 2])[:, None]
+    s = np.sin(poses[:, 2])[:, None]
+    xs = poses[:, 0][:, None] + c*centres[None, :, 0] - s*centres[None, :, 1]
+    ys = poses[:, 1][:, None] + s*centres[None, :, 0] + c*centres[None, :, 1]
+    return grid.isClear(xs, ys, radius).all(axis=1)
+
+def computeProxies(robot, kind = "hull", margin = 0.0, maxSpheres = 8):
+    ## List of (link, proxy) of a robot: proxy is (vertices, triangles), a list of spheres, or None (empty link)
+    key = (_modelKey(robot), kind, margin, maxSpheres)
+    if key in _proxies:
+        return _proxies[key]
+    proxies = []
+    if kind == "footprint":
+        base,V,T = footprintProxy(robot, margin)
+        for i in range(robot.numLinks()):
+            if not robot.link(i).geometry().empty():
+                proxies.append((i, (V, T) if i == base else None))
+    else:
+        for i in range(robot.numLinks()):
+            g = robot.link(i).geometry()
+            if g.empty() or g.type() != "TriangleMesh":
+                continue
+            V,T = _meshArrays(g)
+            if kind == "hull":
+                proxies.append((i, hullProxy(V, T, margin)))
+            elif kind == "spheres":
+                proxies.append((i, sphereProxy(V, T, maxSpheres, margin)))
+            else:
+                raise ValueError("Unknown proxy "+kind)
+    _proxies[key] = proxies
+    return proxies
+
+def proxyGeometry(proxy):
+    ## Geometry3D of a proxy
+    geom = Geometry3D()
+    if proxy is None:
+        geom.setGroup()
+    elif isinstance(proxy, list):
+        geom.setGroup()
+        for k,(c,r) in enumerate(proxy):
+            s = GeometricPrimitive()
+            s.setSphere([float(x) for x in c], r)
+            geom.setElement(k, Geometry3D(s))
+    else:
+        mesh = TriangleMesh()
+        bW._setMesh(mesh, proxy[0], proxy[1])
+        geom.setTriangleMesh(mesh)
+    return geom
+
+def applyProxies(robot, kind = "hull", margin = 0.0, maxSpheres = 8):
+    ## Replace the link geometries of the robot by their proxies, returns the number of primitives
+    ## (triangles or spheres) of the proxies
+    proxies = computeProxies(robot, kind, margin, maxSpheres)
+    count = 0
+    for i,proxy in proxies:
+        robot.link(i).geometry().set(proxyGeometry(proxy))
+        count += 0 if proxy is None else len(proxy) if isinstance(proxy, list) else len(proxy[1])
+    if kind == "footprint":
+        ## One rigid body, nothing left to self collide
+        n = robot.numLinks()
+        for i in range(n):
+            for j in range(i+1, n):
+                robot.enableSelfCollision(i, j, False)
+    ## Places the new geometries at the link transforms
+    robot.setConfig(robot.getConfig())
+    return count
+
+def primitives(robot):
+    ## Number of triangles (or primitives) of the link geometries of the robot
+    count = 0
+    for i in range(robot.numLinks()):
+        g = robot.link(i).geometry()
+        if g.empty():
+            continue
+        if g.type() == "TriangleMesh":
+            count += len(_meshArrays(g)[1])
+        else:
+            count += max(g.numElements(), 1) if g.type() == "Group" else 1
+    return count
+
+robotFiles = {"kobuki": "kobuki/kobuki.rob", "turtlebot": "turtlebot/turtlebot.rob", "r2d2": "r2d2/r2d2.rob", "sphero": "sphero/sphero.rob"}
+
+def _benchWorld(robotFile):
+    from klampt import WorldModel
+    world = WorldModel()
+    robot = world.loadRobot(robotFile)
+    if robot.index < 0:
+        raise RuntimeError("Unable to load robot "+robotFile)
+    bW.getDoubleRoomDoor(world, 8, 8, 1)
+    return world, robot
+
+def wallPoses(num, band = 0.4, seed = 0):
+    ## Random poses (x, y, yaw) at most band from the walls of the double room
+    import random
+    rng = random.Random(seed)
+    walls = bW.doubleRoomDoorWalls(8, 8, 1)
+    poses = []
+    for k in range(num):
+        dimX,dimY,dimZ,pos,rotZ = rng.choice(walls)
+        x = pos[0] + rng.uniform(0, dimX) + (rng.uniform(-band, band) if dimX < dimY else 0)
+        y = pos[1] + rng.uniform(0, dimY) + (rng.uniform(-band, band) if dimY < dimX else 0)
+        poses.append((x, y, rng.uniform(-math.pi, math.pi)))
+    return poses
+
+def benchmark(robotFile, kind, poses, margin = 0.0, maxSpheres = 8, spacing = 0.05):
+    ## Collision with the walls of every pose (x, y, yaw), with the render meshes (kind None) or with a proxy
+    ## kind "footprint2d" checks the footprint discs in an occupancyGrid of the walls, all the poses at once
+    ## Returns (list of collision flags, seconds per pose, number of primitives)
+    import time
+    import klampt.model.collide as collide
+    world,robot = _benchWorld(robotFile)
+    if kind == "footprint2d":
+        try:
+            from .occupancyGrid import occupancyGrid
+        except (ImportError, ValueError):
+            from occupancyGrid import occupancyGrid
+        grid = occupancyGrid.fromWorld(world, resolution=0.02)
+        discs = footprintDiscs(footprintPolygon(robot, margin), spacing)
+        footprintClear(grid, discs, poses[:10])
+        t0 = time.time()
+        free = footprintClear(grid, discs, poses)
+        return [not f for f in free], (time.time() - t0)/len(poses), len(discs[0])
+    if kind is not None:
+        applyProxies(robot, kind, margin, maxSpheres)
+    collider = collide.WorldCollider(world)
+    q = robot.getConfig()
+    ## The first pass builds the collision data of the geometries, the second one is timed
+    for k in range(2):
+        flags = []
+        t0 = time.time()
+        for x,y,yaw in poses:
+            q[0],q[1],q[3] = x, y, yaw
+            robot.setConfig(q)
+            flags.append(any(True for _ in collider.robotObjectCollisions(robot)))
+        t = (time.time() - t0)/len(poses)
+    return flags, t, primitives(robot)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Speed and accuracy of the collision proxies against the render meshes")
+    parser.add_argument("--robots", nargs="+", default=sorted(robotFiles.keys()), choices=sorted(robotFiles.keys()))
+    parser.add_argument("--kinds", nargs="+", default=kinds + ["footprint2d"], choices=kinds + ["footprint2d"])
+    parser.add_argument("--poses", type=int, default=2000, help="random poses near the walls of the double room")
+    parser.add_argument("--band", type=float, default=0.4, help="maximum distance of the poses to the walls (m)")
+    parser.add_argument("--margin", type=float, nargs="+", default=[0.0, 0.02])
+    parser.add_argument("--spheres", type=int, default=8, help="maximum number of spheres per link")
+    parser.add_argument("--spacing", type=float, default=0.05, help="spacing of the footprint discs (m)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    poses = wallPoses(args.poses, args.band, args.seed)
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mobile_robots")
+    print('{0:>10} {1:>11} {2:>7} {3:>10} {4:>10} {5:>8} {6:>10} {7:>10}'.format("robot", "proxy", "margin", "primitives", "us/pose", "speedup", "false pos", "false neg"))
+    for name in args.robots:
+        fn = os.path.join(root, robotFiles[name])
+        ref,tRef,nRef = benchmark(fn, None, poses)
+        print('{0:>10} {1:>11} {2:>7} {3:>10} {4:>10.2f} {5:>8} {6:>10} {7:>10}'.format(name, "mesh", "", nRef, 1e6*tRef, "1.00", "", ""))
+        for kind in args.kinds:
+            for margin in args.margin:
+                try:
+                    flags,t,n = benchmark(fn, kind, poses, margin, args.spheres, args.spacing)
+                except ValueError as e:
+                    print('{0:>10} {1:>11} {2:>7} {3}'.format(name, kind, "", e))
+                    break
+                ## A false negative is a collision of the render meshes missed by the proxy
+                fp = sum(1 for a,b in zip(ref, flags) if b and not a)
+                fn_ = sum(1 for a,b in zip(ref, flags) if a and not b)
+                print('{0:>10} {1:>11} {2:>7.3f} {3:>10} {4:>10.2f} {5:>8.2f} {6:>9.1f}% {7:>10}'.format(name, kind, margin, n, 1e6*t, tRef/t, 100.0*fp/len(poses), fn_))
@@ -0,0 +1,455 @@
+#!/usr/bin/python3
+
+## Streaming control inputs for the headless simulation (asyncio, Python 3 only)
+## The control inputs of the robots are read from external streams instead of the sinusoidal profiles of headlessSim.py:
+##  1. Sources: a file, the standard input (pipe), or a local TCP / Unix socket server that any number of controllers
+##     connect to. Every line is a JSON message {"robot": i, "t": time, "u": [inputs]}; without "t" the input is
+##     stamped with the simulated time of its arrival.
+##     The messages go through a bounded queue: a source that is ahead of the simulation waits (a file is read as it
+##     is consumed, a socket stops being read and the controller is slowed down by TCP).
+##  2. Clock: the simulation steps on a fixed timestep, paced at rate x real time (0: as fast as possible).
+##     The input of every robot at time t is interpolated between the surrounding messages, or the last one is held
+##     (mode "hold", or when the next message is late). An input held because the next message has not arrived
+##     stops the robot (zero velocities) once it is older than timeout. With file sources the clock waits for the
+##     file to be read, so a run from a file is reproducible.
+##  3. Outputs: the states of the robots and the collision events are put in bounded queues without blocking the
+##     step, and written to a sink (file, standard output, TCP or Unix socket) by their own tasks. A full queue drops
+##     the new message ("drop") or the oldest one ("dropOldest"); the states are coalesced ("coalesce"): only the
+##     last state of every robot is kept until it is written.
+## The step (kinematics and collision queries) runs in the event loop between the reads and the writes, without
+## klampt.vis, so the external controllers and the simulated time set the pace.
+##
+## Execution:
+##   python3 controlStream.py profile inputs.jsonl --control vel --robots 1 --time 30
+##   python3 controlStream.py run simpleWorld.xml --robot turtlebot --input inputs.jsonl --output states.jsonl
+##   python3 controlStream.py run simpleWorld.xml --robot kobuki --input tcp:127.0.0.1:9000 --rate 1 --time 60
+##   python3 controlStream.py send inputs.jsonl tcp:127.0.0.1:9000
+
+import sys
+import json
+import math
+import asyncio
+import argparse
+import collections
+import klampt.model.collide as collide
+try:
+    from . import headlessSim
+except (ImportError, ValueError):
+    import headlessSim
+
+## Input kinds: how the inputs of a message are applied to the wrapper
+def _applyVel(robot, u, deltaT):
+    robot.velControlKin(u[0], u[1], deltaT)
+
+def _applyWheel(robot, u, deltaT):
+    robot.wheelControlKin(u[0], u[1], deltaT)
+
+def _applyConfig(robot, u, deltaT):
+    robot.setConfig(u)
+
+applyInput = {"vel": _applyVel, "wheel": _applyWheel, "config": _applyConfig}
+## Kinds that stop the robot with zero inputs when the input is stale
+velocityKinds = ("vel", "wheel")
+## Default input kind of every robot type
+defaultKinds = {"sphero": "config", "kobuki": "vel", "turtlebot": "vel", "r2d2": "vel"}
+
+def parseMessage(line):
+    ## (robot, t, u) of a line, t is None if the message is not stamped
+    msg = json.loads(line)
+    t = msg.get("t")
+    return int(msg.get("robot", 0)), (float(t) if t is not None else None), [float(x) for x in msg["u"]]
+
+class inputBuffer(object):
+    ## Timestamped inputs of one robot, oldest first
+    def __init__ (self):
+        self.samples = collections.deque()
+
+    def add(self, t, u):
+        ## Returns False if the message is older than the last one (dropped)
+        if self.samples and t < self.samples[-1][0]:
+            return False
+        self.samples.append((t, u))
+        return True
+
+    def value(self, t, mode = "interpolate"):
+        ## (input at t, time of the sample it comes from, held), (None, None, False) before the first sample
+        ## held is True when no later sample is buffered: the last input is held because the next one is late
+        samples = self.samples
+        while len(samples) > 1 and samples[1][0] <= t:
+            samples.popleft()
+        if not samples or samples[0][0] > t:
+            return None, None, False
+        t0,u0 = samples[0]
+        if len(samples) == 1:
+            return u0, t0, True
+        if mode == "interpolate":
+            t1,u1 = samples[1]
+            w = (t - t0)/(t1 - t0)
+            return [a + w*(b - a) for a,b in zip(u0, u1)], t0, False
+        return u0, t0, False
+
+class outputQueue(object):
+    ## Bounded queue of output messages, put() never blocks
+    ## policy: "drop" (the new message), "dropOldest", or "coalesce" (one pending message per key)
+    def __init__ (self, maxsize = 1024, policy = "drop"):
+        if policy not in ("drop", "dropOldest", "coalesce"):
+            raise ValueError("Unknown policy "+str(policy))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = collections.OrderedDict() if policy == "coalesce" else collections.deque()
+        self.numPut = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.written = 0
+        self._ready = None
+
+    def put(self, msg, key = None):
+        self.numPut += 1
+        if self.policy == "coalesce":
+            if key in self.items:
+                self.items[key] = msg
+                self.coalesced += 1
+                return
+            if len(self.items) >= self.maxsize:
+                self.dropped += 1
+                return
+            self.items[key] = msg
+        else:
+            if len(self.items) >= self.maxsize:
+                self.dropped += 1
+                if self.policy == "drop":
+                    return
+                self.items.popleft()
+            self.items.append(msg)
+        if self._ready is not None:
+            self._ready.set()
+
+    def take(self):
+        ## All the pending messages, oldest first
+        if self.policy == "coalesce":
+            msgs = list(self.items.values())
+        else:
+            msgs = list(self.items)
+        self.items.clear()
+        return msgs
+
+    async def get(self):
+        ## Wait for pending messages and take them
+        if self._ready is None:
+            self._ready = asyncio.Event()
+        while not self.items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.take()
+
+    def stats(self):
+        return {"put": self.numPut, "written": self.written, "dropped": self.dropped, "coalesced": self.coalesced}
+
+def _address(spec):
+    ## ("tcp", (host, port)), ("unix", path), ("pipe", None) for "-", or ("file", path)
+    if spec == "-":
+        return "pipe", None
+    if spec.startswith("tcp:"):
+        host,port = spec[4:].rsplit(":", 1)
+        return "tcp", (host or "127.0.0.1", int(port))
+    if spec.startswith("unix:"):
+        return "unix", spec[5:]
+    return "file", spec
+
+async def _readLines(reader, onLine):
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        if line.strip():
+            await onLine(line.decode("utf-8"))
+
+async def openSource(spec, onLine):
+    ## Starts reading the source, returns (close, isFile)
+    ## The pipe and the sockets are live sources; a file calls onLine(None) at its end
+    kind,address = _address(spec)
+    loop = asyncio.get_event_loop()
+    if kind in ("tcp", "unix"):
+        connections = []
+        def connected(reader, writer):
+            connections.append(writer)
+            return _readLines(reader, onLine)
+        if kind == "tcp":
+            server = await asyncio.start_server(connected, address[0], address[1])
+        else:
+            server = await asyncio.start_unix_server(connected, address)
+        def close():
+            ## The readers of the connections get the end of the stream
+            server.close()
+            for writer in connections:
+                writer.close()
+        return close, False
+    if kind == "pipe":
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        return loop.create_task(_readLines(reader, onLine)).cancel, False
+    async def readFile():
+        ## The queue of the messages is bounded, the file is read as the simulation consumes it
+        with open(address) as f:
+            for line in f:
+                if line.strip():
+                    await onLine(line)
+        await onLine(None)
+    return loop.create_task(readFile()).cancel, True
+
+async def openSink(spec):
+    ## write(lines) coroutine and close() of the sink
+    kind,address = _address(spec)
+    if kind in ("tcp", "unix"):
+        if kind == "tcp":
+            reader,writer = await asyncio.open_connection(address[0], address[1])
+        else:
+            reader,writer = await asyncio.open_unix_connection(address)
+        async def write(lines):
+            writer.write("".join(lines).encode("utf-8"))
+            await writer.drain()
+        return write, writer.close
+    f = sys.stdout if kind == "pipe" else open(address, "w")
+    async def write(lines):
+        f.writelines(lines)
+        f.flush()
+    return write, (lambda: None) if kind == "pipe" else f.close
+
+async def _drain(queue, write):
+    ## Writer task of an output queue
+    while True:
+        msgs = await queue.get()
+        await write([json.dumps(m) + "\n" for m in msgs])
+        queue.written += len(msgs)
+
+class controlPipeline(object):
+    def __init__ (self, world, robots, kinds, collisionChecker, deltaT = 0.01, mode = "interpolate", rate = 1.0,
+                  timeout = 0.5, horizon = 1.0, inputSize = 1024, stateEvery = 1, outputSize = 1024, eventPolicy = "drop"):
+        ## robots: wrappers of world.robot(0..N-1), kinds: input kind of every robot (see applyInput)
+        ## mode: "interpolate" or "hold"; rate: pace of the clock in x real time, 0 for as fast as possible
+        ## timeout: age (s) of an input held for lack of a later message, after which a velocity input is set to zero
+        ## (None: hold forever)
+        ## horizon: lookahead (s) of the inputs taken from the queue, the later messages wait in the queue
+        ## stateEvery: steps between two states of a robot in the output
+        self.world = world
+        self.robots = robots
+        self.kinds = kinds
+        self.collisionChecker = collisionChecker
+        self.deltaT = deltaT
+        self.mode = mode
+        self.rate = rate
+        self.timeout = timeout
+        self.horizon = horizon
+        self.inputSize = inputSize
+        self.stateEvery = stateEvery
+        self.buffers = [inputBuffer() for r in robots]
+        self.states = outputQueue(outputSize, "coalesce")
+        self.events = outputQueue(outputSize, eventPolicy)
+        self.t = 0.0
+        self.received = 0
+        self.late = 0
+        self.outOfOrder = 0
+        self.staleSteps = 0
+        self.behindSteps = 0
+        self._collisions = [None]*len(robots)
+        self._queue = None
+        self._pending = None
+        self._openFiles = 0
+
+    async def _onLine(self, line):
+        if line is None:
+            ## End of a file
+            await self._queue.put(None)
+            return
+        try:
+            msg = parseMessage(line)
+        except (ValueError, KeyError, TypeError) as e:
+            self.events.put({"type": "error", "t": self.t, "message": str(e)})
+            return
+        await self._queue.put(msg)
+
+    def _add(self, msg):
+        robot,t,u = msg
+        self.received += 1
+        if robot < 0 or robot >= len(self.buffers):
+            self.events.put({"type": "error", "t": self.t, "message": "unknown robot "+str(robot)})
+            return
+        if t is None:
+            t = self.t
+        elif t < self.t:
+            self.late += 1
+        if not self.buffers[robot].add(t, u):
+            self.outOfOrder += 1
+
+    async def _takeInputs(self, t):
+        ## Move the messages up to t + horizon from the queue to the buffers
+        ## While a file is open and the inputs of a robot do not reach t, wait for it (the file is not late, only unread)
+        while True:
+            if self._pending is not None:
+                if self._pending[1] is not None and self._pending[1] > t + self.horizon:
+                    return
+                self._add(self._pending)
+                self._pending = None
+            if self._queue.empty():
+                if self._openFiles and not self._covered(t):
+                    msg = await self._queue.get()
+                else:
+                    return
+            else:
+                msg = self._queue.get_nowait()
+            if msg is None:
+                self._openFiles -= 1
+            else:
+                self._pending = msg
+
+    def _covered(self, t):
+        return all(b.samples and b.samples[-1][0] >= t for b in self.buffers)
+
+    def step(self, t, numStep):
+        for k,robot in enumerate(self.robots):
+            u,t0,held = self.buffers[k].value(t, self.mode)
+            if u is None:
+                continue
+            ## Only an input held for lack of a later message times out, not a slow but regular stream
+            if held and self.timeout is not None and t - t0 > self.timeout and self.kinds[k] in velocityKinds:
+                self.staleSteps += 1
+                u = [0.0]*len(u)
+            applyInput[self.kinds[k]](robot, u, self.deltaT)
+            robot.flush()
+        for k,robot in enumerate(self.robots):
+            pair = headlessSim.firstCollision(self.world, self.collisionChecker, None, k)
+            if pair != self._collisions[k]:
+                self._collisions[k] = pair
+                self.events.put({"type": "collision" if pair is not None else "clear", "t": t, "robot": k, "pair": pair})
+            if numStep % self.stateEvery == 0:
+                self.states.put({"type": "state", "t": t, "robot": k, "q": robot.getConfig()}, k)
+
+    async def run(self, simTime, sources = [], sink = None, drainTime = 5.0):
+        ## Runs simTime seconds of simulation with the inputs of the sources, writes the outputs to the sink (spec)
+        loop = asyncio.get_event_loop()
+        self._queue = asyncio.Queue(self.inputSize)
+        closeSources = []
+        for spec in sources:
+            close,isFile = await openSource(spec, self._onLine)
+            closeSources.append(close)
+            self._openFiles += isFile
+        writers = []
+        closeSink = None
+        if sink is not None:
+            write,closeSink = await openSink(sink)
+            writers = [loop.create_task(_drain(q, write)) for q in (self.states, self.events)]
+        numSteps = int(round(simTime/self.deltaT))
+        startTime = loop.time()
+        for numStep in range(numSteps):
+            t = numStep*self.deltaT
+            if self.rate > 0:
+                delay = startTime + t/self.rate - loop.time()
+                if delay < 0:
+                    self.behindSteps += 1
+                await asyncio.sleep(max(delay, 0))
+            else:
+                ## Let the sources and the writers run
+                await asyncio.sleep(0)
+            self.t = t
+            await self._takeInputs(t)
+            self.step(t, numStep)
+        wallTime = loop.time() - startTime
+        for close in closeSources:
+            close()
+        if sink is not None:
+            ## Let the writers empty the queues (for at most drainTime seconds)
+            deadline = loop.time() + drainTime
+            while (self.states.items or self.events.items) and loop.time() < deadline and not any(w.done() for w in writers):
+                await asyncio.sleep(0.001)
+            for w in writers:
+                w.cancel()
+            closeSink()
+        return {"steps": numSteps, "simTime": numSteps*self.deltaT, "wallTime": wallTime,
+                "stepsPerSec": numSteps/wallTime if wallTime > 0 else float("inf"), "received": self.received,
+                "late": self.late, "outOfOrder": self.outOfOrder, "staleSteps": self.staleSteps,
+                "behindSteps": self.behindSteps, "states": self.states.stats(), "events": self.events.stats()}
+
+def writeProfile(fn, control, numRobots = 1, deltaT = 0.05, simTime = 30.0):
+    ## Input file of the sinusoidal profiles of headlessSim.py (vel, wheel), one message per robot every deltaT
+    ## Robot k runs the profile shifted by k seconds
+    with open(fn, "w") as f:
+        for step in range(int(round(simTime/deltaT)) + 1):
+            t = step*deltaT
+            for k in range(numRobots):
+                s = t + k
+                u = [0.5*math.cos(s), math.sin(s)] if control == "vel" else [math.sin(s), math.cos(s)]
+                f.write(json.dumps({"robot": k, "t": t, "u": u}) + "\n")
+
+async def send(fn, spec, speed = 1.0, stamp = True):
+    ## Stand-in for an external controller: sends the messages of an input file to a sink at the pace of their times
+    ## stamp: keep the times in the messages, otherwise the inputs are stamped by the simulation on arrival
+    ## (a live controller does not share the clock of the simulation)
+    write,close = await openSink(spec)
+    loop = asyncio.get_event_loop()
+    startTime = loop.time()
+    with open(fn) as f:
+        for line in f:
+            robot,t,u = parseMessage(line)
+            if t is not None and speed > 0:
+                await asyncio.sleep(max(startTime + t/speed - loop.time(), 0))
+            if not stamp:
+                line = json.dumps({"robot": robot, "u": u}) + "\n"
+            try:
+                await write([line])
+            except ConnectionError:
+                ## The simulation has ended
+                break
+    close()
+
+def _runLoop(coro):
+    if hasattr(asyncio, "run"):
+        return asyncio.run(coro)
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming control inputs for the headless simulation")
+    sub = parser.add_subparsers(dest="command")
+    runParser = sub.add_parser("run", help="simulate with the inputs of the sources")
+    runParser.add_argument("world", nargs="+", help="world file(s)")
+    runParser.add_argument("--robot", default="sphero", choices=sorted(defaultKinds.keys()), help="robot wrapper of all the robots of the world")
+    runParser.add_argument("--kind", default=None, choices=sorted(applyInput.keys()), help="input kind")
+    runParser.add_argument("--input", nargs="+", default=["-"], help="sources: FILE, - (stdin), tcp:HOST:PORT, unix:PATH")
+    runParser.add_argument("--output", default=None, help="sink of the states and events: FILE, - (stdout), tcp:HOST:PORT, unix:PATH")
+    runParser.add_argument("--room", default="door", choices=["door", "window", "none"], help="rooms added to the world")
+    runParser.add_argument("--dt", type=float, default=0.01, help="simulated timestep (s)")
+    runParser.add_argument("--time", type=float, default=30.0, help="simulated time (s)")
+    runParser.add_argument("--rate", type=float, default=1.0, help="pace of the clock (x real time), 0 for as fast as possible")
+    runParser.add_argument("--mode", default="interpolate", choices=["interpolate", "hold"])
+    runParser.add_argument("--timeout", type=float, default=0.5, help="age (s) of a held velocity input before the robot stops, negative to hold forever")
+    runParser.add_argument("--stateevery", type=int, default=1, help="steps between two states of a robot")
+    runParser.add_argument("--queue", type=int, default=1024, help="size of the input and output queues")
+    runParser.add_argument("--eventpolicy", default="drop", choices=["drop", "dropOldest"], help="policy of the full event queue")
+    profileParser = sub.add_parser("profile", help="write an input file of the sinusoidal profiles of headlessSim.py")
+    profileParser.add_argument("file")
+    profileParser.add_argument("--control", default="vel", choices=["vel", "wheel"])
+    profileParser.add_argument("--robots", type=int, default=1)
+    profileParser.add_argument("--dt", type=float, default=0.05, help="time between two messages (s)")
+    profileParser.add_argument("--time", type=float, default=30.0)
+    sendParser = sub.add_parser("send", help="send an input file to a socket at the pace of its times")
+    sendParser.add_argument("file")
+    sendParser.add_argument("sink", help="tcp:HOST:PORT or unix:PATH")
+    sendParser.add_argument("--speed", type=float, default=1.0, help="x real time, 0 for as fast as possible")
+    sendParser.add_argument("--nostamp", action="store_true", help="remove the times, the simulation stamps the inputs on arrival")
+    args = parser.parse_args()
+
+    if args.command == "profile":
+        writeProfile(args.file, args.control, args.robots, args.dt, args.time)
+    elif args.command == "send":
+        _runLoop(send(args.file, args.sink, args.speed, not args.nostamp))
+    elif args.command == "run":
+        world = headlessSim.loadWorld(args.world, args.room)
+        robots = [headlessSim.makeRobot(world, args.robot, i, name=args.robot+str(i)) for i in range(world.numRobots())]
+        kinds = [args.kind or defaultKinds[args.robot]]*len(robots)
+        pipeline = controlPipeline(world, robots, kinds, collide.WorldCollider(world), args.dt, args.mode, args.rate,
+                                   args.timeout if args.timeout >= 0 else None, inputSize=args.queue, stateEvery=args.stateevery,
+                                   outputSize=args.queue, eventPolicy=args.eventpolicy)
+        stats = _runLoop(pipeline.run(args.time, args.input, args.output))
+        ## The statistics go to stderr, stdout can be the sink
+        sys.stderr.write(json.dumps(stats, indent=1) + "\n")
+    else:
+        parser.print_help()
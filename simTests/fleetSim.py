@@ -0,0 +1,301 @@
+#!/usr/bin/python
+
+## Fleet mode: N robots of mixed types (sphero6DoF, kobuki, turtlebot) in one world, advanced by one scheduler
+##  1. The robots are the ones of the world file(s), and/or robots added by addRobots on a grid (e.g. --fleet kobuki:50 turtlebot:50).
+##     The type of each robot is read from its name or from its links, each robot gets the matching wrapper.
+##  2. fleetScheduler advances all the robots on the same fixed timestep. The differential drive robots with a
+##     velocity or wheel profile are grouped and advanced in one vectorized call (diffDriveFleet).
+##     The other robots use the control profiles of headlessSim.py, shifted to their home position.
+##  3. fleetCollider checks the robot-robot collisions in one batched pass: bounding spheres of all the robots
+##     are swept along x (sort and sweep), and only the overlapping pairs of robots are tested link against link.
+##     Robot-world collisions go through broadPhaseCollider and self collisions through selfCollider, so the cost
+##     of a step grows close to linearly with the number of robots.
+##
+## Execution:
+##   python fleetSim.py --fleet kobuki:40 turtlebot:40 sphero:20 --time 10 simpleWorld.xml
+##   python fleetSim.py --scaling 10 50 100 simpleWorld.xml
+
+import sys
+import os
+import time
+import math
+import argparse
+import numpy as np
+try:
+    from . import headlessSim
+    from .broadPhase import broadPhaseCollider, _overlaps
+    from .selfCollision import selfCollider
+    from .kinematics.diffDriveFleet import diffDriveFleet
+except (ImportError, ValueError):
+    ## Run as a script from this folder
+    import headlessSim
+    from broadPhase import broadPhaseCollider, _overlaps
+    from selfCollision import selfCollider
+    from kinematics.diffDriveFleet import diffDriveFleet
+
+## Robot files, relative to this file
+robotFiles = {"sphero": "../mobile_robots/sphero/sphero.rob",
+              "kobuki": "../mobile_robots/kobuki/kobuki.rob",
+              "turtlebot": "../mobile_robots/turtlebot/turtlebot.rob"}
+
+## Default control profile of each type
+defaultControls = {"sphero": "sphere", "kobuki": "vel", "turtlebot": "vel"}
+
+## Control profiles that set the position of the robot (shifted to the home position of each robot)
+absoluteControls = ("sphere", "holonomic")
+
+def robotType(model):
+    ## Type of a RobotModel, from its name (e.g. kobuki_3) or from its links
+    name = model.getName()
+    for t in robotFiles:
+        if name.startswith(t):
+            return t
+    links = set(model.link(i).getName() for i in range(model.numLinks()))
+    if "sphero" in links:
+        return "sphero"
+    if "plate_top_link" in links:
+        return "turtlebot"
+    if "wheel_left_link" in links:
+        return "kobuki"
+    raise ValueError("Unknown robot type for robot "+name)
+
+def addRobots(world, counts):
+    ## Load the robots listed in counts, a list of (type, number), named type_i
+    ## Returns the indices of the new robots
+    indices = []
+    for t,n in counts:
+        fn = os.path.join(os.path.dirname(os.path.abspath(__file__)), robotFiles[t])
+        for i in range(n):
+            model = world.loadRobot(fn)
+            if model.index < 0:
+                raise RuntimeError("Unable to load robot "+fn)
+            model.setName(t+"_"+str(i))
+            indices.append(model.index)
+    return indices
+
+def gridHomes(n, spacing = 0.8, center = (0.0, 0.0)):
+    ## n home positions (x, y) on a square grid
+    cols = int(math.ceil(math.sqrt(n)))
+    homes = []
+    for k in range(n):
+        i,j = k % cols, k // cols
+        homes.append((center[0] + (i - 0.5*(cols - 1))*spacing, center[1] + (j - 0.5*(cols - 1))*spacing))
+    return homes
+
+class fleetScheduler(object):
+    def __init__ (self, world, homes = None, controls = None, vis = None):
+        ## Wrappers for all the robots of the world
+        ## homes: (x, y) of every robot, by default a grid centered on the origin
+        ## controls: control profile of every robot (see headlessSim.controls), by default defaultControls of its type
+        n = world.numRobots()
+        self.world = world
+        self.types = [robotType(world.robot(i)) for i in range(n)]
+        self.robots = [headlessSim.makeRobot(world, t, i, vis, world.robot(i).getName()) for i,t in enumerate(self.types)]
+        self.homes = homes if homes is not None else gridHomes(n)
+        self.controls = controls if controls is not None else [defaultControls[t] for t in self.types]
+        ## Each robot follows its profile with its own phase, so that they do not move in lockstep
+        self.phases = np.linspace(0.0, 2*math.pi, n, endpoint=False)
+        for robot,home in zip(self.robots, self.homes):
+            q = robot.getConfig()
+            q[0],q[1] = home
+            robot.setConfig(q)
+        ## Groups: differential drive robots of the same type with a vel or wheel profile are batched
+        self.batches = []
+        self.single = []
+        groups = {}
+        for i,(t,c) in enumerate(zip(self.types, self.controls)):
+            if t in ("kobuki", "turtlebot") and c in ("vel", "wheel"):
+                groups.setdefault((t, c), []).append(i)
+            else:
+                self.single.append(i)
+        for (t,c),indices in sorted(groups.items()):
+            r = self.robots[indices[0]]
+            fleet = diffDriveFleet(len(indices), r.wheelDia, r.lenAxle, r.eps)
+            members = [self.robots[i] for i in indices]
+            fleet.fromRobots(members)
+            self.batches.append((c, fleet, members, self.phases[indices]))
+
+    def step(self, t, deltaT):
+        ## Advance all the robots by deltaT and write their configs to the models
+        for c,fleet,members,phases in self.batches:
+            ## Same inputs as headlessSim.velControl and headlessSim.wheelControl
+            if c == "vel":
+                fleet.velControlKin(0.5*np.cos(t + phases), np.sin(t + phases), deltaT)
+            else:
+                fleet.wheelControlKin(np.sin(t + phases), np.cos(t + phases), deltaT)
+            fleet.toRobots(members)
+        for i in self.single:
+            robot = self.robots[i]
+            headlessSim.controls[self.controls[i]](robot, t + self.phases[i], deltaT)
+            if self.controls[i] in absoluteControls:
+                q = robot.getConfig()
+                q[0] += self.homes[i][0]
+                q[1] += self.homes[i][1]
+                robot.setConfig(q)
+        for robot in self.robots:
+            robot.flush()
+
+class fleetCollider(object):
+    def __init__ (self, world, robots, cellSize = 1.0, margin = 0.0):
+        ## robots: the wrappers of fleetScheduler, in the order of the robots of the world
+        self.world = world
+        self.robots = robots
+        self.selfChecker = selfCollider(world)
+        self.worldChecker = broadPhaseCollider(world, cellSize, collider=self.selfChecker)
+        self.links = []
+        self.radius = np.zeros(len(robots))
+        for i,robot in enumerate(robots):
+            robot.flush()
+            model = world.robot(i)
+            geoms = [model.link(l).geometry() for l in range(model.numLinks()) if not model.link(l).geometry().empty()]
+            self.links.append(geoms)
+            self.radius[i] = self._radius(robot, geoms) + margin
+        self.names = [world.robot(i).getName() for i in range(world.numRobots())]
+        self.numCandidates = 0
+
+    def _radius(self, robot, geoms):
+        ## Radius of the robot about the position (x, y, z) of its config
+        origin = robot.getFullConfig()[:3]
+        r = 0.0
+        for g in geoms:
+            bb = g.getBB()
+            for x in (bb[0][0], bb[1][0]):
+                for y in (bb[0][1], bb[1][1]):
+                    for z in (bb[0][2], bb[1][2]):
+                        r = max(r, math.sqrt((x - origin[0])**2 + (y - origin[1])**2 + (z - origin[2])**2))
+        return r
+
+    def candidatePairs(self):
+        ## Pairs of robots (i, j), i < j, whose bounding spheres overlap (sort and sweep along x)
+        p = np.array([robot.getFullConfig()[:3] for robot in self.robots])
+        if len(p) < 2:
+            return []
+        order = np.argsort(p[:, 0])
+        xs = p[order, 0]
+        ## Only the robots within x + r_i + r_max can overlap robot i
+        ends = np.searchsorted(xs, xs + self.radius[order] + self.radius.max(), side="right")
+        pairs = []
+        for k in range(len(order)):
+            if ends[k] <= k + 1:
+                continue
+            i = order[k]
+            others = order[k + 1:ends[k]]
+            d2 = np.sum((p[others] - p[i])**2, axis=1)
+            for j in others[d2 <= (self.radius[others] + self.radius[i])**2]:
+                pairs.append((min(i, j), max(i, j)))
+        self.numCandidates += len(pairs)
+        return pairs
+
+    def _linkBBs(self, i, bbs):
+        if i not in bbs:
+            bbs[i] = [g.getBB() for g in self.links[i]]
+        return bbs[i]
+
+    def robotRobotCollisions(self):
+        ## Colliding pairs of robots (i, j)
+        ## For each candidate pair, only the links whose bounding boxes overlap are tested
+        colliding = []
+        bbs = {}
+        for i,j in self.candidatePairs():
+            bbi = self._linkBBs(i, bbs)
+            bbj = self._linkBBs(j, bbs)
+            if any(_overlaps(bbi[a], bbj[b]) and ga.collides(gb) for a,ga in enumerate(self.links[i]) for b,gb in enumerate(self.links[j])):
+                colliding.append((int(i), int(j)))
+        return colliding
+
+    def collisions(self):
+        ## All the colliding pairs of the step as (name, name)
+        ## Same queries as headlessSim.checkCollisions for every robot (the first contact with terrain 0 only), then robot-robot
+        world = self.world
+        pairs = []
+        for iR in range(world.numRobots()):
+            for i,j in self.worldChecker.robotTerrainCollisions(iR, 0):
+                pairs.append((self.names[iR], j.getName()))
+                break
+            for i,j in self.worldChecker.robotObjectCollisions(iR):
+                pairs.append((self.names[iR], j.getName()))
+        for i,j in self.selfChecker.robotSelfCollisions():
+            pairs.append((i.getName(), j.getName()))
+        for i,j in self.robotRobotCollisions():
+            pairs.append((self.names[i], self.names[j]))
+        return pairs
+
+def run(scheduler, collider, deltaT = 0.01, simTime = 10.0, verbose = False, recorder = None):
+    ## Fixed-step loop over the whole fleet, returns the same statistics as headlessSim.run plus the cost of a step
+    numSteps = int(round(simTime/deltaT))
+    collisionSteps = 0
+    stepTime = 0.0
+    collisionTime = 0.0
+    startTime = time.time()
+    for step in range(numSteps):
+        t = step * deltaT
+        t0 = time.time()
+        scheduler.step(t, deltaT)
+        t1 = time.time()
+        pairs = collider.collisions()
+        t2 = time.time()
+        stepTime += t1 - t0
+        collisionTime += t2 - t1
+        if pairs:
+            collisionSteps += 1
+            if verbose:
+                for a,b in pairs:
+                    print('{0:.3f}: '.format(t) + a + " collides with " + b)
+        if recorder is not None:
+            recorder.append(t, [v for robot in scheduler.robots for v in robot.getConfig()], (), pairs)
+    wallTime = time.time() - startTime
+    stats = {"robots": len(scheduler.robots), "steps": numSteps, "simTime": numSteps*deltaT, "wallTime": wallTime, "collisionSteps": collisionSteps}
+    stats["stepsPerSec"] = numSteps/wallTime if wallTime > 0 else float("inf")
+    stats["msPerStep"] = 1000.0*wallTime/numSteps if numSteps else 0.0
+    stats["kinematicsMs"] = 1000.0*stepTime/numSteps if numSteps else 0.0
+    stats["collisionMs"] = 1000.0*collisionTime/numSteps if numSteps else 0.0
+    return stats
+
+def parseFleet(items):
+    ## ["kobuki:40", "turtlebot:10"] -> [("kobuki", 40), ("turtlebot", 10)]
+    counts = []
+    for item in items:
+        t,n = item.split(":")
+        if t not in robotFiles:
+            raise ValueError("Unknown robot type "+t)
+        counts.append((t, int(n)))
+    return counts
+
+def mixedFleet(n):
+    ## Fleet of n robots: 40% kobuki, 40% turtlebot, 20% sphero
+    nk = int(round(0.4*n))
+    nt = int(round(0.4*n))
+    return [("kobuki", nk), ("turtlebot", nt), ("sphero", n - nk - nt)]
+
+def setupFleet(worldFiles, counts, room = "none", spacing = 0.8, cellSize = 1.0):
+    world = headlessSim.loadWorld(worldFiles, room)
+    addRobots(world, counts)
+    scheduler = fleetScheduler(world, gridHomes(world.numRobots(), spacing))
+    collider = fleetCollider(world, scheduler.robots, cellSize)
+    return world, scheduler, collider
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless fixed-step simulation of a fleet of robots")
+    parser.add_argument("world", nargs="+", help="world file(s), their robots are part of the fleet")
+    parser.add_argument("--fleet", nargs="*", default=[], metavar="TYPE:N", help="robots added on a grid, e.g. kobuki:40 turtlebot:40 sphero:20")
+    parser.add_argument("--scaling", type=int, nargs="*", default=None, metavar="N", help="benchmark mixed fleets of N robots (added to the world file robots)")
+    parser.add_argument("--room", default="none", choices=["door", "window", "none"], help="rooms added to the world")
+    parser.add_argument("--spacing", type=float, default=0.8, help="distance between the home positions (m)")
+    parser.add_argument("--dt", type=float, default=0.01, help="simulated timestep (s)")
+    parser.add_argument("--time", type=float, default=10.0, help="simulated time (s)")
+    parser.add_argument("--verbose", action="store_true", help="print every collision")
+    args = parser.parse_args()
+
+    if args.scaling:
+        print('{0:>7} {1:>12} {2:>16} {3:>15} {4:>14}'.format("robots", "ms/step", "kinematics (ms)", "collision (ms)", "us/robot/step"))
+        for n in args.scaling:
+            world,scheduler,collider = setupFleet(args.world, mixedFleet(n), args.room, args.spacing)
+            stats = run(scheduler, collider, args.dt, args.time)
+            print('{0:>7} {1:>12.3f} {2:>16.3f} {3:>15.3f} {4:>14.1f}'.format(stats["robots"], stats["msPerStep"], stats["kinematicsMs"],
+                                                                         stats["collisionMs"], 1000.0*stats["msPerStep"]/stats["robots"]))
+    else:
+        world,scheduler,collider = setupFleet(args.world, parseFleet(args.fleet), args.room, args.spacing)
+        stats = run(scheduler, collider, args.dt, args.time, args.verbose)
+        print('{0} robots, simulated {1:.1f} s in {2} steps, wall time {3:.3f} s'.format(stats["robots"], stats["simTime"], stats["steps"], stats["wallTime"]))
+        print('{0:.3f} ms per step ({1:.3f} ms kinematics, {2:.3f} ms collision)'.format(stats["msPerStep"], stats["kinematicsMs"], stats["collisionMs"]))
+        print('Steps with collision: {0}, robot-robot candidate pairs: {1}'.format(stats["collisionSteps"], collider.numCandidates))
@@ -0,0 +1,253 @@
+#!/usr/bin/python
+
+## Headless batch mode for kinematicSim.py
+## The script loads the same world file(s), builds the same rooms and runs the
+## same kinematics and collision loop without klampt.vis.
+## The loop steps on a fixed simulated timestep (instead of time.time()) and runs
+## as fast as the CPU allows. The number of steps per second is reported at the end.
+##
+## Execution:
+##   python headlessSim.py simpleWorld.xml
+##   python headlessSim.py --robot turtlebot --control wheel --dt 0.01 --time 1000 simpleWorld.xml
+
+import sys
+import os
+import time
+import math
+import argparse
+from klampt import WorldModel
+import klampt.model.collide as collide
+try:
+    from . import buildWorld as bW
+    from .broadPhase import broadPhaseCollider
+    from .selfCollision import selfCollider
+    from .kinematics.sphero6DoF import sphero6DoF
+    from .kinematics.kobuki import kobuki
+    from .kinematics.turtlebot import turtlebot
+except (ImportError, ValueError):
+    ## Run as a script from this folder
+    import buildWorld as bW
+    from broadPhase import broadPhaseCollider
+    from selfCollision import selfCollider
+    from kinematics.sphero6DoF import sphero6DoF
+    from kinematics.kobuki import kobuki
+    from kinematics.turtlebot import turtlebot
+
+## Control profiles: the same sinusoidal inputs as the main loop of kinematicSim.py,
+## written in terms of the simulated time t instead of time.time()
+## Each profile returns its control inputs (the commanded config for the holonomic profiles)
+def sphereControl(robot, t, deltaT):
+    ## 6DoF spherical robot
+    q = robot.getConfig()
+    q[0] = math.sin(t)
+    q[1] = math.cos(t)
+    q[2] = 0.5
+    q[3] = math.pi * (math.cos(t) + 1)
+    q[4] = math.pi * (math.sin(t) + 1)
+    q[5] = math.pi * (math.sin(t + math.pi/4.0) + 1)
+    robot.setConfig(q)
+    return q
+
+def holonomicControl(robot, t, deltaT):
+    ## 3DoF holonomic kobuki
+    q = robot.getConfig()
+    q[0] = math.cos(t)
+    q[1] = math.sin(t)
+    q[2] = math.pi * (math.cos(t) + 1)
+    robot.setConfig(q)
+    return q
+
+def velControl(robot, t, deltaT):
+    ## Forward velocity and angular velocity inputs (velControlKin)
+    vel = 0.5*math.cos(t)
+    omega = math.sin(t)
+    robot.velControlKin(vel, omega, deltaT)
+    return [vel, omega]
+
+def wheelControl(robot, t, deltaT):
+    ## Angular velocity of the wheels (wheelControlKin)
+    w_r = math.cos(t)
+    w_l = math.sin(t)
+    robot.wheelControlKin(w_l, w_r, deltaT)
+    return [w_l, w_r]
+
+controls = {"sphere": sphereControl, "holonomic": holonomicControl, "vel": velControl, "wheel": wheelControl}
+## Number of control inputs returned by each profile
+numInputs = {"sphere": 6, "holonomic": 3, "vel": 2, "wheel": 2}
+
+def makeRobot(world, robotType, index=0, vis=None, name=None):
+    ## Create the wrapper for world.robot(index), without any visualization unless vis is given
+    ## name: name of the coordinate frame in vis
+    if robotType == "sphero":
+        return sphero6DoF(world.robot(index), name or "sphero", vis)
+    if robotType == "kobuki":
+        robot = kobuki(world.robot(index), name or "kobuki", vis)
+        robot.setAltitude(0.01)
+        return robot
+    if robotType == "turtlebot":
+        robot = turtlebot(world.robot(index), name or "turtle", vis)
+        robot.setAltitude(0.02)
+        return robot
+    if robotType == "r2d2":
+        ## Differential drive with the kinematics of turtlebot, the wheels are 0.47 below the base
+        robot = turtlebot(world.robot(index), name or "r2d2", vis)
+        robot.setAltitude(0.48)
+        return robot
+    raise ValueError("Unknown robot type "+str(robotType))
+
+def checkCollisions(world, collisionChecker, selfChecker=None, profiler=None):
+    ## Same three queries as the main loop of kinematicSim.py
+    ## The self collisions are checked by selfChecker if given (see selfCollision.py)
+    ## profiler: stepProfiler, every query is a phase
+    ## Returns the list of colliding pairs as (name, name) tuples
+    pairs = []
+    for i,j in collisionChecker.robotTerrainCollisions(world.robot(0), world.terrain(0)):
+        pairs.append((world.robot(0).getName(), j.getName()))
+        break
+    if profiler is not None:
+        profiler.lap("collide.terrain")
+    for iR in range(world.numRobots()):
+        for i,j in collisionChecker.robotObjectCollisions(world.robot(iR)):
+            pairs.append((world.robot(iR).getName(), j.getName()))
+    if profiler is not None:
+        profiler.lap("collide.objects")
+    if selfChecker is None:
+        selfChecker = collisionChecker
+    for i,j in selfChecker.robotSelfCollisions():
+        pairs.append((i.getName(), j.getName()))
+    if profiler is not None:
+        profiler.lap("collide.self")
+    return pairs
+
+def firstCollision(world, collisionChecker, selfChecker=None, index=0):
+    ## First colliding pair of world.robot(index) with the terrains, the rigid objects or itself, or None
+    ## The queries stop at the first pair (validity checks, see batchValidity.py)
+    robot = world.robot(index)
+    for i,j in collisionChecker.robotTerrainCollisions(robot):
+        return (robot.getName(), j.getName())
+    for i,j in collisionChecker.robotObjectCollisions(robot):
+        return (robot.getName(), j.getName())
+    if selfChecker is None:
+        selfChecker = collisionChecker
+    for i,j in selfChecker.robotSelfCollisions(robot):
+        return (i.getName(), j.getName())
+    return None
+
+def run(world, robot, control, collisionChecker, deltaT=0.01, simTime=30.0, verbose=False, selfChecker=None, recorder=None, profiler=None):
+    ## Fixed-step loop: the simulated time advances by deltaT on every step,
+    ## independently of the wall-clock time
+    ## recorder: trajectoryLog.trajectoryWriter, every step is appended to it
+    ## profiler: stepProfiler.stepProfiler, times the phases of every step
+    numSteps = int(round(simTime/deltaT))
+    collisionSteps = 0
+    firstCollision = None
+    startTime = time.time()
+    step = 0
+    if profiler is not None:
+        profiler.mark()
+    while step < numSteps:
+        t = step * deltaT
+        inputs = control(robot, t, deltaT)
+        if profiler is not None:
+            profiler.lap("control")
+        robot.flush()
+        if profiler is not None:
+            profiler.lap("flush")
+        pairs = checkCollisions(world, collisionChecker, selfChecker, profiler)
+        if recorder is not None:
+            recorder.append(t, robot.getConfig(), inputs, pairs)
+            if profiler is not None:
+                profiler.lap("record")
+        if pairs:
+            collisionSteps += 1
+            if firstCollision is None:
+                firstCollision = t
+            if verbose:
+                for a,b in pairs:
+                    print('{0:.3f}: '.format(t) + a + " collides with " + b)
+                if profiler is not None:
+                    profiler.lap("print")
+        step += 1
+        if profiler is not None:
+            profiler.step()
+    wallTime = time.time() - startTime
+    stats = {"steps": numSteps, "simTime": numSteps*deltaT, "wallTime": wallTime, "collisionSteps": collisionSteps, "firstCollision": firstCollision}
+    stats["stepsPerSec"] = numSteps/wallTime if wallTime > 0 else float("inf")
+    stats["realTimeFactor"] = stats["simTime"]/wallTime if wallTime > 0 else float("inf")
+    return stats
+
+def loadWorld(fileNames, room="door", meshCache=True):
+    ## Creates a world, loads all the items and adds the rooms as in kinematicSim.py
+    ## meshCache: read the meshes from the binary cache of meshCache.py (requires NumPy)
+    world = WorldModel()
+    readFile = lambda world, fn: world.readFile(fn)
+    if meshCache:
+        try:
+            try:
+                from .meshCache import readWorld as readFile
+            except (ImportError, ValueError):
+                from meshCache import readWorld as readFile
+        except ImportError:
+            pass
+    for fn in fileNames:
+        res = readFile(world, fn)
+        if not res:
+            raise RuntimeError("Unable to load model "+fn)
+    if room == "door":
+        bW.getDoubleRoomDoor(world, 8, 8, 1)
+    elif room == "window":
+        bW.getDoubleRoomWindow(world, 8, 8, 1.2)
+    return world
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless fixed-step kinematic simulation")
+    parser.add_argument("world", nargs="+", help="world file(s)")
+    parser.add_argument("--robot", default="sphero", choices=["sphero", "kobuki", "turtlebot", "r2d2"], help="robot wrapper (must match the world file)")
+    parser.add_argument("--control", default=None, choices=sorted(controls.keys()), help="control profile")
+    parser.add_argument("--room", default="door", choices=["door", "window", "none"], help="rooms added to the world")
+    parser.add_argument("--dt", type=float, default=0.01, help="simulated timestep (s)")
+    parser.add_argument("--time", type=float, default=30.0, help="simulated time (s)")
+    parser.add_argument("--broadphase", type=float, default=None, metavar="CELL", help="use the broad phase collider with this grid cell size (m)")
+    parser.add_argument("--selfcache", action="store_true", help="prune static link pairs and cache self collision distances")
+    parser.add_argument("--record", default=None, metavar="FILE", help="record the trajectory to FILE (see trajectoryLog.py)")
+    parser.add_argument("--proxy", default=None, choices=["hull", "spheres", "footprint"], help="collide simplified link geometries (see collisionProxy.py)")
+    parser.add_argument("--proxymargin", type=float, default=0.0, help="growth of the proxies (m)")
+    parser.add_argument("--profile", default=None, metavar="FILE", help="time the phases of the step, write them to FILE (.csv or .json)")
+    parser.add_argument("--nomeshcache", action="store_true", help="parse the mesh files instead of reading the mesh cache")
+    parser.add_argument("--verbose", action="store_true", help="print every collision")
+    args = parser.parse_args()
+
+    world = loadWorld(args.world, args.room, not args.nomeshcache)
+    robot = makeRobot(world, args.robot)
+    control = args.control
+    if control is None:
+        control = {"sphero": "sphere", "kobuki": "holonomic", "turtlebot": "vel", "r2d2": "vel"}[args.robot]
+    if args.proxy is not None:
+        from collisionProxy import applyProxies
+        applyProxies(world.robot(0), args.proxy, args.proxymargin)
+    collisionChecker = collide.WorldCollider(world)
+    if args.broadphase is not None:
+        collisionChecker = broadPhaseCollider(world, args.broadphase, collider=collisionChecker)
+
+    selfChecker = selfCollider(world) if args.selfcache else None
+
+    recorder = None
+    if args.record is not None:
+        from trajectoryLog import trajectoryWriter
+        info = {"world": args.world, "robot": args.robot, "control": control, "room": args.room, "dt": args.dt}
+        recorder = trajectoryWriter(args.record, len(robot.getConfig()), numInputs[control], info=info)
+
+    profiler = None
+    if args.profile is not None:
+        from stepProfiler import stepProfiler
+        profiler = stepProfiler()
+
+    stats = run(world, robot, controls[control], collisionChecker, args.dt, args.time, args.verbose, selfChecker, recorder, profiler)
+    if recorder is not None:
+        recorder.close()
+    if profiler is not None:
+        profiler.printTable()
+        profiler.write(args.profile)
+    print('Simulated {0:.1f} s in {1} steps, wall time {2:.3f} s'.format(stats["simTime"], stats["steps"], stats["wallTime"]))
+    print('Steps per second: {0:.1f} ({1:.1f}x real time)'.format(stats["stepsPerSec"], stats["realTimeFactor"]))
+    print('Steps with collision: {0}'.format(stats["collisionSteps"]))
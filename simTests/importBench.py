@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+## Import time benchmark of the modules used by the headless simulators
+## Every module is imported in a fresh Python process (as a sweep worker would), several times.
+## The median import time is reported, with the number of loaded modules and whether klampt.vis or OpenGL
+## were loaded. The headless modules must not load them; the exit status is 1 if one of them does.
+##
+## Execution (from this folder):
+##   python importBench.py [--repeat 5] [--package]
+
+import sys
+import os
+import json
+import argparse
+import subprocess
+
+## Modules of the headless path, and references
+headlessModules = ["kinematics.sphero6DoF", "kinematics.kobuki", "kinematics.turtlebot", "kinematics.robotWrapper",
+                   "mathUtils", "buildWorld", "worldGen", "broadPhase", "selfCollision", "headlessSim"]
+referenceModules = ["klampt", "klampt.vis"]
+
+_probe = """
+import sys, time, json
+t = time.time()
+import %s
+t = time.time() - t
+print(json.dumps({"time": t, "modules": len(sys.modules), "vis": "klampt.vis" in sys.modules, "opengl": "OpenGL" in sys.modules}))
+"""
+
+def importTime(module, repeat = 5, cwd = None):
+    ## Median of the import time (s) over repeat fresh processes, and the state after the last import
+    times = []
+    result = None
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable, "-c", _probe % module], cwd=cwd)
+        lines = [l for l in out.decode("utf-8").splitlines() if l.startswith("{")]
+        result = json.loads(lines[-1])
+        times.append(result["time"])
+    times.sort()
+    result["time"] = times[len(times)//2]
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time of the headless modules")
+    parser.add_argument("--repeat", type=int, default=5, help="processes per module")
+    parser.add_argument("--package", action="store_true", help="import the modules as simTests.<module> from the root of the repository")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    cwd = os.path.dirname(here) if args.package else here
+    prefix = os.path.basename(here) + "." if args.package else ""
+    print('{0:>32} {1:>10} {2:>8} {3:>10} {4:>8}'.format("module", "time (ms)", "modules", "klampt.vis", "OpenGL"))
+    failed = []
+    for module in referenceModules + headlessModules:
+        name = module if module in referenceModules else prefix + module
+        try:
+            r = importTime(name, args.repeat, cwd)
+        except subprocess.CalledProcessError:
+            print('{0:>32} {1:>10}'.format(name, "failed"))
+            failed.append(name)
+            continue
+        print('{0:>32} {1:>10.1f} {2:>8} {3:>10} {4:>8}'.format(name, 1000*r["time"], r["modules"], "yes" if r["vis"] else "no", "yes" if r["opengl"] else "no"))
+        if module in headlessModules and (r["vis"] or r["opengl"]):
+            failed.append(name)
+    if failed:
+        print("Modules that failed or loaded the GUI: " + ", ".join(failed))
+        sys.exit(1)
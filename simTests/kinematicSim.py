@@ -11,20 +11,24 @@
 import sys
 from klampt import *
 from klampt import vis
-from klampt.robotsim import setRandomSeed
-from klampt.vis.glcommon import GLWidgetPlugin
-from klampt import RobotPoser
-from klampt.model import ik,coordinates
+from klampt.model import coordinates
 from klampt.math import so3
 import klampt.model.collide as collide
 import time
 import math
-import buildWorld as bW
-sys.path.append("./kinematics/")
-from sphero6DoF import sphero6DoF
-from kobuki import kobuki
-from turtlebot import turtlebot
-from decimal import Decimal
+try:
+    from . import buildWorld as bW
+    from .visUpdater import visUpdater
+    from .kinematics.sphero6DoF import sphero6DoF
+    from .kinematics.kobuki import kobuki
+    from .kinematics.turtlebot import turtlebot
+except (ImportError, ValueError):
+    ## Run as a script from this folder
+    import buildWorld as bW
+    from visUpdater import visUpdater
+    from kinematics.sphero6DoF import sphero6DoF
+    from kinematics.kobuki import kobuki
+    from kinematics.turtlebot import turtlebot
 
 if __name__ == "__main__":
     if len(sys.argv)<=1:
@@ -56,13 +60,17 @@ if __name__ == "__main__":
 
     ## Create robot object. Change the class to the desired robot. 
     ## Also, make sure the robot class corresponds to the robot in simpleWorld.xml file
-    #robot = kobuki(world.robot(0), vis)
+    #robot = kobuki(world.robot(0), "kobuki", display)
     #robot.setAltitude(0.01)
 
-    #robot = turtlebot(world.robot(0), "turtle", vis)
+    #robot = turtlebot(world.robot(0), "turtle", display)
     #robot.setAltitude(0.02)
     
-    robot = sphero6DoF(world.robot(0), "sphero", vis)
+    ## The wrappers push their coordinate frames through the throttled display
+    displayFPS = 30
+    display = visUpdater(vis, displayFPS)
+
+    robot = sphero6DoF(world.robot(0), "sphero", display)
 
     ## Display the world coordinate system
     vis.add("WCS", [so3.identity(),[0,0,0]])
@@ -78,6 +86,25 @@ if __name__ == "__main__":
     collisionFlag = False
     collisionChecker = collide.WorldCollider(world)
 
+    ## Set to a file name to record the configurations and the collisions of the run (see trajectoryLog.py)
+    recordFile = None
+    recorder = None
+    if recordFile is not None:
+        from trajectoryLog import trajectoryWriter
+        recorder = trajectoryWriter(recordFile, len(robot.getConfig()), info={"world": sys.argv[1:], "robot": robot.robotName})
+
+    ## Set profileFile to time the phases of the loop (see stepProfiler.py), written at the end as CSV (or JSON if the name ends with .json)
+    ## profileOverlay shows the step rate and the slowest phases in the window
+    profileFile = None
+    profileOverlay = False
+    profiler = None
+    if profileFile is not None or profileOverlay:
+        from stepProfiler import stepProfiler
+        profiler = stepProfiler()
+        if profileOverlay:
+            vis.addText("textProfile", "", (20, 60))
+            vis.setAttribute("textProfile", "size", 18)
+
     ## On-screen text display
     vis.addText("textConfig","Robot configuration: ")
     vis.setAttribute("textConfig","size",24)
@@ -91,99 +118,155 @@ if __name__ == "__main__":
     #print(next(collisionFlag))
     vis.show()
     simTime = 30
+    ## The simulation runs on a fixed timestep, independently of the display rate
+    ## The display is refreshed at most displayFPS times per second (see visUpdater.py)
+    simDt = 0.001
+    ## At most two frames of steps between two display updates (a frame lasts a bit more than 1/displayFPS).
+    ## If the steps are slower than simDt the simulation falls behind the wall clock, and the lag is dropped
+    ## instead of being caught up
+    maxStepsPerFrame = max(1, int(round(2.0/(displayFPS*simDt))))
     startTime = time.time()
-    oldTime = startTime
-    while vis.shown() and (time.time() - startTime < simTime):
-        vis.lock()
-        ## You may modify the world here.
-        ## Specifying change in configuration of the robot
-
-        ## 6DoF spherical robot
-        q = robot.getConfig()
-        q[0] = math.sin(time.time())
-        q[1] = math.cos(time.time())
-        q[2] = 0.5
-        q[3] = math.pi * (math.cos(time.time()) + 1)
-        q[4] = math.pi * (math.sin(time.time()) + 1)
-        q[5] = math.pi * (math.sin(time.time() + math.pi/4.0) + 1)
-        robot.setConfig(q)
-
-        ## 3DoF holonomic kobuki
-        #q = robot.getConfig()
-        #q[0] = math.cos(time.time())
-        #q[1] = math.sin(time.time())
-        #q[2] = math.pi * (math.cos(time.time()) + 1)
-        #robot.setConfig(q)
-        
-        ## Turtlebot  2DoF Non-holonomic
-        ## The controls are in terms of forward velocity (along x-axis) and angular velocity (about z-axis)
-        ## The state of the robot is described as (x, y, alpha)
-        ## The kinematics for converting the control inputs to the state vector is given in the function turtlebot.controlKin
-        #vel = 0.5*math.cos(time.time())
-        #omega = math.sin(time.time())
-        #deltaT = time.time() - oldTime
-        #oldTime = time.time()
-        #robot.velControlKin(vel, omega, deltaT)
-
-        ## The kinematics for converting lower lever control input as per angular velocity of wheels (w_l, w_r) is given in the function turtlebot.wheelControlKin
-        ## We can also operate as a holonomic robot by directly providing the x, y, alpha positions directly (similar to holonomic kobuki)
-        #w_r = math.cos(time.time())
-        #w_l = math.sin(time.time())
-        #deltaT = time.time() - oldTime
-        #oldTime = time.time()
-        #robot.wheelControlKin(w_l, w_r, deltaT)
-
-        q = robot.getConfig()
-        q2f = [ '{0:.2f}'.format(elem) for elem in q]
-        strng = "Robot configuration: " + str(q2f)
-        vis.addText("textConfig", strng)
-
-        ## Checking collision
-        collisionFlag = False
-        #for i,j in collisionChecker.collisionTests():
-        #    if i[1].collides(j[1]):
-        #        collisionFlag = True
-        #        strng = "Object "+i[0].getName()+" collides with "+j[0].getName()
-        #        print(strng)
-        #        vis.addText("textCol", strng)
-        #        vis.setColor("textCol", 0.8500, 0.3250, 0.0980)
-        collRT0 = collisionChecker.robotTerrainCollisions(world.robot(0), world.terrain(0))
-        for i,j in collRT0:
-            collisionFlag = True
-            strng = "Robot collides with "+j.getName()
-            print(strng)
-            vis.addText("textCol", strng)
-            vis.setColor("textCol", 0.8500, 0.3250, 0.0980)
-            break
-  
-        for iR in range(world.numRobots()):
-            collRT2 = collisionChecker.robotObjectCollisions(world.robot(iR))
-            for i,j in collRT2:
+    t = 0.0
+    colText = None
+    if profiler is not None:
+        profiler.mark()
+    while vis.shown() and t < simTime:
+        ## Run the simulation steps needed to catch up with the wall clock
+        ## The vis lock is only held while the robot model is written and while the display is updated
+        wallTime = time.time() - startTime
+        numSteps = 0
+        while t < wallTime and t < simTime and numSteps < maxStepsPerFrame:
+            ## You may modify the world here.
+            ## Specifying change in configuration of the robot
+
+            ## 6DoF spherical robot
+            q = robot.getConfig()
+            q[0] = math.sin(t)
+            q[1] = math.cos(t)
+            q[2] = 0.5
+            q[3] = math.pi * (math.cos(t) + 1)
+            q[4] = math.pi * (math.sin(t) + 1)
+            q[5] = math.pi * (math.sin(t + math.pi/4.0) + 1)
+            robot.setConfig(q)
+
+            ## 3DoF holonomic kobuki
+            #q = robot.getConfig()
+            #q[0] = math.cos(t)
+            #q[1] = math.sin(t)
+            #q[2] = math.pi * (math.cos(t) + 1)
+            #robot.setConfig(q)
+
+            ## Turtlebot  2DoF Non-holonomic
+            ## The controls are in terms of forward velocity (along x-axis) and angular velocity (about z-axis)
+            ## The state of the robot is described as (x, y, alpha)
+            ## The kinematics for converting the control inputs to the state vector is given in the function turtlebot.controlKin
+            #vel = 0.5*math.cos(t)
+            #omega = math.sin(t)
+            #robot.velControlKin(vel, omega, simDt)
+
+            ## The kinematics for converting lower lever control input as per angular velocity of wheels (w_l, w_r) is given in the function turtlebot.wheelControlKin
+            ## We can also operate as a holonomic robot by directly providing the x, y, alpha positions directly (similar to holonomic kobuki)
+            #w_r = math.cos(t)
+            #w_l = math.sin(t)
+            #robot.wheelControlKin(w_l, w_r, simDt)
+            if profiler is not None:
+                profiler.lap("kinematics")
+
+            ## The wrapper buffers the configuration, write it to the robot model before checking collision
+            vis.lock()
+            if profiler is not None:
+                profiler.lap("lock")
+            robot.flush()
+            vis.unlock()
+            if profiler is not None:
+                profiler.lap("flush")
+
+            ## Checking collision
+            collisionFlag = False
+            pairs = []
+            #for i,j in collisionChecker.collisionTests():
+            #    if i[1].collides(j[1]):
+            #        collisionFlag = True
+            #        strng = "Object "+i[0].getName()+" collides with "+j[0].getName()
+            collRT0 = collisionChecker.robotTerrainCollisions(world.robot(0), world.terrain(0))
+            for i,j in collRT0:
                 collisionFlag = True
-                strng = world.robot(iR).getName() + " collides with " + j.getName()
-                print(strng)
-                vis.addText("textCol", strng)
-                vis.setColor("textCol", 0.8500, 0.3250, 0.0980)
-
-        collRT3 = collisionChecker.robotSelfCollisions()
-        for i,j in collRT3:
-            collisionFlag = True
-            strng = i.getName() + " collides with "+j.getName()
-            print(strng)
-            vis.addText("textCol", strng)
-            vis.setColor("textCol", 0.8500, 0.3250, 0.0980)
-        if not collisionFlag:
-            vis.addText("textCol", "No collision")
-            vis.setColor("textCol", 0.4660, 0.6740, 0.1880)
-
-        if not collisionFlag:
-            vis.addText("textCol", "No collision")
-            vis.setColor("textCol", 0.4660, 0.6740, 0.1880)
-
-        vis.unlock()
+                strng = "Robot collides with "+j.getName()
+                pairs.append((world.robot(0).getName(), j.getName()))
+                break
+            if profiler is not None:
+                profiler.lap("collide.terrain")
+
+            for iR in range(world.numRobots()):
+                collRT2 = collisionChecker.robotObjectCollisions(world.robot(iR))
+                for i,j in collRT2:
+                    collisionFlag = True
+                    strng = world.robot(iR).getName() + " collides with " + j.getName()
+                    pairs.append((world.robot(iR).getName(), j.getName()))
+            if profiler is not None:
+                profiler.lap("collide.objects")
+
+            collRT3 = collisionChecker.robotSelfCollisions()
+            for i,j in collRT3:
+                collisionFlag = True
+                strng = i.getName() + " collides with "+j.getName()
+                pairs.append((i.getName(), j.getName()))
+            if profiler is not None:
+                profiler.lap("collide.self")
+
+            if recorder is not None:
+                recorder.append(t, robot.getConfig(), (), pairs)
+                if profiler is not None:
+                    profiler.lap("record")
+            if not collisionFlag:
+                strng = "No collision"
+            ## Print only when the collision status changes
+            if strng != colText:
+                colText = strng
+                if collisionFlag:
+                    print(strng)
+                    display.addText("textCol", strng)
+                    display.setColor("textCol", 0.8500, 0.3250, 0.0980)
+                else:
+                    display.addText("textCol", strng)
+                    display.setColor("textCol", 0.4660, 0.6740, 0.1880)
+            t += simDt
+            numSteps += 1
+            if profiler is not None:
+                profiler.lap("text")
+                profiler.step()
+        if t < wallTime:
+            ## Behind the wall clock after a full frame of steps: drop the lag
+            startTime += wallTime - t
+
+        ## The on-screen text is only formatted when it is going to be displayed
+        if display.due():
+            q = robot.getConfig()
+            q2f = [ '{0:.2f}'.format(elem) for elem in q]
+            strng = "Robot configuration: " + str(q2f)
+            display.addText("textConfig", strng)
+            if profiler is not None and profileOverlay:
+                display.addText("textProfile", profiler.overlayText())
+            if profiler is not None:
+                profiler.lap("format")
+            vis.lock()
+            if profiler is not None:
+                profiler.lap("lock")
+            display.update()
+            vis.unlock()
+            if profiler is not None:
+                profiler.lap("vis.update")
         #changes to the visualization must be done outside the lock
-        time.sleep(0.01)
+        time.sleep(max(display.timeToNextUpdate(), 0.001))
+        if profiler is not None:
+            profiler.lap("sleep")
     vis.clearText()
+    if recorder is not None:
+        recorder.close()
+    if profiler is not None:
+        profiler.printTable()
+        if profileFile is not None:
+            profiler.write(profileFile)
 
     print "Ending klampt.vis visualization."
     vis.kill()
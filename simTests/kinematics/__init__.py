@@ -0,0 +1,2 @@
+## Robot wrappers: sphero6DoF, kobuki, turtlebot (robotWrapper.py) and the batched diffDriveFleet (requires NumPy)
+## Import the modules directly, e.g. from kinematics.turtlebot import turtlebot
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+## Batched kinematics for a fleet of differential drive robots (turtlebot, kobuki)
+## The states of all the robots are stored in a contiguous (N x 3) array of (x, y, yaw)
+## The function velControlKin advances all the robots for velocity control inputs (linear along local x, and angular about local z)
+## The function wheelControlKin advances all the robots for wheel velocity control inputs (angular wheel left and right)
+## The functions velRollout and wheelRollout take a whole (T x N) control sequence and return the (T+1) x N x 3 trajectories
+## The straight line (|omega| < eps) and the ICC arc cases are handled with masks, there is no loop over the robots
+
+import numpy as np
+
+def velKin(state, vel, omega, deltaT, eps=0.000001):
+    """Returns the (N x 3) states after applying the velocities (vel, omega) for deltaT.
+    vel, omega and deltaT can be scalars or arrays of length N.
+    Same equations as turtlebot.velControlKin"""
+    x = state[:, 0]
+    y = state[:, 1]
+    yaw = state[:, 2]
+    vel = np.broadcast_to(np.asarray(vel, dtype=float), x.shape)
+    omega = np.broadcast_to(np.asarray(omega, dtype=float), x.shape)
+    deltaT = np.asarray(deltaT, dtype=float)
+    straight = np.abs(omega) < eps
+    ## Radius of the arc, only used where the robot is not going straight
+    rad = vel / np.where(straight, 1.0, omega)
+    dYaw = np.where(straight, 0.0, omega * deltaT)
+    newYaw = yaw + dYaw
+    cosYaw = np.cos(yaw)
+    sinYaw = np.sin(yaw)
+    cosNew = np.cos(newYaw)
+    sinNew = np.sin(newYaw)
+    newState = np.empty_like(state)
+    newState[:, 0] = x + np.where(straight, vel * deltaT * cosYaw, rad * (sinNew - sinYaw))
+    newState[:, 1] = y + np.where(straight, vel * deltaT * sinYaw, rad * (cosYaw - cosNew))
+    newState[:, 2] = newYaw
+    return newState
+
+def wheelToVel(w_l, w_r, wheelDia, lenAxle):
+    """Converts the angular velocities of the wheels into the forward velocity and
+    the angular velocity of the robot"""
+    v_l = np.asarray(w_l, dtype=float) * wheelDia/2.0
+    v_r = np.asarray(w_r, dtype=float) * wheelDia/2.0
+    return (v_l + v_r)/2.0, (v_r - v_l)/lenAxle
+
+def _perStep(a):
+    a = np.asarray(a, dtype=float)
+    if a.ndim < 2:
+        return a.reshape(-1, 1)
+    return a
+
+def velRolloutKin(state, vel, omega, deltaT, eps=0.000001):
+    """Integrates a (T x N) sequence of velocity inputs from the (N x 3) initial state.
+    Returns the (T+1) x N x 3 trajectory, the first entry being the initial state.
+    The heading only depends on the cumulative sum of the angular velocities, so
+    all the steps are computed at once"""
+    state = np.asarray(state, dtype=float)
+    ## A 1-D sequence of length T is applied to all the robots
+    vel = _perStep(vel)
+    omega = _perStep(omega)
+    deltaT = _perStep(deltaT)
+    shape = (max(vel.shape[0], omega.shape[0]), state.shape[0])
+    vel, omega, deltaT = [np.broadcast_to(a, shape) for a in (vel, omega, deltaT)]
+    numSteps = shape[0]
+    straight = np.abs(omega) < eps
+    dYaw = np.where(straight, 0.0, omega * deltaT)
+    traj = np.empty((numSteps + 1,) + state.shape)
+    traj[0] = state
+    ## Heading at the start of every step
+    yaw = np.empty(shape)
+    yaw[0] = state[:, 2]
+    np.cumsum(dYaw[:-1], axis=0, out=yaw[1:])
+    yaw[1:] += state[:, 2]
+    newYaw = yaw + dYaw
+    rad = vel / np.where(straight, 1.0, omega)
+    cosYaw = np.cos(yaw)
+    sinYaw = np.sin(yaw)
+    dx = np.where(straight, vel * deltaT * cosYaw, rad * (np.sin(newYaw) - sinYaw))
+    dy = np.where(straight, vel * deltaT * sinYaw, rad * (cosYaw - np.cos(newYaw)))
+    traj[1:, :, 0] = state[:, 0] + np.cumsum(dx, axis=0)
+    traj[1:, :, 1] = state[:, 1] + np.cumsum(dy, axis=0)
+    traj[1:, :, 2] = newYaw
+    return traj
+
+class diffDriveFleet(object):
+
+    def __init__ (self, numRobots, wheelDia=0.076, lenAxle=0.23, eps=0.000001, states=None):
+        self.wheelDia = wheelDia
+        self.lenAxle = lenAxle ## Centre to centre wheel distance
+        self.eps = eps ## Small value for comparing to zero
+        ## Contiguous array of (x, y, yaw) for all the robots
+        self.state = np.zeros((numRobots, 3))
+        if states is not None:
+            self.state[:] = states
+
+    def __len__(self):
+        return self.state.shape[0]
+
+    def getConfig(self, i=None):
+        if i is None:
+            return self.state.copy()
+        return self.state[i].tolist()
+
+    def setConfig(self, qC, i=None):
+        if i is None:
+            self.state[:] = qC
+        else:
+            self.state[i] = qC
+
+    def velControlKin(self, vel, omega, deltaT):
+        self.state = velKin(self.state, vel, omega, deltaT, self.eps)
+
+    def wheelControlKin(self, w_l, w_r, deltaT):
+        vel, omega = wheelToVel(w_l, w_r, self.wheelDia, self.lenAxle)
+        ## Straight line when |v_r - v_l| < eps, as in turtlebot.wheelControlKin
+        self.state = velKin(self.state, vel, omega, deltaT, self.eps/self.lenAxle)
+
+    def velRollout(self, vel, omega, deltaT, update=True):
+        ## vel and omega are (T x N) arrays, the fleet is moved to the last state if update is True
+        traj = velRolloutKin(self.state, vel, omega, deltaT, self.eps)
+        if update:
+            self.state = traj[-1].copy()
+        return traj
+
+    def wheelRollout(self, w_l, w_r, deltaT, update=True):
+        ## w_l and w_r are (T x N) arrays of angular velocities of the wheels
+        vel, omega = wheelToVel(w_l, w_r, self.wheelDia, self.lenAxle)
+        traj = velRolloutKin(self.state, vel, omega, deltaT, self.eps/self.lenAxle)
+        if update:
+            self.state = traj[-1].copy()
+        return traj
+
+    def fromRobots(self, robots):
+        ## Read the states from a list of turtlebot/kobuki wrappers
+        for i,robot in enumerate(robots):
+            self.state[i] = robot.getConfig()
+
+    def toRobots(self, robots):
+        ## Write the states to a list of turtlebot/kobuki wrappers
+        for i,robot in enumerate(robots):
+            robot.setConfig(self.state[i].tolist())
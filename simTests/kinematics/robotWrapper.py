@@ -0,0 +1,91 @@
+#!/usr/bin/python
+
+## Base class of the robot wrappers (sphero6DoF, kobuki, turtlebot)
+## The reduced state of the robot (e.g. (x, y, yaw) or the 6 DoF) is kept in a local buffer
+## The Klampt config is copied once from the RobotModel, and written back only when flush() is called
+## getConfig, setConfig and getTransform work on the local buffer and do not cross the C++/Python boundary
+## flush() must be called before a collision query or rendering, it updates the RobotModel and the coordinate frame in vis
+## sync() reads the config back from the RobotModel, if it was modified outside of the wrapper
+
+from klampt.math import so3
+try:
+    from .. import mathUtils
+except (ImportError, ValueError):
+    ## kinematics is imported as a top-level package (from simTests), or this folder is on the path
+    import mathUtils
+
+class robotWrapper(object):
+    __slots__ = ("robot", "robotName", "vis", "delZ", "_q", "_qFull", "_dirty")
+    ## Indices of the reduced state in the Klampt config, set by the derived classes
+    _index = ()
+
+    def __init__ (self, robot, robotName, vis=None):
+        self.robot = robot
+        self.robotName = robotName
+        self.vis = vis
+        self.delZ = 0.0 ## Offset of the displayed coordinate system along z
+        self._qFull = None
+        self._q = None
+        self._dirty = False
+        self.sync()
+        rotMat = so3.identity()
+        pt = [0, 0, 0]
+        if self.vis is not None:
+            self.vis.add(self.robotName, [rotMat, pt])
+            self.vis.setAttribute(self.robotName, "size", 32)
+            self.vis.edit(self.robotName)
+
+    def sync(self):
+        ## Discard the local buffer and read the config from the RobotModel
+        self._qFull = self.robot.getConfig()
+        self._q = [self._qFull[i] for i in self._index]
+        self._dirty = False
+
+    def dirty(self):
+        return self._dirty
+
+    def getConfig(self):
+        return list(self._q)
+
+    def setConfig(self, qC):
+        q = self._q
+        for k in range(len(q)):
+            q[k] = qC[k]
+        self._dirty = True
+
+    def getFullConfig(self):
+        ## Klampt config with the local changes applied
+        qFull = list(self._qFull)
+        for k,i in enumerate(self._index):
+            qFull[i] = self._q[k]
+        return qFull
+
+    def flush(self):
+        ## Write the local state to the RobotModel (and to vis) if it has changed
+        if not self._dirty:
+            return False
+        qFull = self._qFull
+        for k,i in enumerate(self._index):
+            qFull[i] = self._q[k]
+        self.robot.setConfig(qFull)
+        self._dirty = False
+        if self.vis is not None:
+            trans = self.getTransform()
+            rotMat = trans[0]
+            pt = trans[1]
+            pt[2] = pt[2] + self.delZ
+            self.vis.add(self.robotName, [rotMat, pt], keepAppearance=True)
+        return True
+
+    def getTransform(self):
+        q = self.getFullConfig()
+        theta = [q[3], q[4], q[5]]
+        rotMat = mathUtils.euler_zyx_mat(theta)
+        return [rotMat, [q[0], q[1], q[2]]]
+
+    def setAltitude(self, alt):
+        if 2 in self._index:
+            self._q[self._index.index(2)] = alt
+        else:
+            self._qFull[2] = alt
+        self._dirty = True
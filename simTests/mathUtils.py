@@ -1,22 +1,51 @@
 import math
 from klampt.math import so3
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 ##Author: Saurav Agarwal
 ##E-mail: sagarw10@uncc.edu
 
+## Conventions
+## theta = (rz, ry, rx) are the zyx Euler angles of the floating base (config entries 3, 4, 5 of the robots).
+## The rotation is R = Rz(rz)*Ry(ry)*Rx(rx), the same as so3.from_rpy((rx, ry, rz)).
+## Rotation matrices are 9-lists in the column major order of klampt.math.so3.
+## The batched functions take (N x 3) arrays of angles and return (N x 9) or (N x 3 x 3) NumPy arrays (requires NumPy).
+
+## Below this value of |cos(ry)| the Euler angles are at a singularity (gimbal lock)
+SINGULAR_EPS = 1e-9
+
 ## Get rotation matrix from zyx Euler angles
 def euler_zyx_mat(theta):
+    """For the zyx euler angles theta=(rz,ry,rx), returns the rotation matrix
+    Rz*Ry*Rx in klampt so3 (column major) order"""
+    c0 = math.cos(theta[0])
+    s0 = math.sin(theta[0])
+    c1 = math.cos(theta[1])
+    s1 = math.sin(theta[1])
+    c2 = math.cos(theta[2])
+    s2 = math.sin(theta[2])
+    #R = [ c0c1  c0s1s2-s0c2  c0s1c2+s0s2 ]
+    #    [ s0c1  s0s1s2+c0c2  s0s1c2-c0s2 ]
+    #    [ -s1   c1s2         c1c2        ]
+    return [c0*c1, s0*c1, -s1, c0*s1*s2-s0*c2, s0*s1*s2+c0*c2, c1*s2, c0*s1*c2+s0*s2, s0*s1*c2-c0*s2, c1*c2]
+
+## Get zyx Euler angles from a rotation matrix
+def euler_zyx_from_mat(R):
+    """Inverse of euler_zyx_mat, ry in [-pi/2, pi/2]. At the singularity (ry = +-pi/2) rx is set to 0"""
+    c1 = math.sqrt(R[0]*R[0] + R[1]*R[1])
+    ry = math.atan2(-R[2], c1)
+    if c1 < SINGULAR_EPS:
+        return [math.atan2(-R[3], R[4]), ry, 0.0]
+    return [math.atan2(R[1], R[0]), ry, math.atan2(R[5], R[8])]
+
+## Get the Euler angle rate matrix
+def euler_zyx_rate_mat(theta):
     """For the zyx euler angles theta=(rz,ry,rx), produces a matrix A such that
     A*dtheta is the angular velocities when dtheta is the rate of change of the
     euler angles"""
-    eu = [0,0,1]
-    ev = [0,1,0]
-    ew = [1,0,0]
-    Ru = so3.rotation([0,0,1],theta[0])
-    Rv = so3.rotation([0,1,0],theta[1])
-    col1 = eu
-    col2 = so3.apply(Ru,ev)
-    col3 = so3.apply(Ru,so3.apply(Rv,ew))
     #col1 = [0,0,1]
     #col2 = [c0 -s0 0] [0] = [-s0]
     #       [s0 c0  0]*[1]   [c0 ]
@@ -24,29 +53,24 @@ def euler_zyx_mat(theta):
     #col3 = Ru*[c1  0 s1] [1] = Ru*[c1 ] = [c1c0]
     #          [0   1 0 ]*[0]      [0  ]   [c1s0]
     #          [-s1 0 c1] [0]      [-s1]   [-s1 ]
-    #A = [ 0 -s0 c1c0]
-    #    [ 0  c0 c1s0]
-    #    [ 1  0  -s1 ]    
-    #return [col1[2], col2[2], col3[2], col1[1], col2[1], col3[1], col1[0], col2[0], col3[0]]
-    phi = theta[0]
-    tht = theta[1]
-    psi = theta[2]
-    cphi = math.cos(phi)
-    sphi = math.sin(phi)
-    ctht = math.cos(tht)
-    stht = math.sin(tht)
-    cpsi = math.cos(psi)
-    spsi = math.sin(psi)
-    rotMat = [cphi*ctht, sphi*cpsi+cphi*stht*spsi, sphi*spsi-cphi*stht*cpsi, -sphi*ctht, cphi*cpsi-sphi*stht*spsi, cphi*spsi+sphi*stht*cpsi, stht,-spsi*ctht, cpsi*ctht]
-    return rotMat
-
-## The function below is incomplete
-def euler_zyx_mat_inv(theta):
-    """Returns the inverse of the matrix returned by the above procedure"""
     c0 = math.cos(theta[0])
     s0 = math.sin(theta[0])
     c1 = math.cos(theta[1])
     s1 = math.sin(theta[1])
+    return [[0, -s0, c1*c0],
+            [0, c0, c1*s0],
+            [1, 0, -s1]]
+
+def euler_zyx_mat_inv(theta, eps = SINGULAR_EPS):
+    """Returns the inverse of the matrix returned by euler_zyx_rate_mat.
+    Near the singularity (|cos(ry)| < eps), cos(ry) is replaced by +-eps so
+    that the result stays finite"""
+    c0 = math.cos(theta[0])
+    s0 = math.sin(theta[0])
+    c1 = math.cos(theta[1])
+    s1 = math.sin(theta[1])
+    if abs(c1) < eps:
+        c1 = eps if c1 >= 0 else -eps
     #A = [ 0 -s0 c1c0]
     #    [ 0  c0 c1s0]
     #    [ 1  0  -s1 ]
@@ -54,12 +78,120 @@ def euler_zyx_mat_inv(theta):
     #A^-1 = 1/c1*[ s1c0 s0s1 c1  ]
     #            [-c1s0 c1c0 0   ]
     #            [ c0   s0   0   ]
-    #A^-1*A = 1/c1*[c1 -s0s1c0+c0s0s1 s1c1c0^2+s1c1s0^2-c1s1 ] = [1 0 0]
-    #              [0   c1s0^2+c1c0^2 -c0c1^2s0+s0c1^2c0     ]   [0 1 0]
-    #              [0   -s0c0+s0c0    c1c0^2+c1s0^2          ]   [0 0 1]
-    sec1 = 1.0/c1
-    return [[c0*s1/c1,s0*s1/c1,1],
-            [-s0,c0,0],
-            [c0/c1,s0/c1,0]]
+    return [[c0*s1/c1, s0*s1/c1, 1],
+            [-s0, c0, 0],
+            [c0/c1, s0/c1, 0]]
+
+## Batched versions (NumPy)
+
+def _angles(thetas):
+    thetas = np.asarray(thetas, dtype=float)
+    return thetas.reshape(-1, 3)
+
+def euler_zyx_mats(thetas):
+    """(N x 3) zyx Euler angles to (N x 9) rotation matrices in so3 order"""
+    t = _angles(thetas)
+    c = np.cos(t)
+    s = np.sin(t)
+    c0,c1,c2 = c[:, 0], c[:, 1], c[:, 2]
+    s0,s1,s2 = s[:, 0], s[:, 1], s[:, 2]
+    R = np.empty((len(t), 9))
+    R[:, 0] = c0*c1
+    R[:, 1] = s0*c1
+    R[:, 2] = -s1
+    R[:, 3] = c0*s1*s2 - s0*c2
+    R[:, 4] = s0*s1*s2 + c0*c2
+    R[:, 5] = c1*s2
+    R[:, 6] = c0*s1*c2 + s0*s2
+    R[:, 7] = s0*s1*c2 - c0*s2
+    R[:, 8] = c1*c2
+    return R
+
+def euler_zyx_from_mats(R):
+    """(N x 9) rotation matrices in so3 order to (N x 3) zyx Euler angles, ry in [-pi/2, pi/2]
+    At the singularity (ry = +-pi/2) only rz - rx (or rz + rx) is defined, rx is set to 0"""
+    R = np.asarray(R, dtype=float).reshape(-1, 9)
+    c1 = np.hypot(R[:, 0], R[:, 1])
+    singular = c1 < SINGULAR_EPS
+    thetas = np.empty((len(R), 3))
+    thetas[:, 1] = np.arctan2(-R[:, 2], c1)
+    thetas[:, 0] = np.where(singular, np.arctan2(-R[:, 3], R[:, 4]), np.arctan2(R[:, 1], R[:, 0]))
+    thetas[:, 2] = np.where(singular, 0.0, np.arctan2(R[:, 5], R[:, 8]))
+    return thetas
+
+def euler_zyx_rate_mats(thetas):
+    """(N x 3 x 3) Euler angle rate matrices, see euler_zyx_rate_mat"""
+    t = _angles(thetas)
+    c0 = np.cos(t[:, 0])
+    s0 = np.sin(t[:, 0])
+    c1 = np.cos(t[:, 1])
+    s1 = np.sin(t[:, 1])
+    A = np.zeros((len(t), 3, 3))
+    A[:, 0, 1] = -s0
+    A[:, 0, 2] = c1*c0
+    A[:, 1, 1] = c0
+    A[:, 1, 2] = c1*s0
+    A[:, 2, 0] = 1
+    A[:, 2, 2] = -s1
+    return A
+
+def euler_zyx_rate_mats_inv(thetas, eps = SINGULAR_EPS):
+    """(N x 3 x 3) inverses of the Euler angle rate matrices, and the (N) mask of the singular angles
+    |cos(ry)| is clamped to eps at the singular angles, see euler_zyx_mat_inv"""
+    t = _angles(thetas)
+    c0 = np.cos(t[:, 0])
+    s0 = np.sin(t[:, 0])
+    c1 = np.cos(t[:, 1])
+    s1 = np.sin(t[:, 1])
+    singular = np.abs(c1) < eps
+    c1 = np.where(singular, np.where(c1 >= 0, eps, -eps), c1)
+    Ainv = np.zeros((len(t), 3, 3))
+    Ainv[:, 0, 0] = c0*s1/c1
+    Ainv[:, 0, 1] = s0*s1/c1
+    Ainv[:, 0, 2] = 1
+    Ainv[:, 1, 0] = -s0
+    Ainv[:, 1, 1] = c0
+    Ainv[:, 2, 0] = c0/c1
+    Ainv[:, 2, 1] = s0/c1
+    return Ainv, singular
+
+def euler_zyx_rates_to_omegas(thetas, dthetas):
+    """(N x 3) angular velocities from the angles and their rates of change"""
+    return np.einsum("nij,nj->ni", euler_zyx_rate_mats(thetas), _angles(dthetas))
 
+def omegas_to_euler_zyx_rates(thetas, omegas, eps = SINGULAR_EPS):
+    """(N x 3) rates of change of the angles from the angular velocities, and the (N) mask of the singular angles"""
+    Ainv,singular = euler_zyx_rate_mats_inv(thetas, eps)
+    return np.einsum("nij,nj->ni", Ainv, _angles(omegas)), singular
 
+if __name__ == "__main__":
+    ## Timings and error magnitudes against klampt.math.so3 (the checks with assertions are in test_mathUtils.py)
+    import time
+    N = 100000
+    thetas = np.random.uniform(-math.pi, math.pi, (N, 3))
+    thetas[:, 1] *= 0.5
+    t0 = time.time()
+    R = euler_zyx_mats(thetas)
+    t1 = time.time()
+    Rs = [euler_zyx_mat(t) for t in thetas.tolist()]
+    t2 = time.time()
+    ref = np.array([so3.from_rpy((t[2], t[1], t[0])) for t in thetas[:1000].tolist()])
+    print('euler_zyx_mats: {0:.4f} s, euler_zyx_mat: {1:.4f} s for {2} angles'.format(t1 - t0, t2 - t1, N))
+    print('max error vs so3: batched {0:.2e}, scalar {1:.2e}'.format(np.abs(R[:1000] - ref).max(), np.abs(np.array(Rs[:1000]) - ref).max()))
+    back = euler_zyx_from_mats(R)
+    print('max error of the round trip: {0:.2e}'.format(np.abs(euler_zyx_mats(back) - R).max()))
+    gimbal = np.array([[0.3, math.pi/2, 0.2], [0.3, -math.pi/2, 0.2]])
+    print('max error of the round trip at the singularity: {0:.2e}'.format(np.abs(euler_zyx_mats(euler_zyx_from_mats(euler_zyx_mats(gimbal))) - euler_zyx_mats(gimbal)).max()))
+    A = euler_zyx_rate_mats(thetas)
+    Ainv,singular = euler_zyx_rate_mats_inv(thetas)
+    print('max error of A^-1*A - I: {0:.2e}'.format(np.abs(np.einsum("nij,njk->nik", Ainv, A) - np.eye(3)).max()))
+    ## Angular velocity from finite differences of the rotations: so3.moment(R1*R0^T)/dt
+    dt = 1e-6
+    dthetas = np.random.uniform(-1, 1, (10, 3))
+    omegas = euler_zyx_rates_to_omegas(thetas[:10], dthetas)
+    err = 0.0
+    for t,dtheta,w in zip(thetas[:10].tolist(), dthetas.tolist(), omegas):
+        R0 = euler_zyx_mat(t)
+        R1 = euler_zyx_mat([a + dt*b for a,b in zip(t, dtheta)])
+        err = max(err, np.abs(np.array(so3.moment(so3.mul(R1, so3.inv(R0))))/dt - w).max())
+    print('max error of the angular velocities vs finite differences: {0:.2e}'.format(err))
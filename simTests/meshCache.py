@@ -0,0 +1,321 @@
+#!/usr/bin/python
+
+## Binary cache of the meshes of the robots and terrains (requires NumPy)
+## Parsing the text meshes (.tri, .off) of mobile_robots/* and of the terrains is a large part of the load time
+## of short runs. The meshes are converted once to a binary file that can be memory-mapped:
+##   header (KMSH0001, number of vertices, number of triangles), vertices (float64 N x 3), triangles (int32 M x 3)
+## Every entry is named by the SHA-1 of its content (the source file for a terrain mesh, the mesh arrays for a link),
+## so identical meshes are stored once and a modified file never hits a stale entry.
+##  1. loadMesh: TriangleMesh of a .tri/.off file, from the cache
+##  2. loadRobot: replaces world.loadRobot. The robot is loaded once by Klampt (the reference), then its link meshes and
+##     self collision pairs are stored, keyed by the hash of the .rob file and of the meshes it references.
+##     Later loads read a copy of the .rob with placeholder meshes, set the link meshes from the cache and restore
+##     the self collision pairs (Klampt derives them from the link geometries at load time).
+##  3. readWorld: replaces world.readFile for the world files with robots and terrains only, otherwise calls readFile.
+## The cache files are opened read-only with mmap: forked workers (e.g. sweepRunner.py) share the pages of the
+## entries loaded by the parent process (see preload).
+## The cache folder is simTests/.meshcache, or the folder in the environment variable KLAMPT_MESH_CACHE.
+##
+## Execution (benchmark of the world load time with and without the cache, in fresh processes):
+##   python meshCache.py simpleWorld.xml [--repeat 11]
+
+import os
+import re
+import sys
+import mmap
+import json
+import struct
+import hashlib
+import xml.etree.ElementTree as ET
+import numpy as np
+from klampt import Geometry3D, TriangleMesh
+try:
+    from . import buildWorld as bW
+except (ImportError, ValueError):
+    import buildWorld as bW
+
+MAGIC = b"KMSH0001"
+_HEADER = struct.Struct("<8sII")
+
+## Entries read by this process: key -> (vertices, triangles) memory maps
+_meshes = {}
+## Robots loaded by this process: (file, modification time, size) -> (key, index of the entry)
+_robots = {}
+
+def cacheDir():
+    d = os.environ.get("KLAMPT_MESH_CACHE")
+    if not d:
+        d = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".meshcache")
+    if not os.path.isdir(d):
+        try:
+            os.makedirs(d)
+        except OSError:
+            ## Created by another worker in the meantime
+            if not os.path.isdir(d):
+                raise
+    return d
+
+def _hash(*chunks):
+    h = hashlib.sha1()
+    for c in chunks:
+        h.update(c)
+    return h.hexdigest()
+
+def _readBytes(fn):
+    with open(fn, "rb") as f:
+        return f.read()
+
+def _atomicWrite(fn, data):
+    ## Write to a temporary file and rename, so that a concurrent reader never sees a partial entry
+    tmp = fn + "." + str(os.getpid()) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.rename(tmp, fn)
+
+def writeMesh(key, vertices, triangles):
+    vertices = np.ascontiguousarray(vertices, dtype="<f8").reshape(-1, 3)
+    triangles = np.ascontiguousarray(triangles, dtype="<i4").reshape(-1, 3)
+    fn = os.path.join(cacheDir(), key + ".kmsh")
+    _atomicWrite(fn, _HEADER.pack(MAGIC, len(vertices), len(triangles)) + vertices.tobytes() + triangles.tobytes())
+
+def readMesh(key):
+    ## (vertices, triangles) of an entry as read-only memory maps, None if the entry does not exist
+    if key in _meshes:
+        return _meshes[key]
+    fn = os.path.join(cacheDir(), key + ".kmsh")
+    if not os.path.isfile(fn):
+        return None
+    with open(fn, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic,nV,nT = _HEADER.unpack(buf[:_HEADER.size])
+    if magic != MAGIC or len(buf) != _HEADER.size + 24*nV + 12*nT:
+        return None
+    vertices = np.frombuffer(buf, dtype="<f8", count=3*nV, offset=_HEADER.size).reshape(nV, 3)
+    triangles = np.frombuffer(buf, dtype="<i4", count=3*nT, offset=_HEADER.size + 24*nV).reshape(nT, 3)
+    _meshes[key] = (vertices, triangles)
+    return _meshes[key]
+
+def _readTri(fn):
+    ## Klampt .tri file: number of vertices, vertices, number of triangles, triangles
+    with open(fn) as f:
+        tokens = f.read().split()
+    nV = int(tokens[0])
+    vertices = np.array(tokens[1:1 + 3*nV], dtype=float).reshape(-1, 3)
+    nT = int(tokens[1 + 3*nV])
+    triangles = np.array(tokens[2 + 3*nV:2 + 3*nV + 3*nT], dtype=np.int32).reshape(-1, 3)
+    return vertices, triangles
+
+def parseMesh(fn):
+    ## (vertices, triangles) of a .tri or .off file
+    if fn.lower().endswith(".tri"):
+        return _readTri(fn)
+    if fn.lower().endswith(".off"):
+        vertices,triangles = bW._readOFF(fn)
+        return np.array(vertices, dtype=float).reshape(-1, 3), np.array(triangles, dtype=np.int32).reshape(-1, 3)
+    raise ValueError("Unsupported mesh file "+fn)
+
+def makeMesh(vertices, triangles):
+    mesh = TriangleMesh()
+    bW._setMesh(mesh, vertices, triangles)
+    return mesh
+
+def meshArrays(fn):
+    ## (vertices, triangles) of a .tri/.off file, parsed only if its content is not in the cache
+    key = _hash(_readBytes(fn))
+    entry = readMesh(key)
+    if entry is None:
+        vertices,triangles = parseMesh(fn)
+        writeMesh(key, vertices, triangles)
+        entry = readMesh(key)
+    return entry
+
+def loadMesh(fn):
+    ## TriangleMesh of a .tri/.off file, from the cache
+    return makeMesh(*meshArrays(fn))
+
+def _robotGeometryFiles(fn, text):
+    ## Mesh files referenced by the geometry line of a .rob file
+    m = re.search(r'^geometry\s+(.*)$', text, re.M)
+    if m is None:
+        return []
+    return [os.path.join(os.path.dirname(fn), f) for f in re.findall(r'"([^"]*)"', m.group(1)) if f]
+
+## Placeholder meshes of the links in the copies of the .rob files, replaced by the cached meshes after the load.
+## Klampt only binds a geometry to the links that have a mesh file, and shares the geometries loaded from the same
+## file until one of them is set: every link gets its own placeholder file (placeholder<link>.off) and its mesh is
+## set right after the load of the robot.
+_PLACEHOLDER = b"OFF\n3 1 0\n0 0 0\n0.001 0 0\n0 0.001 0\n3 0 1 2\n"
+
+def _placeholder(i):
+    return "placeholder" + str(i) + ".off"
+
+def _strippedRob(text):
+    ## Copy of the .rob file with the placeholder meshes (geomscale is already applied to the cached meshes)
+    def blank(m):
+        files = re.findall(r'"([^"]*)"', m.group(1))
+        return "geometry\t" + " ".join('"'+_placeholder(i)+'"' if f else '""' for i,f in enumerate(files))
+    text = re.sub(r'^geometry\s+(.*)$', blank, text, flags=re.M)
+    return re.sub(r'^geomscale\s+.*$', "", text, flags=re.M)
+
+def _hasPlaceholders(d, links):
+    return all(os.path.isfile(os.path.join(d, _placeholder(i))) for i,k in links)
+
+def _cacheable(text):
+    ## Only the .rob files whose other lines do not refer to files can be loaded from a copy in the cache folder
+    return re.search(r'^\s*(include|mount|geomtransform|urdf)\b', text, re.M) is None
+
+def _loadReference(world, fn, key):
+    ## Load the robot with Klampt and store its link meshes and self collision pairs
+    robot = world.loadRobot(fn)
+    if robot.index < 0:
+        raise RuntimeError("Unable to load robot "+fn)
+    links = []
+    for i in range(robot.numLinks()):
+        g = robot.link(i).geometry()
+        if g.empty():
+            continue
+        if g.type() != "TriangleMesh":
+            return robot
+        mesh = g.getTriangleMesh()
+        vertices = np.array(mesh.vertices, dtype=float).reshape(-1, 3)
+        triangles = np.array(mesh.indices, dtype=np.int32).reshape(-1, 3)
+        meshKey = _hash(vertices.astype("<f8").tobytes(), triangles.astype("<i4").tobytes())
+        if readMesh(meshKey) is None:
+            writeMesh(meshKey, vertices, triangles)
+        links.append([i, meshKey])
+    n = robot.numLinks()
+    pairs = [[i, j] for i in range(n) for j in range(i+1, n) if robot.selfCollisionEnabled(i, j)]
+    d = cacheDir()
+    for i,k in links:
+        if not os.path.isfile(os.path.join(d, _placeholder(i))):
+            _atomicWrite(os.path.join(d, _placeholder(i)), _PLACEHOLDER)
+    _atomicWrite(os.path.join(d, key + ".rob"), _strippedRob(_readBytes(fn).decode("utf-8")).encode("utf-8"))
+    _atomicWrite(os.path.join(d, key + ".json"), json.dumps({"name": robot.getName(), "links": links, "pairs": pairs}).encode("utf-8"))
+    return robot
+
+def loadRobot(world, fn):
+    ## Same as world.loadRobot(fn), with the meshes from the cache
+    ## Klampt shares the meshes of the robots loaded from the same file in a process, so the cache mostly saves
+    ## the parsing of the first load in every process (e.g. in the workers of sweepRunner.py)
+    st = os.stat(fn)
+    d = cacheDir()
+    if (fn, st.st_mtime, st.st_size) in _robots:
+        key,entry = _robots[(fn, st.st_mtime, st.st_size)]
+    else:
+        text = _readBytes(fn)
+        if not _cacheable(text.decode("utf-8")):
+            return world.loadRobot(fn)
+        files = _robotGeometryFiles(fn, text.decode("utf-8"))
+        key = _hash(text, *[_readBytes(f) for f in files])
+        index = os.path.join(d, key + ".json")
+        if not os.path.isfile(index):
+            return _loadReference(world, fn, key)
+        with open(index) as f:
+            entry = json.load(f)
+    meshes = [(i, readMesh(k)) for i,k in entry["links"]]
+    if any(m is None for i,m in meshes) or not _hasPlaceholders(d, entry["links"]):
+        return _loadReference(world, fn, key)
+    _robots[(fn, st.st_mtime, st.st_size)] = (key, entry)
+    robot = world.loadRobot(os.path.join(d, key + ".rob"))
+    if robot.index < 0:
+        raise RuntimeError("Unable to load robot "+fn)
+    robot.setName(entry["name"])
+    for i,(vertices,triangles) in meshes:
+        robot.link(i).geometry().setTriangleMesh(makeMesh(vertices, triangles))
+    ## Places the new geometries at the link transforms
+    robot.setConfig(robot.getConfig())
+    ## Klampt enables the self collision pairs from the geometry of the links, the pairs of the reference are restored
+    pairs = set((i, j) for i,j in entry["pairs"])
+    n = robot.numLinks()
+    for i in range(n):
+        for j in range(i+1, n):
+            robot.enableSelfCollision(i, j, (i, j) in pairs)
+    return robot
+
+def _floats(s, n):
+    v = [float(x) for x in s.split()]
+    return v * n if len(v) == 1 else v
+
+def readWorld(world, fn):
+    ## Same as world.readFile(fn) for the world files that only contain robots and terrains (e.g. simpleWorld.xml)
+    ## Any other element or attribute falls back to world.readFile
+    if not fn.lower().endswith(".xml"):
+        return world.readFile(fn)
+    try:
+        root = ET.parse(fn).getroot()
+    except ET.ParseError:
+        return world.readFile(fn)
+    known = {"robot": set(["name", "file", "config"]), "terrain": set(["name", "file", "scale", "translation"])}
+    elements = list(root)
+    for e in elements:
+        if e.tag not in known or not set(e.attrib.keys()) <= known[e.tag]:
+            return world.readFile(fn)
+        f = e.attrib.get("file", "")
+        if e.tag == "terrain" and not f.lower().endswith((".tri", ".off")):
+            return world.readFile(fn)
+    base = os.path.dirname(fn)
+    for e in elements:
+        path = os.path.join(base, e.attrib["file"])
+        if e.tag == "robot":
+            robot = loadRobot(world, path)
+            if "name" in e.attrib:
+                robot.setName(e.attrib["name"])
+            if "config" in e.attrib:
+                ## Klampt config string: number of entries followed by the entries
+                q = [float(x) for x in e.attrib["config"].split()]
+                robot.setConfig(q[1:1 + int(q[0])])
+        else:
+            vertices,triangles = meshArrays(path)
+            if "scale" in e.attrib:
+                vertices = vertices * np.array(_floats(e.attrib["scale"], 3))
+            if "translation" in e.attrib:
+                vertices = vertices + np.array(_floats(e.attrib["translation"], 3))
+            terrain = world.makeTerrain(e.attrib.get("name", "Terrain"+str(world.numTerrains())))
+            geom = Geometry3D()
+            geom.setTriangleMesh(makeMesh(vertices, triangles))
+            terrain.geometry().set(geom)
+            terrain.appearance().setColor(0.8, 0.6, 0.2, 1.0)
+    return True
+
+def preload(worldFiles):
+    ## Read the entries of the world files in this process, before forking workers that share them
+    from klampt import WorldModel
+    for fn in worldFiles:
+        readWorld(WorldModel(), fn)
+
+## Load time of a world in a fresh process (the meshes are parsed once per process by Klampt)
+_probe = """
+import sys, time
+from klampt import WorldModel
+import meshCache
+world = WorldModel()
+t = time.time()
+for fn in sys.argv[2:]:
+    if not (meshCache.readWorld(world, fn) if sys.argv[1] == "meshCache" else world.readFile(fn)):
+        raise RuntimeError("Unable to load model "+fn)
+print("time %f" % (time.time() - t))
+"""
+
+def loadTime(worldFiles, mode, repeat = 11):
+    ## Median of the world load time (s) over repeat fresh processes, mode: readFile or meshCache
+    import subprocess
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable, "-c", _probe, mode] + list(worldFiles), cwd=here, stderr=subprocess.STDOUT)
+        times.append(float([l for l in out.decode("utf-8").splitlines() if l.startswith("time ")][-1].split()[1]))
+    times.sort()
+    return times[len(times)//2]
+
+if __name__ == "__main__":
+    import argparse
+    from klampt import WorldModel
+    parser = argparse.ArgumentParser(description="World load time with and without the mesh cache")
+    parser.add_argument("world", nargs="+")
+    parser.add_argument("--repeat", type=int, default=11, help="processes per mode")
+    args = parser.parse_args()
+    worldFiles = [os.path.abspath(fn) for fn in args.world]
+    ## Fills the cache
+    preload(worldFiles)
+    for mode in ["readFile", "meshCache"]:
+        print('{0:>10}: {1:.2f} ms per load'.format(mode, 1000*loadTime(worldFiles, mode, args.repeat)))
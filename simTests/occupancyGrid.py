@@ -0,0 +1,263 @@
+#!/usr/bin/python
+
+## 2D occupancy grid and signed distance field of a world, for O(1) clearance queries of planar robots
+## The triangles of the terrains and rigid objects that lie in a band of heights [zmin, zmax] (by default above
+## the floor) are projected on the (x, y) plane and rasterized conservatively: a cell is occupied if any point of it
+## touches a triangle, so thin walls (e.g. the 0.01 m walls of buildWorld) are never missed.
+## The signed distance field is the distance from the centre of each free cell to the nearest occupied cell
+## (negative inside obstacles), computed with an exact two pass Euclidean distance transform in NumPy.
+## Queries take arrays of (x, y) and are vectorized. clearance() is a lower bound of the true distance to the obstacles,
+## so a robot of radius r is certainly free where clearance > r and only the other points need an exact collision query.
+## The grids can be cached on disk under a hash of the world files and of the parameters (see loadOrBuild).
+##
+## Execution:
+##   python occupancyGrid.py simpleWorld.xml [--resolution 0.05]
+
+import os
+import sys
+import math
+import hashlib
+import numpy as np
+
+def _meshTriangles(geom, T = None):
+    ## World coordinates of the triangles of a geometry, as an (M x 3 x 3) array
+    ## The elements of a group are in the frame of the group, T is the transform of the group
+    if geom.empty():
+        return np.zeros((0, 3, 3))
+    R,t = geom.getCurrentTransform() if T is None else T
+    if geom.type() == "Group":
+        parts = [_meshTriangles(geom.getElement(e), (R, t)) for e in range(geom.numElements())]
+        parts = [p for p in parts if len(p)]
+        return np.concatenate(parts) if parts else np.zeros((0, 3, 3))
+    if geom.type() != "TriangleMesh":
+        ## A geometry left out of the grid would leave its cells free, so it is an error
+        try:
+            geom = geom.convert("TriangleMesh")
+        except Exception:
+            raise ValueError("Unable to convert a geometry of type "+geom.type()+" to a TriangleMesh")
+    mesh = geom.getTriangleMesh()
+    vertices = np.array(mesh.vertices, dtype=float).reshape(-1, 3)
+    indices = np.array(mesh.indices, dtype=int).reshape(-1, 3)
+    ## Klampt rotations are stored column major
+    Rm = np.array(R, dtype=float).reshape(3, 3).T
+    vertices = vertices.dot(Rm.T) + np.array(t, dtype=float)
+    return vertices[indices]
+
+def worldTriangles(world, zmin = 0.001, zmax = 2.0, skipTerrains = []):
+    ## Triangles of all the terrains and rigid objects that intersect the band of heights [zmin, zmax]
+    parts = []
+    for i in range(world.numTerrains()):
+        if i in skipTerrains:
+            continue
+        parts.append(_meshTriangles(world.terrain(i).geometry()))
+    for i in range(world.numRigidObjects()):
+        parts.append(_meshTriangles(world.rigidObject(i).geometry()))
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return np.zeros((0, 3, 3))
+    tris = np.concatenate(parts)
+    z = tris[:, :, 2]
+    return tris[(z.max(axis=1) >= zmin) & (z.min(axis=1) <= zmax)]
+
+def _segmentDistance(px, py, a, b):
+    ## Distance from the points (px, py) to the segment ab
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    l2 = dx*dx + dy*dy
+    if l2 > 0:
+        u = np.clip(((px - a[0])*dx + (py - a[1])*dy)/l2, 0.0, 1.0)
+    else:
+        u = 0.0
+    return np.hypot(px - a[0] - u*dx, py - a[1] - u*dy)
+
+def _triangleDistance(px, py, tri):
+    ## Distance from the points (px, py) to the 2D triangle tri (3 x 2), 0 inside
+    a,b,c = tri
+    d = np.minimum(np.minimum(_segmentDistance(px, py, a, b), _segmentDistance(px, py, b, c)), _segmentDistance(px, py, c, a))
+    cross = lambda p, q: (q[0] - p[0])*(py - p[1]) - (q[1] - p[1])*(px - p[0])
+    s1 = cross(a, b)
+    s2 = cross(b, c)
+    s3 = cross(c, a)
+    inside = ((s1 >= 0) & (s2 >= 0) & (s3 >= 0)) | ((s1 <= 0) & (s2 <= 0) & (s3 <= 0))
+    return np.where(inside, 0.0, d)
+
+def _edt1d(occ):
+    ## Distance (in cells) along the last axis to the nearest True cell, inf if none
+    n = occ.shape[-1]
+    idx = np.arange(n)
+    big = 10*n + 10
+    last = np.where(occ, idx, -big)
+    last = np.maximum.accumulate(last, axis=-1)
+    nxt = np.where(occ, idx, 2*big)
+    nxt = np.minimum.accumulate(nxt[..., ::-1], axis=-1)[..., ::-1]
+    d = np.minimum(idx - last, nxt - idx).astype(float)
+    d[d >= big] = np.inf
+    return d
+
+def distanceTransform(occ, chunk = 64):
+    ## Exact Euclidean distance (in cells) from every cell to the nearest True cell of occ
+    ## First pass along x, second pass along y: d(y, x)^2 = min over y' of (y - y')^2 + g(y', x)^2
+    try:
+        from scipy import ndimage
+        if not occ.any():
+            return np.full(occ.shape, np.inf)
+        return ndimage.distance_transform_edt(~occ)
+    except ImportError:
+        pass
+    g2 = _edt1d(occ)**2
+    H = occ.shape[0]
+    ys = np.arange(H, dtype=float)
+    d2 = np.empty(occ.shape)
+    for start in range(0, H, chunk):
+        rows = ys[start:start + chunk]
+        dy2 = (rows[:, None] - ys[None, :])**2
+        d2[start:start + chunk] = np.min(dy2[:, :, None] + g2[None, :, :], axis=1)
+    return np.sqrt(d2)
+
+class occupancyGrid(object):
+    def __init__ (self, occ, origin, resolution):
+        ## occ[j, i] is the cell of x in [x0 + i*res, x0 + (i+1)*res], y in [y0 + j*res, y0 + (j+1)*res]
+        self.occ = occ
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.resolution = float(resolution)
+        self.sdf = None
+        self.computeSDF()
+
+    @staticmethod
+    def fromWorld(world, resolution = 0.05, zmin = 0.001, zmax = 2.0, bounds = None, skipTerrains = [], margin = 0.5):
+        ## Rasterize the world. bounds is (xmin, ymin, xmax, ymax), by default the bounding box of the obstacles plus margin
+        tris = worldTriangles(world, zmin, zmax, skipTerrains)
+        if bounds is None:
+            if len(tris):
+                xy = tris[:, :, :2].reshape(-1, 2)
+                bounds = (xy[:, 0].min() - margin, xy[:, 1].min() - margin, xy[:, 0].max() + margin, xy[:, 1].max() + margin)
+            else:
+                bounds = (-margin, -margin, margin, margin)
+        W = int(math.ceil((bounds[2] - bounds[0])/resolution))
+        H = int(math.ceil((bounds[3] - bounds[1])/resolution))
+        occ = np.zeros((H, W), dtype=bool)
+        ## A cell touches the triangle if its centre is within half a diagonal of it
+        halfDiag = 0.5*math.sqrt(2.0)*resolution
+        for tri in tris[:, :, :2]:
+            lo = tri.min(axis=0) - halfDiag
+            hi = tri.max(axis=0) + halfDiag
+            i0 = max(int(math.floor((lo[0] - bounds[0])/resolution)), 0)
+            j0 = max(int(math.floor((lo[1] - bounds[1])/resolution)), 0)
+            i1 = min(int(math.floor((hi[0] - bounds[0])/resolution)), W - 1)
+            j1 = min(int(math.floor((hi[1] - bounds[1])/resolution)), H - 1)
+            if i1 < i0 or j1 < j0:
+                continue
+            px = bounds[0] + (np.arange(i0, i1 + 1) + 0.5)*resolution
+            py = bounds[1] + (np.arange(j0, j1 + 1) + 0.5)*resolution
+            PX,PY = np.meshgrid(px, py)
+            occ[j0:j1 + 1, i0:i1 + 1] |= _triangleDistance(PX, PY, tri) <= halfDiag
+        return occupancyGrid(occ, bounds[:2], resolution)
+
+    def computeSDF(self):
+        ## Signed distance (m) between cell centres: positive in free cells, negative in occupied cells
+        res = self.resolution
+        if self.occ.any():
+            outside = distanceTransform(self.occ)
+            inside = distanceTransform(~self.occ) if not self.occ.all() else np.full(self.occ.shape, np.inf)
+            self.sdf = np.where(self.occ, -inside, outside) * res
+        else:
+            self.sdf = np.full(self.occ.shape, np.inf)
+
+    def _index(self, xs, ys):
+        i = np.floor((np.asarray(xs, dtype=float) - self.origin[0])/self.resolution).astype(int)
+        j = np.floor((np.asarray(ys, dtype=float) - self.origin[1])/self.resolution).astype(int)
+        valid = (i >= 0) & (j >= 0) & (i < self.occ.shape[1]) & (j < self.occ.shape[0])
+        return np.clip(i, 0, self.occ.shape[1] - 1), np.clip(j, 0, self.occ.shape[0] - 1), valid
+
+    def occupied(self, xs, ys):
+        ## True where the points are in an occupied cell or outside of the grid
+        i,j,valid = self._index(xs, ys)
+        return np.where(valid, self.occ[j, i], True)
+
+    def clearance(self, xs, ys, outside = 0.0):
+        ## Lower bound of the distance from the points to the obstacles (negative or 0 in occupied cells)
+        ## The distance between the centres is reduced by a cell diagonal: half for the query point, half for the obstacle
+        i,j,valid = self._index(xs, ys)
+        d = self.sdf[j, i] - math.sqrt(2.0)*self.resolution
+        d = np.where(self.occ[j, i], np.minimum(d, 0.0), d)
+        return np.where(valid, d, outside)
+
+    def isClear(self, xs, ys, radius):
+        ## True where a disc of the given radius is certainly free of obstacles
+        return self.clearance(xs, ys) > radius
+
+    def save(self, fn):
+        np.savez_compressed(fn, occ=self.occ, sdf=self.sdf, origin=np.array(self.origin), resolution=np.array(self.resolution))
+
+    @staticmethod
+    def load(fn):
+        data = np.load(fn)
+        grid = occupancyGrid.__new__(occupancyGrid)
+        grid.occ = data["occ"]
+        grid.sdf = data["sdf"]
+        grid.origin = tuple(float(v) for v in data["origin"])
+        grid.resolution = float(data["resolution"])
+        return grid
+
+def gridKey(worldFiles, params):
+    ## Hash of the content of the world files (and of the files they include) and of the parameters
+    h = hashlib.sha1()
+    for fn in worldFiles:
+        _hashFile(h, fn, set())
+    h.update(repr(sorted(params.items())).encode("utf-8"))
+    return h.hexdigest()
+
+def _hashFile(h, fn, seen):
+    ## The robot and mesh files referenced by a world file are included in the hash
+    fn = os.path.abspath(fn)
+    if fn in seen or not os.path.isfile(fn):
+        return
+    seen.add(fn)
+    with open(fn, "rb") as f:
+        data = f.read()
+    h.update(data)
+    if fn.endswith(".xml") or fn.endswith(".rob"):
+        import re
+        for ref in re.findall(br'file\s*=\s*"([^"]+)"', data) + re.findall(br'"([^"\s]+\.(?:rob|tri|off|obj|urdf|xml))"', data):
+            _hashFile(h, os.path.join(os.path.dirname(fn), ref.decode("utf-8")), seen)
+
+def loadOrBuild(world, worldFiles, params = {}, resolution = 0.05, zmin = 0.001, zmax = 2.0, bounds = None, skipTerrains = [], cacheDir = None):
+    ## Load the grid from the cache if the world files and the parameters have not changed, otherwise build and save it
+    ## params describes what was added to the world after loading the files (e.g. the arguments of buildWorld.getDoubleRoomDoor)
+    if cacheDir is None:
+        cacheDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".gridcache")
+    allParams = dict(params)
+    allParams.update({"resolution": resolution, "zmin": zmin, "zmax": zmax, "bounds": bounds, "skipTerrains": list(skipTerrains)})
+    fn = os.path.join(cacheDir, gridKey(worldFiles, allParams) + ".npz")
+    if os.path.isfile(fn):
+        return occupancyGrid.load(fn)
+    grid = occupancyGrid.fromWorld(world, resolution, zmin, zmax, bounds, skipTerrains)
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir)
+    grid.save(fn)
+    return grid
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from klampt import WorldModel
+    import buildWorld as bW
+    parser = argparse.ArgumentParser(description="Occupancy grid and signed distance field of a world")
+    parser.add_argument("world", nargs="+", help="world file(s)")
+    parser.add_argument("--resolution", type=float, default=0.05)
+    args = parser.parse_args()
+    world = WorldModel()
+    for fn in args.world:
+        if not world.readFile(fn):
+            raise RuntimeError("Unable to load model "+fn)
+    bW.getDoubleRoomDoor(world, 8, 8, 1)
+    t0 = time.time()
+    grid = loadOrBuild(world, args.world, {"getDoubleRoomDoor": (8, 8, 1)}, args.resolution)
+    t1 = time.time()
+    print('Grid {0} x {1} cells in {2:.3f} s, {3} occupied'.format(grid.occ.shape[1], grid.occ.shape[0], t1 - t0, int(grid.occ.sum())))
+    xs = np.random.uniform(-4, 4, 100000)
+    ys = np.random.uniform(-4, 4, 100000)
+    t0 = time.time()
+    c = grid.clearance(xs, ys)
+    t1 = time.time()
+    print('{0} clearance queries in {1:.4f} s, {2:.1f}% clear for a radius of 0.2 m'.format(len(xs), t1 - t0, 100.0*np.mean(c > 0.2)))
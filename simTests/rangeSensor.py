@@ -0,0 +1,276 @@
+#!/usr/bin/python
+
+## Analytic 2D range sensor (lidar) against the walls of buildWorld and worldGen
+## The walls added to a world are kept as oriented 2D segments (buildWorld.getWorldSegments): the four sides of
+## the footprint of every wall, with the z range of the wall. A sensor scans the horizontal plane z = height, only
+## the segments that cross this plane are kept (the window openings of worldGen leave gaps in z).
+## The beams of all the robots are cast in one batched NumPy pass (N robots x M beams x S segments), without any
+## call to the collision geometries of Klampt:
+##  1. Brute force: every beam is intersected with every segment, the rays are processed in chunks to bound the memory
+##  2. Uniform grid (cellSize): the segments are binned in the cells they may cross, and all the beams walk the
+##     cells in lockstep (Amanatides-Woo traversal); a beam stops at the first cell that holds a hit.
+##     The cost grows with the range of the beams instead of the number of walls (large worldGen layouts).
+## The poses are (N x 3) arrays of (x, y, yaw), the states of diffDriveFleet, or robotPoses(robots) for the wrappers.
+## The ranges are inf where no wall is closer than maxRange. Other robots are not seen by the beams.
+##
+## Execution (scans per second against the size of a maze, check against Geometry3D.rayCast):
+##   python rangeSensor.py --robots 1 10 100 --sizes 4 16 40
+
+import math
+import time
+import numpy as np
+try:
+    from . import buildWorld as bW
+except (ImportError, ValueError):
+    import buildWorld as bW
+
+def segmentArray(segments, height = None):
+    ## (S x 4) array of the (x0, y0, x1, y1) of the segments (x0, y0, x1, y1, zmin, zmax) that cross the plane z = height
+    segments = np.array(segments, dtype=float).reshape(-1, 6)
+    if height is not None:
+        segments = segments[(segments[:, 4] <= height) & (segments[:, 5] >= height)]
+    return np.ascontiguousarray(segments[:, :4])
+
+def _intersect(ox, oy, dx, dy, segs):
+    ## Distance along the rays o + t*d to the segments (inf if the ray misses the segment)
+    ## The arguments are broadcast against each other, segs has the (x0, y0, x1, y1) on its last axis
+    ex = segs[..., 2] - segs[..., 0]
+    ey = segs[..., 3] - segs[..., 1]
+    wx = segs[..., 0] - ox
+    wy = segs[..., 1] - oy
+    denom = dx*ey - dy*ex
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (wx*ey - wy*ex)/denom
+        u = (wx*dy - wy*dx)/denom
+    ## Parallel rays (denom = 0) give nan or inf, and fail the comparisons
+    return np.where((t >= 0) & (u >= 0) & (u <= 1), t, np.inf)
+
+class segmentGrid(object):
+    def __init__ (self, segments, cellSize, margin = 0.01):
+        ## segments: (S x 4) array of (x0, y0, x1, y1)
+        ## Every cell holds the segments whose bounding box overlaps it, in a table padded with a degenerate segment
+        self.cellSize = float(cellSize)
+        lo = np.minimum(segments[:, :2], segments[:, 2:]).min(axis=0) - margin if len(segments) else np.zeros(2)
+        hi = np.maximum(segments[:, :2], segments[:, 2:]).max(axis=0) + margin if len(segments) else np.ones(2)
+        self.origin = lo
+        self.nx = max(int(math.ceil((hi[0] - lo[0])/self.cellSize)), 1)
+        self.ny = max(int(math.ceil((hi[1] - lo[1])/self.cellSize)), 1)
+        self.segments = np.vstack([segments, np.zeros((1, 4))])
+        pad = len(segments)
+        i0,j0 = self._cell(np.minimum(segments[:, 0], segments[:, 2]), np.minimum(segments[:, 1], segments[:, 3]))
+        i1,j1 = self._cell(np.maximum(segments[:, 0], segments[:, 2]), np.maximum(segments[:, 1], segments[:, 3]))
+        ni = i1 - i0 + 1
+        counts = ni*(j1 - j0 + 1)
+        seg = np.repeat(np.arange(len(segments)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell = (j0[seg] + local//ni[seg])*self.nx + i0[seg] + local % ni[seg]
+        order = np.argsort(cell, kind="mergesort")
+        cell = cell[order]
+        seg = seg[order]
+        perCell = np.bincount(cell, minlength=self.nx*self.ny)
+        first = np.cumsum(perCell) - perCell
+        self.table = np.full((self.nx*self.ny, max(perCell.max() if len(cell) else 0, 1)), pad, dtype=np.intp)
+        self.table[cell, np.arange(len(cell)) - first[cell]] = seg
+
+    def _cell(self, xs, ys):
+        i = np.floor((xs - self.origin[0])/self.cellSize).astype(np.intp)
+        j = np.floor((ys - self.origin[1])/self.cellSize).astype(np.intp)
+        return np.clip(i, 0, self.nx - 1), np.clip(j, 0, self.ny - 1)
+
+    def inside(self, xs, ys):
+        return (xs >= self.origin[0]) & (xs < self.origin[0] + self.nx*self.cellSize) & \
+               (ys >= self.origin[1]) & (ys < self.origin[1] + self.ny*self.cellSize)
+
+    def cast(self, ox, oy, dx, dy, maxRange):
+        ## Distance of the first hit of the rays (1D arrays), inf if none within maxRange
+        ## The origins must be inside the grid
+        c = self.cellSize
+        ix,iy = self._cell(ox, oy)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stepX = np.where(dx > 0, 1, -1)
+            stepY = np.where(dy > 0, 1, -1)
+            tMaxX = np.where(dx != 0, (self.origin[0] + (ix + (dx > 0))*c - ox)/dx, np.inf)
+            tMaxY = np.where(dy != 0, (self.origin[1] + (iy + (dy > 0))*c - oy)/dy, np.inf)
+            tDeltaX = np.where(dx != 0, c/np.abs(dx), np.inf)
+            tDeltaY = np.where(dy != 0, c/np.abs(dy), np.inf)
+        ranges = np.full(len(ox), np.inf)
+        active = np.arange(len(ox))
+        while len(active):
+            segs = self.segments[self.table[iy*self.nx + ix]]
+            tHit = _intersect(ox[active, None], oy[active, None], dx[active, None], dy[active, None], segs).min(axis=1)
+            tExit = np.minimum(tMaxX, tMaxY)
+            ## A hit inside the current cell is the closest one: closer hits were in the cells already visited
+            hit = tHit <= tExit
+            ranges[active[hit]] = tHit[hit]
+            alongX = tMaxX < tMaxY
+            ix = ix + np.where(alongX, stepX, 0)
+            iy = iy + np.where(alongX, 0, stepY)
+            tMaxX = tMaxX + np.where(alongX, tDeltaX, 0)
+            tMaxY = tMaxY + np.where(alongX, 0, tDeltaY)
+            keep = ~hit & (tExit < maxRange) & (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+            active = active[keep]
+            ix = ix[keep]
+            iy = iy[keep]
+            tMaxX = tMaxX[keep]
+            tMaxY = tMaxY[keep]
+            stepX = stepX[keep]
+            stepY = stepY[keep]
+            tDeltaX = tDeltaX[keep]
+            tDeltaY = tDeltaY[keep]
+        ranges[ranges > maxRange] = np.inf
+        return ranges
+
+class rangeSensor(object):
+    def __init__ (self, segments, numBeams = 360, fov = 2*math.pi, maxRange = 10.0, height = 0.3, cellSize = None, chunk = 1 << 21):
+        ## segments: (x0, y0, x1, y1, zmin, zmax) of the walls (buildWorld.getWorldSegments)
+        ## The beams are spread evenly over fov, centered on the heading of the robot (local x)
+        ## height: z of the scan plane in the world; cellSize: use a uniform grid of this cell size (m)
+        ## chunk: elements (rays x segments) of a pass of the brute force
+        self.numBeams = numBeams
+        self.maxRange = float(maxRange)
+        self.height = height
+        self.chunk = chunk
+        if fov >= 2*math.pi:
+            self.angles = -math.pi + 2*math.pi*np.arange(numBeams)/numBeams
+        else:
+            self.angles = np.linspace(-0.5*fov, 0.5*fov, numBeams)
+        self.segments = segmentArray(segments, height)
+        self.grid = segmentGrid(self.segments, cellSize) if cellSize is not None and len(self.segments) else None
+
+    @staticmethod
+    def fromWorld(world, numBeams = 360, fov = 2*math.pi, maxRange = 10.0, height = 0.3, cellSize = None):
+        ## Sensor against the walls added to the world by buildWorld and worldGen.buildLayout
+        return rangeSensor(bW.getWorldSegments(world), numBeams, fov, maxRange, height, cellSize)
+
+    def rays(self, poses):
+        ## Origins and unit directions of all the beams, (N*M,) arrays
+        poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+        theta = (poses[:, 2, None] + self.angles[None, :]).ravel()
+        ox = np.repeat(poses[:, 0], self.numBeams)
+        oy = np.repeat(poses[:, 1], self.numBeams)
+        return ox, oy, np.cos(theta), np.sin(theta)
+
+    def _bruteForce(self, ox, oy, dx, dy):
+        ranges = np.empty(len(ox))
+        step = max(self.chunk//max(len(self.segments), 1), 1)
+        for start in range(0, len(ox), step):
+            s = slice(start, start + step)
+            ranges[s] = _intersect(ox[s, None], oy[s, None], dx[s, None], dy[s, None], self.segments).min(axis=1)
+        ranges[ranges > self.maxRange] = np.inf
+        return ranges
+
+    def scan(self, poses):
+        ## (N x M) ranges of the beams of the robots at poses (N x 3 array of (x, y, yaw))
+        ox,oy,dx,dy = self.rays(poses)
+        if not len(self.segments):
+            return np.full((len(ox)//self.numBeams, self.numBeams), np.inf)
+        if self.grid is None:
+            ranges = self._bruteForce(ox, oy, dx, dy)
+        else:
+            ## The beams that start outside the grid go through the brute force
+            ranges = np.empty(len(ox))
+            inside = self.grid.inside(ox, oy)
+            ranges[inside] = self.grid.cast(ox[inside], oy[inside], dx[inside], dy[inside], self.maxRange)
+            if not inside.all():
+                outside = ~inside
+                ranges[outside] = self._bruteForce(ox[outside], oy[outside], dx[outside], dy[outside])
+        return ranges.reshape(-1, self.numBeams)
+
+    def points(self, poses, ranges):
+        ## (N x M x 2) hit points of the beams in the world frame, nan where no wall was hit
+        ox,oy,dx,dy = self.rays(poses)
+        r = np.where(np.isinf(ranges), np.nan, ranges).ravel()
+        return np.stack([ox + r*dx, oy + r*dy], axis=1).reshape(-1, self.numBeams, 2)
+
+def robotPoses(robots):
+    ## (N x 3) poses (x, y, yaw) of the robot wrappers, from the local buffers (getTransform)
+    poses = np.empty((len(robots), 3))
+    for k,robot in enumerate(robots):
+        R,t = robot.getTransform()
+        ## so3 is column major: R[0], R[1] are the x and y of the local x axis
+        poses[k] = (t[0], t[1], math.atan2(R[1], R[0]))
+    return poses
+
+def _leafGeometries(geom):
+    ## Copies of the elements of a group geometry (recursively) in world coordinates, or [geom]
+    ## Geometry3D.rayCast does not return the closest hit of a group (e.g. the walls of getDoubleRoomDoor, merge=False)
+    if geom.type() != "Group":
+        return [geom]
+    from klampt import Geometry3D
+    from klampt.math import se3
+    T = geom.getCurrentTransform()
+    leaves = []
+    for i in range(geom.numElements()):
+        element = Geometry3D(geom.getElement(i))
+        element.setCurrentTransform(*se3.mul(T, element.getCurrentTransform()))
+        leaves.extend(_leafGeometries(element))
+    return leaves
+
+def _rayCastCheck(world, sensor, poses, num, rng):
+    ## Largest difference between the sensor and Geometry3D.rayCast on num random beams
+    ox,oy,dx,dy = sensor.rays(poses)
+    ranges = sensor.scan(poses).ravel()
+    geoms = []
+    for g in [world.rigidObject(i).geometry() for i in range(world.numRigidObjects())] + \
+             [world.terrain(i).geometry() for i in range(world.numTerrains())]:
+        geoms.extend(_leafGeometries(g))
+    worst = 0.0
+    for k in rng.choice(len(ox), num, replace=False):
+        s = [ox[k], oy[k], sensor.height]
+        d = [dx[k], dy[k], 0.0]
+        best = np.inf
+        for g in geoms:
+            hit,pt = g.rayCast(s, d)
+            if hit:
+                best = min(best, math.hypot(pt[0] - s[0], pt[1] - s[1]))
+        if best > sensor.maxRange:
+            best = np.inf
+        if np.isinf(best) != np.isinf(ranges[k]):
+            worst = np.inf
+        elif not np.isinf(best):
+            worst = max(worst, abs(best - ranges[k]))
+    return worst
+
+if __name__ == "__main__":
+    import argparse
+    from klampt import WorldModel
+    try:
+        from . import worldGen
+    except (ImportError, ValueError):
+        import worldGen
+    parser = argparse.ArgumentParser(description="Benchmark of the analytic range sensor")
+    parser.add_argument("--robots", type=int, nargs="+", default=[1, 10, 100], help="numbers of robots scanning together")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 16, 40], help="sizes of the mazes (cells of 1 m)")
+    parser.add_argument("--beams", type=int, default=360)
+    parser.add_argument("--range", type=float, default=10.0, help="maximum range (m)")
+    parser.add_argument("--cell", type=float, default=1.0, help="cell size of the grid (m)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", type=int, default=50, help="beams checked against Geometry3D.rayCast")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    print('{0:>6} {1:>8} {2:>7} {3:>14} {4:>14} {5:>14}'.format("maze", "segments", "robots", "brute (scan/s)", "grid (scan/s)", "max error (m)"))
+    for size in args.sizes:
+        world = WorldModel()
+        worldGen.buildLayout(world, worldGen.mazeWalls(args.seed, size, size, 1.0, 1.0), "maze")
+        brute = rangeSensor.fromWorld(world, args.beams, maxRange=args.range)
+        grid = rangeSensor.fromWorld(world, args.beams, maxRange=args.range, cellSize=args.cell)
+        for num in args.robots:
+            ## Robots at the centers of random cells of the maze
+            poses = np.column_stack([rng.randint(0, size, num) + 0.5, rng.randint(0, size, num) + 0.5, rng.uniform(-math.pi, math.pi, num)])
+            rates = []
+            for sensor in (brute, grid):
+                sensor.scan(poses)
+                t0 = time.time()
+                for r in range(args.repeat):
+                    sensor.scan(poses)
+                rates.append(args.repeat*num/(time.time() - t0))
+            ## Brute force against the grid (the misses must match), and the grid against Geometry3D.rayCast
+            rb = brute.scan(poses)
+            rg = grid.scan(poses)
+            error = np.abs(np.where(np.isinf(rb), 0.0, rb) - np.where(np.isinf(rg), 0.0, rg)).max()
+            if (np.isinf(rb) != np.isinf(rg)).any():
+                error = np.inf
+            error = max(error, _rayCastCheck(world, grid, poses, min(args.check, num*args.beams), rng))
+            print('{0:>6} {1:>8} {2:>7} {3:>14.1f} {4:>14.1f} {5:>14.2e}'.format(size, len(brute.segments), num, rates[0], rates[1], error))
@@ -0,0 +1,613 @@
+#!/usr/bin/python
+
+## Sampling-based motion planning (lazy PRM, RRT-Connect) in the config spaces of the robot wrappers
+## kobuki, turtlebot: (x, y, yaw). An edge turns in place, drives straight (forwards or backwards) and turns again,
+##   so that a differential drive robot can follow it with velControlKin.
+## sphero: (x, y, z, zyx Euler angles), straight edges.
+## The configs of the roadmap are checked when it is built. The edges are only checked when the path of a query
+## uses them (lazy PRM), all the edges of a path in one batch, and the result is kept in the roadmap.
+## The checks go through check() of batchValidity.py: worldValidity on the world and collision checkers of this
+## process, or a validityChecker pool.
+## Nearest neighbours: k-d tree of scipy.spatial if available, otherwise kdTree (NumPy), on an embedding of the
+## configs where an angle a becomes angleWeight*(cos a, sin a).
+## The roadmaps are saved in simTests/.roadmapcache under a hash of the world files (with the robot and mesh files
+## they include), the robot type and the parameters (see loadOrBuild). save() adds the edges checked by the queries.
+## When the roadmap has no path, RRT-Connect searches between the start and the goal and its path is added to the roadmap.
+##
+## Execution (random queries, from this folder):
+##   python roadmapPlanner.py kob.xml --robot kobuki --nodes 1000 --queries 1000
+
+import os
+import math
+import time
+import heapq
+import argparse
+import numpy as np
+try:
+    from . import headlessSim
+    from .occupancyGrid import gridKey
+except (ImportError, ValueError):
+    import headlessSim
+    from occupancyGrid import gridKey
+
+def _wrap(a):
+    ## Angles in [-pi, pi)
+    return (a + math.pi) % (2*math.pi) - math.pi
+
+class configSpace(object):
+    def __init__ (self, robotType, bounds = (-4, -4, 4, 4), zRange = (0.5, 0.5), angleWeight = 0.2, resolution = 0.02):
+        ## bounds: (xmin, ymin, xmax, ymax) of the sampled positions, zRange: heights of sphero
+        ## angleWeight: length (m) of one radian of rotation in the costs and distances
+        ## resolution: spacing of the configs checked along an edge (in cost units)
+        self.robotType = robotType
+        if robotType == "sphero":
+            self.lower = np.array([bounds[0], bounds[1], zRange[0], 0.0, 0.0, 0.0])
+            self.upper = np.array([bounds[2], bounds[3], zRange[1], 2*math.pi, 2*math.pi, 2*math.pi])
+            self.angles = [3, 4, 5]
+            self.diffDrive = False
+        elif robotType in ("kobuki", "turtlebot"):
+            self.lower = np.array([bounds[0], bounds[1], -math.pi])
+            self.upper = np.array([bounds[2], bounds[3], math.pi])
+            self.angles = [2]
+            self.diffDrive = True
+        else:
+            raise ValueError("Unknown robot type "+str(robotType))
+        self.dof = len(self.lower)
+        self.linear = [i for i in range(self.dof) if i not in self.angles]
+        self.angleWeight = float(angleWeight)
+        self.resolution = float(resolution)
+
+    def params(self):
+        ## Parameters of the space, for the cache key
+        return {"robotType": self.robotType, "lower": self.lower.tolist(), "upper": self.upper.tolist(),
+                "angleWeight": self.angleWeight, "resolution": self.resolution}
+
+    def sample(self, num, rng):
+        return rng.uniform(self.lower, self.upper, (num, self.dof))
+
+    def embed(self, q):
+        ## (N x dof) configs -> points whose Euclidean distance is a lower bound of the cost of the edges
+        q = np.atleast_2d(np.asarray(q, dtype=float))
+        w = self.angleWeight
+        return np.hstack([q[:, self.linear], w*np.cos(q[:, self.angles]), w*np.sin(q[:, self.angles])])
+
+    def _heading(self, a, b):
+        ## Yaw of the straight part of the diff drive edges, driving forwards or backwards (the smallest turns)
+        h = np.arctan2(b[:, 1] - a[:, 1], b[:, 0] - a[:, 0])
+        h0 = _wrap(h)
+        h1 = _wrap(h + math.pi)
+        first = np.minimum(h0, h1)
+        second = np.maximum(h0, h1)
+        turns = lambda d: np.abs(_wrap(d - a[:, 2])) + np.abs(_wrap(b[:, 2] - d))
+        return np.where(turns(second) < turns(first), second, first)
+
+    def cost(self, a, b):
+        ## Cost of the edges between the rows of a and b (length plus weighted rotation)
+        a = np.atleast_2d(np.asarray(a, dtype=float))
+        b = np.atleast_2d(np.asarray(b, dtype=float))
+        w = self.angleWeight
+        dist = np.sqrt(np.sum((b[:, self.linear] - a[:, self.linear])**2, axis=1))
+        if not self.diffDrive:
+            return dist + w*np.sum(np.abs(_wrap(b[:, self.angles] - a[:, self.angles])), axis=1)
+        d = self._heading(a, b)
+        turns = np.abs(_wrap(d - a[:, 2])) + np.abs(_wrap(b[:, 2] - d))
+        return np.where(dist > 1e-9, dist + w*turns, w*np.abs(_wrap(b[:, 2] - a[:, 2])))
+
+    def _pieces(self, a, b):
+        ## Straight motions (start, change, cost) of the edge from a to b
+        w = self.angleWeight
+        if not self.diffDrive:
+            delta = b - a
+            delta[self.angles] = _wrap(delta[self.angles])
+            return [(a, delta, self.cost(a, b)[0])]
+        dist = math.hypot(b[0] - a[0], b[1] - a[1])
+        if dist <= 1e-9:
+            turn = _wrap(b[2] - a[2])
+            return [(a, np.array([0.0, 0.0, turn]), w*abs(turn))]
+        d = self._heading(a[None, :], b[None, :])[0]
+        turn0 = _wrap(d - a[2])
+        turn1 = _wrap(b[2] - d)
+        mid = np.array([a[0], a[1], a[2] + turn0])
+        return [(a, np.array([0.0, 0.0, turn0]), w*abs(turn0)),
+                (mid, np.array([b[0] - a[0], b[1] - a[1], 0.0]), dist),
+                (np.array([b[0], b[1], mid[2]]), np.array([0.0, 0.0, turn1]), w*abs(turn1))]
+
+    def interpolate(self, a, b):
+        ## Configs along the edge from a to b, spaced by at most resolution (a and b included), and their cost from a
+        ## The edge from b to a goes through the same configs
+        a = np.asarray(a, dtype=float)
+        b = np.asarray(b, dtype=float)
+        swap = tuple(b) < tuple(a)
+        if swap:
+            a,b = b,a
+        points = [a[None, :]]
+        costs = [np.zeros(1)]
+        total = 0.0
+        for q0,dq,c in self._pieces(a, b):
+            if c <= 0:
+                continue
+            n = int(math.ceil(c/self.resolution))
+            t = np.arange(1, n + 1)/float(n)
+            points.append(q0[None, :] + t[:, None]*dq[None, :])
+            costs.append(total + c*t)
+            total += c
+        points = np.vstack(points)
+        points[-1] = b
+        points[:, self.angles] = _wrap(points[:, self.angles])
+        costs = np.concatenate(costs)
+        if swap:
+            return points[::-1].copy(), total - costs[::-1]
+        return points, costs
+
+    def steer(self, a, b, step):
+        ## Last config of the edge from a to b within a cost of step
+        points,costs = self.interpolate(a, b)
+        return points[np.searchsorted(costs, step, side="right") - 1]
+
+class kdTree(object):
+    ## k-d tree of the rows of points, with the query() of scipy.spatial.cKDTree
+    def __init__ (self, points, leafSize = 16):
+        self.data = np.asarray(points, dtype=float)
+        self.n = len(self.data)
+        self.leafSize = leafSize
+        self.index = np.arange(self.n)
+        ## Nodes: [start, end, split dimension (-1 for a leaf), split value, left child, right child]
+        self.nodes = []
+        if self.n:
+            self._build(0, self.n)
+
+    def _build(self, start, end):
+        node = len(self.nodes)
+        self.nodes.append([start, end, -1, 0.0, -1, -1])
+        if end - start <= self.leafSize:
+            return node
+        idx = self.index[start:end]
+        pts = self.data[idx]
+        dim = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+        self.index[start:end] = idx[np.argsort(pts[:, dim], kind="mergesort")]
+        mid = (start + end)//2
+        self.nodes[node][2] = dim
+        self.nodes[node][3] = self.data[self.index[mid], dim]
+        self.nodes[node][4] = self._build(start, mid)
+        self.nodes[node][5] = self._build(mid, end)
+        return node
+
+    def _query(self, x, k):
+        best = []
+        stack = [(0, 0.0)] if self.n else []
+        while stack:
+            node,bound = stack.pop()
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+            start,end,dim,value,left,right = self.nodes[node]
+            if dim < 0:
+                idx = self.index[start:end]
+                d2 = np.sum((self.data[idx] - x)**2, axis=1)
+                for j in np.argsort(d2)[:k]:
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2[j], idx[j]))
+                    elif d2[j] < -best[0][0]:
+                        heapq.heapreplace(best, (-d2[j], idx[j]))
+                    else:
+                        break
+                continue
+            diff = x[dim] - value
+            near,far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, max(bound, diff*diff)))
+            stack.append((near, bound))
+        best.sort(reverse=True)
+        d = [math.sqrt(-b[0]) for b in best] + [np.inf]*(k - len(best))
+        i = [b[1] for b in best] + [self.n]*(k - len(best))
+        return d, i
+
+    def query(self, x, k = 1):
+        ## Distances and indices of the k nearest rows of every row of x (inf and n when there are fewer rows)
+        x = np.asarray(x, dtype=float)
+        results = [self._query(p, k) for p in np.atleast_2d(x)]
+        d = np.array([r[0] for r in results])
+        i = np.array([r[1] for r in results], dtype=int)
+        if k == 1:
+            d,i = d[:, 0], i[:, 0]
+        if x.ndim == 1:
+            d,i = d[0], i[0]
+        return d, i
+
+def makeTree(points):
+    try:
+        from scipy.spatial import cKDTree
+        return cKDTree(points)
+    except ImportError:
+        return kdTree(points)
+
+def nearest(tree, points, k):
+    ## (M x k) distances and indices of the k nearest points of the tree
+    d,i = tree.query(np.atleast_2d(points), k)
+    return np.asarray(d).reshape(-1, k), np.asarray(i).reshape(-1, k)
+
+class _growingSet(object):
+    ## Nearest neighbour among points added one by one (trees of RRT): k-d tree of the first points,
+    ## linear search among the last ones, the tree is rebuilt when they are as many as the points of the tree
+    def __init__ (self, dim):
+        self.points = np.zeros((64, dim))
+        self.n = 0
+        self.tree = None
+        self.treeSize = 0
+
+    def add(self, p):
+        if self.n == len(self.points):
+            self.points = np.vstack([self.points, np.zeros_like(self.points)])
+        self.points[self.n] = p
+        self.n += 1
+        if self.n - self.treeSize > max(32, self.treeSize):
+            self.tree = makeTree(self.points[:self.n])
+            self.treeSize = self.n
+
+    def nearest(self, p):
+        best,bestD = -1, np.inf
+        if self.tree is not None:
+            d,i = nearest(self.tree, p, 1)
+            best,bestD = int(i[0, 0]), d[0, 0]
+        if self.n > self.treeSize:
+            d = np.sqrt(np.sum((self.points[self.treeSize:self.n] - p)**2, axis=1))
+            j = int(np.argmin(d))
+            if d[j] < bestD:
+                best = self.treeSize + j
+        return best
+
+class roadmap(object):
+    ## Configs (N x dof), undirected edges (E x 2, i < j), their costs and their status
+    ## (0: not checked, 1: free, -1: colliding)
+    def __init__ (self, space, nodes, edges, costs, status = None):
+        self.space = space
+        self.nodes = np.asarray(nodes, dtype=float).reshape(-1, space.dof)
+        self.edges = np.asarray(edges, dtype=int).reshape(-1, 2)
+        self.costs = np.asarray(costs, dtype=float)
+        self.status = np.zeros(len(self.edges), dtype=np.int8) if status is None else np.asarray(status, dtype=np.int8)
+        self.changed = False
+        self._reset()
+
+    def _reset(self):
+        self._tree = None
+        self._embedding = None
+        self._adjacency = None
+        self._edgeIndex = None
+
+    def embedding(self):
+        if self._embedding is None:
+            self._embedding = self.space.embed(self.nodes)
+        return self._embedding
+
+    def tree(self):
+        if self._tree is None:
+            self._tree = makeTree(self.embedding())
+        return self._tree
+
+    def adjacency(self):
+        ## Neighbours of every node: lists of (node, edge)
+        if self._adjacency is None:
+            self._adjacency = [[] for i in range(len(self.nodes))]
+            for e,(i,j) in enumerate(self.edges.tolist()):
+                self._adjacency[i].append((j, e))
+                self._adjacency[j].append((i, e))
+        return self._adjacency
+
+    def edgeIndex(self, i, j):
+        if self._edgeIndex is None:
+            self._edgeIndex = dict(((int(a), int(b)), e) for e,(a,b) in enumerate(self.edges))
+        return self._edgeIndex.get((min(i, j), max(i, j)))
+
+    def connect(self, configs, k, status = None):
+        ## Adds the configs and edges to their k nearest nodes (not checked), or between consecutive configs
+        ## when status is given (their status)
+        configs = np.atleast_2d(np.asarray(configs, dtype=float))
+        n = len(self.nodes)
+        new = np.arange(n, n + len(configs))
+        pairs = []
+        if n and k:
+            d,idx = nearest(self.tree(), self.space.embed(configs), min(k, n))
+            pairs += [(int(j), int(i)) for i,row in zip(new, idx) for j in row if j < n]
+        st = [0]*len(pairs)
+        if status is not None:
+            pairs += [(int(i), int(i) + 1) for i in new[:-1]]
+            st += [status]*(len(new) - 1)
+        self.nodes = np.vstack([self.nodes, configs])
+        if pairs:
+            pairs = np.array(pairs)
+            self.edges = np.vstack([self.edges, pairs])
+            self.costs = np.concatenate([self.costs, self.space.cost(self.nodes[pairs[:, 0]], self.nodes[pairs[:, 1]])])
+            self.status = np.concatenate([self.status, np.array(st, dtype=np.int8)])
+        self.changed = True
+        self._reset()
+        return new
+
+    def save(self, fn):
+        ## Written to a temporary file first, other processes may be reading fn
+        tmp = fn + ".{0}.tmp.npz".format(os.getpid())
+        np.savez(tmp, nodes=self.nodes, edges=self.edges, costs=self.costs, status=self.status)
+        os.rename(tmp, fn)
+        self.changed = False
+
+    @staticmethod
+    def load(fn, space):
+        data = np.load(fn)
+        return roadmap(space, data["nodes"], data["edges"], data["costs"], data["status"])
+
+class roadmapPlanner(object):
+    def __init__ (self, checker, space, rm = None):
+        ## checker: check(configs, stop) of batchValidity, space: configSpace of the robot
+        self.checker = checker
+        self.space = space
+        self.roadmap = rm
+        self.cacheFile = None
+
+    def build(self, numNodes = 1000, k = 10, seed = 0, batch = 1000):
+        ## Samples numNodes free configs and connects each one to its k nearest neighbours (edges not checked)
+        rng = np.random.RandomState(seed)
+        nodes = []
+        count = 0
+        tries = 0
+        while count < numNodes:
+            q = self.space.sample(batch, rng)
+            valid,pairs = self.checker.check(q)
+            nodes.append(q[valid])
+            count += int(valid.sum())
+            tries += 1
+            if count == 0 and tries == 10:
+                raise RuntimeError("No free config in {0} samples, first collision: {1}".format(tries*batch, pairs[0]))
+        nodes = np.vstack(nodes)[:numNodes]
+        rm = roadmap(self.space, nodes, np.zeros((0, 2)), [])
+        d,idx = nearest(rm.tree(), rm.embedding(), min(k + 1, len(nodes)))
+        i = np.repeat(np.arange(len(nodes)), idx.shape[1])
+        j = idx.reshape(-1)
+        keep = (j < len(nodes)) & (j != i)
+        pairs = np.unique(np.sort(np.column_stack([i[keep], j[keep]]), axis=1), axis=0)
+        rm.edges = pairs
+        rm.costs = self.space.cost(nodes[pairs[:, 0]], nodes[pairs[:, 1]])
+        rm.status = np.zeros(len(pairs), dtype=np.int8)
+        rm._reset()
+        self.roadmap = rm
+        return rm
+
+    def checkEdges(self, edges):
+        ## Checks the configs along the edges [(a, b), ...] in one batch, returns their status (1 or -1)
+        points = []
+        owners = []
+        for e,(a,b) in enumerate(edges):
+            p = self.space.interpolate(a, b)[0][1:-1]
+            points.append(p)
+            owners.append(np.full(len(p), e))
+        status = np.ones(len(edges), dtype=np.int8)
+        points = np.vstack(points)
+        if len(points):
+            valid,pairs = self.checker.check(points)
+            status[np.unique(np.concatenate(owners)[~valid])] = -1
+        return status
+
+    def _search(self, start, goal, configs, extra):
+        ## A* from start to goal on the edges of the roadmap that are not known to collide, and on the extra edges
+        ## of the query (node -> [(node, key, cost)]). Returns the list of (node, node, edge or key), or None
+        rm = self.roadmap
+        adjacency = rm.adjacency()
+        n = len(rm.nodes)
+        embedding = rm.embedding()
+        goalPoint = self.space.embed(configs(goal))[0]
+        h = np.sqrt(np.sum((embedding - goalPoint)**2, axis=1)).tolist() + [float(np.sqrt(np.sum((self.space.embed(configs(start))[0] - goalPoint)**2))), 0.0]
+        dist = {start: 0.0}
+        parent = {start: None}
+        heap = [(h[start], start)]
+        done = set()
+        while heap:
+            f,u = heapq.heappop(heap)
+            if u in done:
+                continue
+            if u == goal:
+                path = []
+                while parent[u] is not None:
+                    v,edge = parent[u]
+                    path.append((v, u, edge))
+                    u = v
+                return path[::-1]
+            done.add(u)
+            neighbours = [(v, e, rm.costs[e]) for v,e in adjacency[u] if rm.status[e] >= 0] if u < n else []
+            for v,e,c in neighbours + extra.get(u, []):
+                d = dist[u] + c
+                if v not in dist or d < dist[v]:
+                    dist[v] = d
+                    parent[v] = (u, e)
+                    heapq.heappush(heap, (d + h[v], v))
+        return None
+
+    def query(self, start, goal, k = 10, rrt = True, maxIter = 2000):
+        ## Path from start to goal (list of configs, both included), or None
+        ## start and goal are connected to their k nearest nodes. rrt: search with RRT-Connect if the roadmap has no path
+        start = np.asarray(start, dtype=float)
+        goal = np.asarray(goal, dtype=float)
+        if not self.checker.check([start, goal])[0].all():
+            return None
+        rm = self.roadmap
+        n = len(rm.nodes)
+        configs = lambda i: rm.nodes[i] if i < n else (start if i == n else goal)
+        ## Temporary edges of the query: start (n) and goal (n + 1) to their nearest nodes, and to each other
+        extra = {n: [], n + 1: []}
+        tempStatus = {}
+        d,idx = nearest(rm.tree(), self.space.embed([start, goal]), min(k, n))
+        for s,row in ((n, idx[0]), (n + 1, idx[1])):
+            for j in row:
+                if j < n:
+                    key = ("q", s, int(j))
+                    c = self.space.cost(configs(s), rm.nodes[j])[0]
+                    extra[s].append((int(j), key, c))
+                    extra.setdefault(int(j), []).append((s, key, c))
+        key = ("q", n, n + 1)
+        c = self.space.cost(start, goal)[0]
+        extra[n].append((n + 1, key, c))
+        extra[n + 1].append((n, key, c))
+        while True:
+            path = self._search(n, n + 1, configs, extra)
+            if path is None:
+                break
+            unchecked = [(u, v, e) for u,v,e in path if (tempStatus.get(e, 0) if isinstance(e, tuple) else rm.status[e]) == 0]
+            if unchecked:
+                status = self.checkEdges([(configs(u), configs(v)) for u,v,e in unchecked])
+                for (u,v,e),s in zip(unchecked, status):
+                    if isinstance(e, tuple):
+                        tempStatus[e] = s
+                    else:
+                        rm.status[e] = s
+                        rm.changed = True
+                if (status < 0).any():
+                    for s in extra:
+                        extra[s] = [t for t in extra[s] if tempStatus.get(t[1], 0) >= 0]
+                    continue
+            return [start] + [configs(v) for u,v,e in path]
+        if rrt:
+            path = self.rrtConnect(start, goal, maxIter)
+            if path is not None:
+                rm.connect(path, k, status=1)
+            return path
+        return None
+
+    def _extend(self, tree, target, step):
+        ## Adds to tree (configs, parents, nearest set) the config towards target within step, if the edge is free
+        configs,parents,near = tree
+        i = near.nearest(self.space.embed(target)[0])
+        q = self.space.steer(configs[i], target, step)
+        points = self.space.interpolate(configs[i], q)[0][1:]
+        if not len(points) or not self.checker.check(points, stop=True)[0].all():
+            return None
+        configs.append(q)
+        parents.append(i)
+        near.add(self.space.embed(q)[0])
+        return len(configs) - 1
+
+    def rrtConnect(self, start, goal, maxIter = 2000, step = 0.5, seed = 0):
+        ## Bidirectional RRT between two free configs, returns the path or None after maxIter samples
+        rng = np.random.RandomState(seed)
+        trees = []
+        for q in (start, goal):
+            near = _growingSet(len(self.space.embed(q)[0]))
+            near.add(self.space.embed(q)[0])
+            trees.append(([np.asarray(q, dtype=float)], [-1], near))
+        for it in range(maxIter):
+            a,b = trees[it % 2], trees[(it + 1) % 2]
+            new = self._extend(a, self.space.sample(1, rng)[0], step)
+            if new is None:
+                continue
+            target = a[0][new]
+            reached = None
+            while True:
+                j = self._extend(b, target, step)
+                if j is None:
+                    break
+                if self.space.cost(b[0][j], target)[0] <= 1e-9:
+                    reached = j
+                    break
+            if reached is not None:
+                branches = []
+                for tree,i in ((a, new), (b, reached)):
+                    branch = []
+                    while i >= 0:
+                        branch.append(tree[0][i])
+                        i = tree[1][i]
+                    branches.append(branch)
+                path = branches[0][::-1] + branches[1][1:]
+                return path if it % 2 == 0 else path[::-1]
+        return None
+
+    def shortcut(self, path, iterations = 50, seed = 0):
+        ## Replaces parts of the path by a direct edge when it is free and cheaper
+        rng = np.random.RandomState(seed)
+        path = list(path)
+        for it in range(iterations):
+            if len(path) < 3:
+                break
+            i,j = sorted(rng.choice(len(path), 2, replace=False))
+            if j - i < 2:
+                continue
+            points = self.space.interpolate(path[i], path[j])[0][1:-1]
+            if not len(points) or self.checker.check(points, stop=True)[0].all():
+                path = path[:i + 1] + path[j:]
+        return path
+
+    def densePath(self, path):
+        ## Configs along the edges of the path, spaced by the resolution of the space
+        points = [self.space.interpolate(a, b)[0][:-1] for a,b in zip(path[:-1], path[1:])]
+        return np.vstack(points + [np.asarray(path[-1])[None, :]])
+
+    def save(self):
+        ## Saves the roadmap to its cache file if queries have checked or added edges
+        if self.cacheFile is not None and self.roadmap.changed:
+            self.roadmap.save(self.cacheFile)
+
+def loadOrBuild(checker, worldFiles, space, params = {}, numNodes = 1000, k = 10, seed = 0, cacheDir = None):
+    ## Planner with the roadmap of the cache if the world files, the robot and the parameters have not changed,
+    ## otherwise with a new roadmap (saved to the cache)
+    ## params describes what was added to the world after loading the files and the collision options (as in occupancyGrid.loadOrBuild)
+    if cacheDir is None:
+        cacheDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".roadmapcache")
+    allParams = dict(params)
+    allParams.update(space.params())
+    allParams.update({"numNodes": numNodes, "k": k, "seed": seed})
+    fn = os.path.join(cacheDir, gridKey(worldFiles, allParams) + ".npz")
+    planner = roadmapPlanner(checker, space)
+    planner.cacheFile = fn
+    if os.path.isfile(fn):
+        planner.roadmap = roadmap.load(fn, space)
+        return planner
+    planner.build(numNodes, k, seed)
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir)
+    planner.roadmap.save(fn)
+    return planner
+
+if __name__ == "__main__":
+    try:
+        from .batchValidity import worldValidity, validityChecker
+    except (ImportError, ValueError):
+        from batchValidity import worldValidity, validityChecker
+    parser = argparse.ArgumentParser(description="Random start/goal queries on a cached roadmap")
+    parser.add_argument("world", nargs="+", help="world file(s)")
+    parser.add_argument("--robot", default="kobuki", choices=["sphero", "kobuki", "turtlebot"], help="robot wrapper (must match the world file)")
+    parser.add_argument("--room", default="door", choices=["door", "window", "none"], help="rooms added to the world")
+    parser.add_argument("--nodes", type=int, default=1000, help="configs of the roadmap")
+    parser.add_argument("--k", type=int, default=10, help="neighbours of every config")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1, help="check the configs with a validityChecker pool")
+    parser.add_argument("--proxy", default=None, choices=["hull", "spheres", "footprint"], help="collide simplified link geometries (see collisionProxy.py)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    world = headlessSim.loadWorld(args.world, args.room)
+    robot = headlessSim.makeRobot(world, args.robot)
+    robot.flush()
+    if args.proxy is not None:
+        from collisionProxy import applyProxies
+        applyProxies(world.robot(0), args.proxy)
+    if args.workers > 1:
+        checker = validityChecker(args.world, args.robot, args.room, args.workers, proxy=args.proxy)
+    else:
+        checker = worldValidity(world, robot)
+    space = configSpace(args.robot)
+
+    t = time.time()
+    planner = loadOrBuild(checker, args.world, space, {"room": args.room, "proxy": args.proxy}, args.nodes, args.k, args.seed)
+    rm = planner.roadmap
+    print('Roadmap of {0} configs and {1} edges ({2} checked) in {3:.3f} s'.format(len(rm.nodes), len(rm.edges), int((rm.status != 0).sum()), time.time() - t))
+
+    rng = np.random.RandomState(args.seed + 1)
+    samples = space.sample(4*args.queries, rng)
+    samples = samples[worldValidity(world, robot).check(samples)[0]]
+    pairs = list(zip(samples[0::2], samples[1::2]))[:args.queries]
+    for label in ("first pass", "second pass"):
+        t = time.time()
+        paths = [planner.query(s, g, args.k) for s,g in pairs]
+        elapsed = time.time() - t
+        found = [p for p in paths if p is not None]
+        print('{0}: {1} queries, {2} paths, {3:.2f} ms per query, {4} edges checked'.format(label, len(pairs), len(found),
+              1000*elapsed/max(len(pairs), 1), int((planner.roadmap.status != 0).sum())))
+    ## The dense paths must be free
+    dense = [planner.densePath(p) for p in found[:20]]
+    print('Configs along 20 paths free: {0}'.format(all(worldValidity(world, robot).check(p)[0].all() for p in dense)))
+    planner.save()
+    if args.workers > 1:
+        checker.close()
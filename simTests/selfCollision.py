@@ -0,0 +1,165 @@
+#!/usr/bin/python
+
+## Self collision checking with static link pruning and a temporal coherence cache
+## 1. Links connected by fixed joints (qmin = qmax, e.g. the welded sensors and casters of kobuki/turtlebot)
+##    form rigid clusters. Pairs of links in the same cluster can never move relative to each other and are
+##    dropped permanently. The pruned pairs are computed once per robot model and shared by all robots of that model.
+## 2. For the remaining pairs the separation distance is cached with the relative transform of the two links.
+##    A pair is only checked again when the relative motion since the last check may exceed that distance.
+##    If none of the joints between the links have moved (e.g. only the floating base moves), no query is run at all.
+## The class selfCollider has the same robotSelfCollisions function as collide.WorldCollider.
+
+from klampt.math import so3, vectorops
+
+## Pruned pairs per robot model
+_modelPairs = {}
+
+def _modelKey(robot):
+    ## Robots loaded from the same file share the key, whatever their names (e.g. the robots of fleetSim.py)
+    qmin,qmax = robot.getJointLimits()
+    links = [robot.link(i).getName() for i in range(robot.numLinks())]
+    parents = [robot.link(i).getParent() for i in range(robot.numLinks())]
+    geom = [robot.link(i).geometry().empty() for i in range(robot.numLinks())]
+    return (tuple(links), tuple(parents), tuple(qmin), tuple(qmax), tuple(geom))
+
+def _ancestors(parents, i):
+    chain = []
+    while i >= 0:
+        chain.append(i)
+        i = parents[i]
+    return chain
+
+def prunedPairs(robot):
+    ## Returns the link pairs (i, j) that can collide, and the DOFs between the two links of each pair
+    ## The result is cached per robot model
+    key = _modelKey(robot)
+    if key in _modelPairs:
+        return _modelPairs[key]
+    n = robot.numLinks()
+    qmin,qmax = robot.getJointLimits()
+    parents = [robot.link(i).getParent() for i in range(n)]
+    fixed = [qmin[i] == qmax[i] for i in range(n)]
+    ## Rigid cluster of every link: the first ancestor that is not attached by a fixed joint
+    cluster = list(range(n))
+    for i in range(n):
+        if parents[i] >= 0 and fixed[i]:
+            cluster[i] = cluster[parents[i]]
+    hasGeom = [not robot.link(i).geometry().empty() for i in range(n)]
+    pairs = []
+    for i in range(n):
+        if not hasGeom[i]:
+            continue
+        for j in range(i+1, n):
+            if not hasGeom[j] or cluster[i] == cluster[j]:
+                continue
+            if not robot.selfCollisionEnabled(i, j):
+                continue
+            ## Moving DOFs on the path between the two links
+            ai = _ancestors(parents, i)
+            aj = _ancestors(parents, j)
+            common = set(ai) & set(aj)
+            path = [k for k in ai + aj if k not in common and not fixed[k]]
+            pairs.append((i, j, path))
+    _modelPairs[key] = pairs
+    return pairs
+
+def geometryDistance(ga, gb):
+    ## Separation distance of two geometries, 0 if they collide or if the distance is not available
+    try:
+        res = ga.distance(gb)
+    except Exception:
+        return 0.0 if ga.collides(gb) else None
+    d = getattr(res, "d", res)
+    return max(d, 0.0)
+
+class selfCollisionCache(object):
+    def __init__ (self, robot, margin = 0.0):
+        ## margin: pairs closer than margin are checked on every call
+        self.robot = robot
+        self.margin = margin
+        self.pairs = prunedPairs(robot)
+        self.numLinks = robot.numLinks()
+        self.dofs = sorted(set(k for i,j,path in self.pairs for k in path))
+        self.geoms = {}
+        self.radius = {}
+        for i,j,path in self.pairs:
+            for k in (i, j):
+                if k not in self.geoms:
+                    self.geoms[k] = robot.link(k).geometry()
+                    self.radius[k] = self._radius(k)
+        self._qLast = None
+        self._cache = {} ## (i, j) -> (distance, relative transform of j in the frame of i)
+        self._colliding = []
+        self.numQueries = 0
+        self.numSkipped = 0
+
+    def _radius(self, k):
+        ## Radius of the geometry of link k about the origin of the link
+        bb = self.geoms[k].getBB()
+        T = self.robot.link(k).getTransform()
+        r = 0.0
+        for x in (bb[0][0], bb[1][0]):
+            for y in (bb[0][1], bb[1][1]):
+                for z in (bb[0][2], bb[1][2]):
+                    r = max(r, vectorops.distance([x, y, z], T[1]))
+        return r
+
+    def _relative(self, T, i, j):
+        Ri,ti = T[i]
+        Rj,tj = T[j]
+        Rinv = so3.inv(Ri)
+        return (so3.mul(Rinv, Rj), so3.apply(Rinv, vectorops.sub(tj, ti)))
+
+    def collisions(self):
+        ## Returns the colliding link pairs as (i, j)
+        q = self.robot.getConfig()
+        qDofs = [q[k] for k in self.dofs]
+        if qDofs == self._qLast:
+            ## No joint between any pair has moved, the answer is the same as the last time
+            self.numSkipped += len(self.pairs)
+            return list(self._colliding)
+        self._qLast = qDofs
+        T = {}
+        colliding = []
+        for i,j,path in self.pairs:
+            if i not in T:
+                T[i] = self.robot.link(i).getTransform()
+            if j not in T:
+                T[j] = self.robot.link(j).getTransform()
+            rel = self._relative(T, i, j)
+            cached = self._cache.get((i, j))
+            if cached is not None and cached[0] is not None:
+                d,rel0 = cached
+                ## Upper bound of the displacement of the points of link j relative to link i
+                motion = vectorops.distance(rel[1], rel0[1]) + so3.angle(so3.mul(so3.inv(rel0[0]), rel[0])) * self.radius[j]
+                if motion < d - self.margin:
+                    self.numSkipped += 1
+                    continue
+            self.numQueries += 1
+            d = geometryDistance(self.geoms[i], self.geoms[j])
+            self._cache[(i, j)] = (d, rel)
+            if d is None:
+                if self.geoms[i].collides(self.geoms[j]):
+                    colliding.append((i, j))
+            elif d <= 0:
+                colliding.append((i, j))
+        self._colliding = colliding
+        return list(colliding)
+
+class selfCollider(object):
+    def __init__ (self, world, margin = 0.0):
+        self.world = world
+        self.caches = [selfCollisionCache(world.robot(i), margin) for i in range(world.numRobots())]
+
+    ## Same interface as collide.WorldCollider
+    def robotSelfCollisions(self, robot = None):
+        if robot is None:
+            indices = range(len(self.caches))
+        elif isinstance(robot, int):
+            indices = [robot]
+        else:
+            indices = [robot.index]
+        for r in indices:
+            model = self.world.robot(r)
+            for i,j in self.caches[r].collisions():
+                yield (model.link(i), model.link(j))
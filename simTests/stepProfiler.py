@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+## Per-phase timers of the simulation step
+## The loop marks the end of every phase with lap(name): the time since the previous lap (or mark()) is added to
+## the phase. step() counts a step of the simulation and times it (from the previous step()).
+## Every phase keeps a rolling window of its last samples (p50/p99 of the recent steps, e.g. for the overlay)
+## and a histogram of all the samples of the run (log-spaced buckets, about 9% wide) for the final report.
+## Disabled profiling costs nothing: the loops keep profiler = None and test it before every lap, as for the recorder
+## of trajectoryLog.py. A lap costs about a microsecond.
+## Export with write(fn): a CSV table (one row per phase) or, if fn ends with .json, the statistics and histograms.
+##
+## Execution (table of an exported profile):
+##   python stepProfiler.py run.json
+
+import sys
+import math
+import time
+import json
+
+## Clock with the best resolution
+_clock = getattr(time, "perf_counter", time.time)
+
+## Buckets of the histograms: bucket k holds the samples in [_base*_ratio^(k-1), _base*_ratio^k)
+_base = 1e-7
+_ratio = 2.0**0.125
+_logRatio = math.log(_ratio)
+
+class _phase(object):
+    __slots__ = ("window", "index", "count", "total", "max", "hist")
+
+    def __init__ (self, window):
+        self.window = [0.0]*window
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.hist = {}
+
+    def add(self, dt):
+        self.window[self.index] = dt
+        self.index = (self.index + 1) % len(self.window)
+        self.count += 1
+        self.total += dt
+        if dt > self.max:
+            self.max = dt
+        k = int(math.log(dt/_base)/_logRatio) + 1 if dt > _base else 0
+        self.hist[k] = self.hist.get(k, 0) + 1
+
+    def recent(self):
+        ## Samples of the rolling window
+        return self.window if self.count >= len(self.window) else self.window[:self.count]
+
+    def windowPercentile(self, p):
+        samples = sorted(self.recent())
+        return samples[min(int(p*len(samples)), len(samples) - 1)] if samples else 0.0
+
+    def percentile(self, p):
+        ## Upper edge of the bucket of the histogram that holds the p-quantile of all the samples
+        rank = p*self.count
+        seen = 0
+        for k in sorted(self.hist):
+            seen += self.hist[k]
+            if seen > rank:
+                return min(_base*_ratio**k, self.max)
+        return self.max
+
+class stepProfiler(object):
+    def __init__ (self, window = 1000):
+        ## window: samples of the rolling percentiles of every phase
+        self.windowSize = window
+        self.phases = {}
+        self.order = []
+        self.steps = _phase(window)
+        self.startTime = _clock()
+        self._mark = self.startTime
+        self._lastStep = self.startTime
+
+    def mark(self):
+        ## Start of the next phase, the time since the last lap is not counted
+        self._mark = _clock()
+
+    def lap(self, name):
+        ## End of the phase name, started at the last lap or mark
+        now = _clock()
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = _phase(self.windowSize)
+            self.order.append(name)
+        phase.add(now - self._mark)
+        self._mark = now
+
+    def step(self):
+        ## End of a step of the simulation
+        now = _clock()
+        self.steps.add(now - self._lastStep)
+        self._lastStep = now
+
+    def stepRate(self, recent = True):
+        ## Steps per second over the rolling window, or since the start
+        if recent:
+            total = sum(self.steps.recent())
+            return len(self.steps.recent())/total if total > 0 else 0.0
+        elapsed = _clock() - self.startTime
+        return self.steps.count/elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        ## Statistics of the run: total and wallTime in seconds, the other times in microseconds
+        wallTime = _clock() - self.startTime
+        phases = []
+        for name in self.order:
+            p = self.phases[name]
+            phases.append({"phase": name, "count": p.count, "total": p.total, "share": p.total/wallTime if wallTime > 0 else 0.0,
+                           "mean": 1e6*p.total/p.count, "p50": 1e6*p.percentile(0.5), "p99": 1e6*p.percentile(0.99), "max": 1e6*p.max,
+                           "windowP50": 1e6*p.windowPercentile(0.5), "windowP99": 1e6*p.windowPercentile(0.99)})
+        return {"steps": self.steps.count, "wallTime": wallTime, "stepsPerSec": self.stepRate(False), "phases": phases}
+
+    def overlayText(self, num = 4):
+        ## One line for the viewer: recent step rate and the phases with the largest recent p50
+        phases = sorted(self.order, key=lambda n: -self.phases[n].windowPercentile(0.5))[:num]
+        text = '{0:.0f} steps/s'.format(self.stepRate())
+        for name in phases:
+            p = self.phases[name]
+            text += ' | {0} {1:.0f}/{2:.0f} us'.format(name, 1e6*p.windowPercentile(0.5), 1e6*p.windowPercentile(0.99))
+        return text
+
+    def printTable(self):
+        printStats(self.stats())
+
+    def write(self, fn):
+        ## CSV table, or JSON with the histograms if fn ends with .json
+        stats = self.stats()
+        if fn.endswith(".json"):
+            for row in stats["phases"]:
+                p = self.phases[row["phase"]]
+                row["histogram"] = [[1e6*_base*_ratio**k, p.hist[k]] for k in sorted(p.hist)]
+            with open(fn, "w") as f:
+                json.dump(stats, f, indent=1)
+            return
+        keys = ["phase", "count", "total", "share", "mean", "p50", "p99", "max", "windowP50", "windowP99"]
+        with open(fn, "w") as f:
+            f.write(",".join(keys) + "\n")
+            for row in stats["phases"]:
+                f.write(",".join(str(row[k]) for k in keys) + "\n")
+
+def printStats(stats):
+    print('{0} steps in {1:.3f} s, {2:.1f} steps per second'.format(stats["steps"], stats["wallTime"], stats["stepsPerSec"]))
+    print('{0:>18} {1:>9} {2:>9} {3:>7} {4:>10} {5:>10} {6:>10} {7:>10}'.format("phase", "count", "total (s)", "share", "mean (us)", "p50 (us)", "p99 (us)", "max (us)"))
+    for row in stats["phases"]:
+        print('{0:>18} {1:>9} {2:>9.3f} {3:>6.1f}% {4:>10.1f} {5:>10.1f} {6:>10.1f} {7:>10.1f}'.format(row["phase"], row["count"], row["total"],
+              100*row["share"], row["mean"], row["p50"], row["p99"], row["max"]))
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or not sys.argv[1].endswith(".json"):
+        print("USAGE: stepProfiler.py profile.json")
+        exit()
+    with open(sys.argv[1]) as f:
+        printStats(json.load(f))
@@ -0,0 +1,256 @@
+#!/usr/bin/python
+
+## Scenario sweeps over a multiprocessing pool of headless simulators (headlessSim.py)
+## A scenario is a robot type, a control profile, a world layout, a seed and values of the robot parameters
+## (e.g. wheelDia, lenAxle, eps of turtlebot/kobuki) and of the profile (freq: time scale of the sinusoids).
+## The scenarios are the product of the given values (grid), or random samples of the given ranges (--samples).
+## Each worker keeps the worlds it has loaded (one per robot type, layout and layout seed) and reuses them:
+## only the config of the robot is reset between two scenarios.
+## The meshes of the worlds are read from the cache of meshCache.py before the pool is created.
+## The results of all the scenarios are aggregated into one table (printed, and written to a CSV file with --out).
+##
+## Layouts: door, window, none (as in headlessSim.py), maze and roomGrid (generated by worldGen.py from the seed)
+##
+## Execution:
+##   python sweepRunner.py --world turtlebot:turtle.xml --robot turtlebot --control vel wheel \
+##       --param wheelDia=0.07,0.076,0.08 --param lenAxle=0.2,0.23 --layout door maze --seeds 0 1 2 --out sweep.csv
+##   python sweepRunner.py --world kobuki:kob.xml --robot kobuki --control vel --param wheelDia=0.06:0.09 --samples 1000
+
+import sys
+import os
+import csv
+import time
+import math
+import random
+import itertools
+import argparse
+import multiprocessing
+import klampt
+import klampt.model.collide as collide
+## Klampt >= 0.9 exports klampt.set_random_seed, older versions only have robotsim.setRandomSeed
+setRandomSeed = getattr(klampt, "set_random_seed", None)
+if setRandomSeed is None:
+    from klampt.robotsim import setRandomSeed
+try:
+    from . import headlessSim
+    from . import worldGen
+    from .selfCollision import selfCollider
+except (ImportError, ValueError):
+    ## Run as a script from this folder
+    import headlessSim
+    import worldGen
+    from selfCollision import selfCollider
+try:
+    try:
+        from . import meshCache
+    except (ImportError, ValueError):
+        import meshCache
+except ImportError:
+    ## NumPy is not installed, the worlds are loaded without the mesh cache
+    meshCache = None
+
+## Worlds loaded by this process: key -> (world, initial config of the robot, collision checker, self collision checker)
+_worlds = {}
+_worldOrder = []
+_options = {}
+
+## Worlds kept by a worker
+maxWorlds = 4
+
+## Control profiles that apply to each robot type
+validControls = {"sphero": ["sphere"], "kobuki": ["holonomic", "vel", "wheel"], "turtlebot": ["holonomic", "vel", "wheel"]}
+
+def _initWorker(worldFiles, deltaT, simTime, selfCache):
+    _options["worldFiles"] = worldFiles
+    _options["deltaT"] = deltaT
+    _options["simTime"] = simTime
+    _options["selfCache"] = selfCache
+
+def _layoutSeed(scenario):
+    ## The generated layouts depend on the seed, the fixed ones do not
+    return scenario["seed"] if scenario["layout"] in ("maze", "roomGrid") else None
+
+def loadLayout(worldFiles, layout, seed):
+    ## World with the rooms of headlessSim.loadWorld, or a generated layout
+    if layout in ("door", "window", "none"):
+        return headlessSim.loadWorld(worldFiles, layout)
+    world = headlessSim.loadWorld(worldFiles, "none")
+    if layout == "maze":
+        walls = worldGen.mazeWalls(seed, 8, 8, 1.0, 1.0, origin=(-4, -4))
+    elif layout == "roomGrid":
+        walls = worldGen.roomGridWalls(seed, 2, 2, 4.0, 4.0, 1.0, windowProb=0.3, origin=(-4, -4))
+    else:
+        raise ValueError("Unknown layout "+layout)
+    worldGen.buildLayout(world, walls, layout)
+    return world
+
+def _getWorld(scenario):
+    key = (scenario["robot"], scenario["layout"], _layoutSeed(scenario))
+    if key in _worlds:
+        return _worlds[key]
+    if len(_worldOrder) >= maxWorlds:
+        del _worlds[_worldOrder.pop(0)]
+    world = loadLayout(_options["worldFiles"][scenario["robot"]], scenario["layout"], _layoutSeed(scenario))
+    selfChecker = selfCollider(world) if _options["selfCache"] else None
+    _worlds[key] = (world, world.robot(0).getConfig(), collide.WorldCollider(world), selfChecker)
+    _worldOrder.append(key)
+    return _worlds[key]
+
+def runScenario(scenario):
+    ## Run one scenario in this process and return its row of results
+    world,q0,collisionChecker,selfChecker = _getWorld(scenario)
+    seed = scenario["seed"]
+    setRandomSeed(seed)
+    rng = random.Random(seed)
+    world.robot(0).setConfig(q0)
+    robot = headlessSim.makeRobot(world, scenario["robot"])
+    for name,value in scenario["params"].items():
+        if name != "freq" and hasattr(robot, name):
+            setattr(robot, name, value)
+    control = headlessSim.controls[scenario["control"]]
+    freq = scenario["params"].get("freq", 1.0)
+    ## The seed sets the phase of the profile
+    phase = rng.uniform(0.0, 2*math.pi)
+    def scaled(robot, t, deltaT):
+        return control(robot, freq*t + phase, deltaT)
+    stats = headlessSim.run(world, robot, scaled, collisionChecker, _options["deltaT"], _options["simTime"], selfChecker=selfChecker)
+    row = dict(scenario["params"])
+    row.update({"id": scenario["id"], "robot": scenario["robot"], "control": scenario["control"], "layout": scenario["layout"], "seed": seed})
+    row.update(stats)
+    row["worker"] = os.getpid()
+    return row
+
+def parseParams(items):
+    ## ["wheelDia=0.07,0.08", "lenAxle=0.2:0.25"] -> {"wheelDia": [0.07, 0.08], "lenAxle": (0.2, 0.25)}
+    ## A list of values is swept, a range low:high is sampled uniformly
+    params = {}
+    for item in items:
+        name,values = item.split("=")
+        if ":" in values:
+            low,high = values.split(":")
+            params[name] = (float(low), float(high))
+        else:
+            params[name] = [float(v) for v in values.split(",")]
+    return params
+
+def gridScenarios(robots, controls, layouts, seeds, params):
+    ## Product of all the values. The scenarios sharing a world are consecutive, so that a worker reuses its world
+    names = sorted(params.keys())
+    for v in params.values():
+        if isinstance(v, tuple):
+            raise ValueError("Ranges can only be sampled, use --samples")
+    scenarios = []
+    for robot,layout,seed,control in itertools.product(robots, layouts, seeds, controls):
+        if control not in validControls[robot]:
+            continue
+        for values in itertools.product(*[params[n] for n in names]):
+            scenarios.append({"id": len(scenarios), "robot": robot, "control": control, "layout": layout, "seed": seed, "params": dict(zip(names, values))})
+    return scenarios
+
+def sampleScenarios(numSamples, robots, controls, layouts, seeds, params, seed = 0):
+    ## Random scenarios: the ranges are sampled uniformly, the lists and the other choices uniformly among their values
+    rng = random.Random(seed)
+    ## Robots without any valid control among the given ones are not sampled
+    choices = dict((r, [c for c in controls if c in validControls[r]]) for r in robots)
+    robots = [r for r in robots if choices[r]]
+    if not robots:
+        raise ValueError("None of the controls " + ", ".join(controls) + " is valid for the robots " + ", ".join(sorted(choices)))
+    scenarios = []
+    for k in range(numSamples):
+        values = {}
+        for name,v in params.items():
+            values[name] = rng.uniform(v[0], v[1]) if isinstance(v, tuple) else rng.choice(v)
+        robot = rng.choice(robots)
+        scenarios.append({"id": k, "robot": robot, "control": rng.choice(choices[robot]), "layout": rng.choice(layouts), "seed": rng.choice(seeds), "params": values})
+    scenarios.sort(key=lambda s: (s["robot"], s["layout"], s["seed"]))
+    return scenarios
+
+def runSweep(scenarios, worldFiles, deltaT = 0.01, simTime = 10.0, processes = None, selfCache = False, progress = False):
+    ## Run the scenarios on a pool of processes, returns the rows sorted by scenario id
+    ## worldFiles: robot type -> list of world files (the world must contain a robot of that type)
+    ## selfCache: check the self collisions with selfCollision.selfCollider
+    if processes == 1:
+        _initWorker(worldFiles, deltaT, simTime, selfCache)
+        rows = [runScenario(s) for s in scenarios]
+    else:
+        if meshCache is not None:
+            ## The forked workers share the pages of the cache entries read here
+            meshCache.preload(sorted(set(fn for files in worldFiles.values() for fn in files)))
+        pool = multiprocessing.Pool(processes, _initWorker, (worldFiles, deltaT, simTime, selfCache))
+        ## Chunks of consecutive scenarios, so that a worker gets scenarios that share a world
+        chunk = max(1, len(scenarios) // (4 * (processes or multiprocessing.cpu_count())))
+        rows = []
+        try:
+            for row in pool.imap_unordered(runScenario, scenarios, chunk):
+                rows.append(row)
+                if progress and len(rows) % 100 == 0:
+                    print('{0}/{1} scenarios'.format(len(rows), len(scenarios)))
+        finally:
+            pool.close()
+            pool.join()
+    rows.sort(key=lambda r: r["id"])
+    return rows
+
+columns = ["id", "robot", "control", "layout", "seed", "steps", "collisionSteps", "firstCollision", "wallTime", "stepsPerSec"]
+
+def writeTable(rows, fn):
+    paramNames = sorted(set(k for r in rows for k in r.keys()) - set(columns) - set(["simTime", "realTimeFactor", "worker"]))
+    with open(fn, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns[:5] + paramNames + columns[5:])
+        for r in rows:
+            writer.writerow([r.get(c, "") for c in columns[:5] + paramNames + columns[5:]])
+
+def printTable(rows, maxRows = 20):
+    paramNames = sorted(set(k for r in rows for k in r.keys()) - set(columns) - set(["simTime", "realTimeFactor", "worker"]))
+    header = columns[:5] + paramNames + ["collisionSteps", "firstCollision", "stepsPerSec"]
+    print(" ".join('{0:>14}'.format(h) for h in header))
+    for r in rows[:maxRows]:
+        cells = []
+        for h in header:
+            v = r.get(h)
+            cells.append('{0:>14.4g}'.format(v) if isinstance(v, float) else '{0:>14}'.format(str(v)))
+        print(" ".join(cells))
+    if len(rows) > maxRows:
+        print('... {0} more rows'.format(len(rows) - maxRows))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep of headless simulations over parameters, control profiles, layouts and seeds")
+    parser.add_argument("--world", action="append", default=[], metavar="ROBOT:FILE", help="world file of a robot type, e.g. turtlebot:turtle.xml")
+    parser.add_argument("--robot", nargs="+", default=["sphero"], choices=["sphero", "kobuki", "turtlebot"])
+    parser.add_argument("--control", nargs="+", default=None, choices=sorted(headlessSim.controls.keys()), help="control profiles (default: the profile of each robot in headlessSim.py)")
+    parser.add_argument("--layout", nargs="+", default=["door"], choices=["door", "window", "none", "maze", "roomGrid"])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2|LOW:HIGH", help="robot parameter (wheelDia, lenAxle, eps) or freq")
+    parser.add_argument("--samples", type=int, default=None, help="number of random scenarios instead of the grid")
+    parser.add_argument("--dt", type=float, default=0.01, help="simulated timestep (s)")
+    parser.add_argument("--time", type=float, default=10.0, help="simulated time of a scenario (s)")
+    parser.add_argument("--processes", type=int, default=None, help="size of the pool (default: number of CPUs)")
+    parser.add_argument("--selfcache", action="store_true", help="prune static link pairs and cache self collision distances")
+    parser.add_argument("--out", default=None, help="CSV file of the results")
+    args = parser.parse_args()
+
+    worldFiles = {"sphero": ["simpleWorld.xml"]}
+    given = {}
+    for item in args.world:
+        robot,fn = item.split(":", 1)
+        given.setdefault(robot, []).append(fn)
+    worldFiles.update(given)
+    for robot in args.robot:
+        if robot not in worldFiles:
+            raise ValueError("No world file for "+robot+", use --world "+robot+":FILE")
+    defaultControl = {"sphero": "sphere", "kobuki": "holonomic", "turtlebot": "vel"}
+    controls = args.control if args.control else sorted(set(defaultControl[r] for r in args.robot))
+    params = parseParams(args.param)
+    if args.samples:
+        scenarios = sampleScenarios(args.samples, args.robot, controls, args.layout, args.seeds, params)
+    else:
+        scenarios = gridScenarios(args.robot, controls, args.layout, args.seeds, params)
+    print('{0} scenarios'.format(len(scenarios)))
+    t0 = time.time()
+    rows = runSweep(scenarios, worldFiles, args.dt, args.time, args.processes, args.selfcache, progress=True)
+    t1 = time.time()
+    printTable(rows)
+    print('{0} scenarios in {1:.2f} s ({2:.1f} scenarios/s, {3} workers)'.format(len(rows), t1 - t0, len(rows)/(t1 - t0), len(set(r["worker"] for r in rows))))
+    if args.out:
+        writeTable(rows, args.out)
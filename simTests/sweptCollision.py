@@ -0,0 +1,214 @@
+#!/usr/bin/python
+
+## Continuous (swept) collision checking of kinematic trajectory segments
+## Checking only the configurations reached by the loop misses contacts when a robot moves more than the
+## thickness of a wall in one step (e.g. the 0.01 m walls of buildWorld.getDoubleRoomDoor).
+## A segment is a path q(s), s in [0, 1], in the configuration space of a robot wrapper:
+##  1. linearSegment: straight line between two configurations (x, y, yaw) or (x, y, z, rz, ry, rx)
+##  2. arcSegment: the arc followed by turtlebot.velControlKin for (vel, omega) during deltaT
+##  3. wheelSegment: the arc followed by turtlebot.wheelControlKin for (w_l, w_r) during deltaT
+## sweptChecker.firstContact returns the first s at which the robot comes within tol of an obstacle, or None.
+## Conservative advancement: with d the distance to the obstacles and v a bound on the displacement of any
+## point of the robot per unit of s, no contact can happen before s + d/v. If the distance is not available
+## for a geometry, adaptive bisection on the collision test is used instead (with early exit).
+##
+## Execution (tunnelling demo: a robot crossing a wall in a single large step):
+##   python sweptCollision.py simpleWorld.xml
+
+import sys
+import os
+import math
+from klampt.math import vectorops
+try:
+    from .selfCollision import geometryDistance
+except (ImportError, ValueError):
+    from selfCollision import geometryDistance
+
+class linearSegment(object):
+    def __init__ (self, qStart, qEnd):
+        self.qStart = list(qStart)
+        self.qEnd = list(qEnd)
+        ## Planar robots are (x, y, yaw), 6 DoF robots are (x, y, z, rz, ry, rx)
+        n = 2 if len(qStart) == 3 else 3
+        self.linear = vectorops.distance(self.qStart[:n], self.qEnd[:n])
+        ## The angular velocity is bounded by the sum of the Euler angle rates
+        self.angular = sum(abs(b - a) for a,b in zip(self.qStart[n:], self.qEnd[n:]))
+
+    def config(self, s):
+        return vectorops.interpolate(self.qStart, self.qEnd, s)
+
+    def bounds(self):
+        ## (linear, angular) displacement per unit of s
+        return self.linear, self.angular
+
+class arcSegment(object):
+    def __init__ (self, qStart, vel, omega, deltaT, eps = 0.000001):
+        self.qStart = list(qStart)
+        self.vel = vel
+        self.omega = omega
+        self.deltaT = deltaT
+        self.eps = eps
+
+    def config(self, s):
+        ## Same equations as turtlebot.velControlKin for a duration s*deltaT
+        x,y,yaw = self.qStart
+        dt = s * self.deltaT
+        if abs(self.omega) < self.eps:
+            return [x + self.vel * dt * math.cos(yaw), y + self.vel * dt * math.sin(yaw), yaw]
+        rad = self.vel/self.omega
+        return [x - rad * math.sin(yaw) + rad * math.sin(yaw + self.omega * dt),
+                y + rad * math.cos(yaw) - rad * math.cos(yaw + self.omega * dt),
+                yaw + self.omega * dt]
+
+    def bounds(self):
+        return abs(self.vel) * self.deltaT, abs(self.omega) * self.deltaT
+
+def wheelSegment(qStart, w_l, w_r, deltaT, wheelDia = 0.076, lenAxle = 0.23, eps = 0.000001):
+    ## Arc followed by turtlebot.wheelControlKin
+    v_l = w_l * wheelDia/2.0
+    v_r = w_r * wheelDia/2.0
+    return arcSegment(qStart, (v_l + v_r)/2.0, (v_r - v_l)/lenAxle, deltaT, eps/lenAxle)
+
+class sweptChecker(object):
+    def __init__ (self, world, robot, obstacles = None, tol = 0.001, maxIter = 1000):
+        ## robot: robot wrapper (sphero6DoF, kobuki, turtlebot)
+        ## obstacles: list of (name, Geometry3D), by default all the terrains and rigid objects except terrain 0 (the floor)
+        ## tol: a contact is reported when the distance falls below tol
+        self.world = world
+        self.robot = robot
+        self.tol = tol
+        self.maxIter = maxIter
+        if obstacles is None:
+            obstacles = [(world.terrain(i).getName(), world.terrain(i).geometry()) for i in range(1, world.numTerrains())]
+            obstacles += [(world.rigidObject(i).getName(), world.rigidObject(i).geometry()) for i in range(world.numRigidObjects())]
+        self.obstacles = obstacles
+        model = robot.robot
+        self.links = [model.link(i).geometry() for i in range(model.numLinks()) if not model.link(i).geometry().empty()]
+        self.radius = self._radius()
+        self.numQueries = 0
+
+    def _radius(self):
+        ## Radius of the robot about the origin of its configuration (x, y, z)
+        self.robot.flush()
+        origin = self.robot.getTransform()[1]
+        r = 0.0
+        for g in self.links:
+            bb = g.getBB()
+            for x in (bb[0][0], bb[1][0]):
+                for y in (bb[0][1], bb[1][1]):
+                    for z in (bb[0][2], bb[1][2]):
+                        r = max(r, vectorops.distance([x, y, z], origin))
+        return r
+
+    def _setConfig(self, q):
+        self.robot.setConfig(q)
+        self.robot.flush()
+
+    def distance(self):
+        ## Distance between the robot and the obstacles at the current configuration, None if not available
+        self.numQueries += 1
+        dmin = float("inf")
+        for g in self.links:
+            for name,o in self.obstacles:
+                d = geometryDistance(g, o)
+                if d is None:
+                    return None
+                dmin = min(dmin, d)
+                if dmin <= self.tol:
+                    return dmin
+        return dmin
+
+    def collides(self):
+        self.numQueries += 1
+        for g in self.links:
+            for name,o in self.obstacles:
+                if g.collides(o):
+                    return True
+        return False
+
+    def firstContact(self, segment):
+        ## First s in [0, 1] at which the robot is within tol of an obstacle along the segment, None if the segment is free
+        ## The configuration of the robot is restored afterwards
+        qSaved = self.robot.getConfig()
+        try:
+            linear,angular = segment.bounds()
+            speed = linear + angular * self.radius
+            s = 0.0
+            for it in range(self.maxIter):
+                self._setConfig(segment.config(s))
+                d = self.distance()
+                if d is None:
+                    return self._bisect(segment, s, 1.0, speed)
+                if d <= self.tol:
+                    return s
+                if s >= 1.0:
+                    return None
+                if speed <= 0:
+                    return None
+                ## Safe advancement, at least tol/2 of motion so that the loop terminates
+                s = min(1.0, s + max(d - 0.5*self.tol, 0.5*self.tol)/speed)
+            return self._bisect(segment, s, 1.0, speed)
+        finally:
+            self._setConfig(qSaved)
+
+    def _bisect(self, segment, s0, s1, speed):
+        ## Adaptive bisection on the collision test, the segment is split until the motion of the
+        ## robot on each piece is below tol. Returns the first colliding s, None if none
+        self._setConfig(segment.config(s0))
+        if self.collides():
+            return s0
+        stack = [(s0, s1)]
+        while stack:
+            a,b = stack.pop()
+            self._setConfig(segment.config(b))
+            if self.collides():
+                if (b - a) * speed <= self.tol:
+                    return b
+                m = 0.5*(a + b)
+                ## The first half is explored first
+                stack.append((m, b))
+                stack.append((a, m))
+                continue
+            if (b - a) * speed > self.tol:
+                m = 0.5*(a + b)
+                stack.append((m, b))
+                stack.append((a, m))
+        return None
+
+    def arcFirstContact(self, vel, omega, deltaT):
+        ## Time of the first contact if velControlKin(vel, omega, deltaT) is applied from the current configuration, None if free
+        s = self.firstContact(arcSegment(self.robot.getConfig(), vel, omega, deltaT, getattr(self.robot, "eps", 0.000001)))
+        return None if s is None else s * deltaT
+
+    def wheelFirstContact(self, w_l, w_r, deltaT):
+        ## Time of the first contact if wheelControlKin(w_l, w_r, deltaT) is applied from the current configuration, None if free
+        r = self.robot
+        s = self.firstContact(wheelSegment(r.getConfig(), w_l, w_r, deltaT, r.wheelDia, r.lenAxle, r.eps))
+        return None if s is None else s * deltaT
+
+    def segmentFirstContact(self, qStart, qEnd):
+        ## Fraction of the straight segment from qStart to qEnd at the first contact, None if free
+        return self.firstContact(linearSegment(qStart, qEnd))
+
+if __name__ == "__main__":
+    from klampt import WorldModel
+    import buildWorld as bW
+    from kinematics.sphero6DoF import sphero6DoF
+    if len(sys.argv)<=1:
+        print("USAGE: sweptCollision.py [world_file]")
+        exit()
+    world = WorldModel()
+    for fn in sys.argv[1:]:
+        if not world.readFile(fn):
+            raise RuntimeError("Unable to load model "+fn)
+    bW.getDoubleRoomDoor(world, 8, 8, 1)
+    robot = sphero6DoF(world.robot(0), "sphero")
+    checker = sweptChecker(world, robot)
+    ## The robot jumps across the wall at y = 0 in one step
+    qStart = [-3, -1, 0.5, 0, 0, 0]
+    qEnd = [-3, 1, 0.5, 0, 0, 0]
+    robot.setConfig(qEnd)
+    robot.flush()
+    print("Collision at the end of the step: " + str(checker.collides()))
+    s = checker.segmentFirstContact(qStart, qEnd)
+    print("First contact along the step: s = " + str(s) + " after " + str(checker.numQueries) + " queries")
@@ -0,0 +1,95 @@
+## Checks of the zyx Euler angle functions of mathUtils against klampt.math.so3
+##
+## Execution (from the root of the repository or from this folder):
+##   python -m pytest simTests/test_mathUtils.py
+
+import math
+import random
+import pytest
+from klampt.math import so3
+try:
+    from . import mathUtils
+except (ImportError, ValueError):
+    import mathUtils
+
+np = pytest.importorskip("numpy")
+
+def _randomAngles(num, seed = 0, margin = 1e-3):
+    ## (num x 3) angles (rz, ry, rx), ry away from the singularity by margin
+    rng = np.random.RandomState(seed)
+    thetas = rng.uniform(-math.pi, math.pi, (num, 3))
+    thetas[:, 1] = rng.uniform(-0.5*math.pi + margin, 0.5*math.pi - margin, num)
+    return thetas
+
+def _wrap(a):
+    return (np.asarray(a) + math.pi) % (2*math.pi) - math.pi
+
+def test_mat_matches_so3():
+    for t in _randomAngles(200).tolist():
+        ref = so3.from_rpy((t[2], t[1], t[0]))
+        assert np.allclose(mathUtils.euler_zyx_mat(t), ref, atol=1e-12)
+
+def test_batched_mats_match_scalar():
+    thetas = _randomAngles(500)
+    R = mathUtils.euler_zyx_mats(thetas)
+    assert R.shape == (500, 9)
+    assert np.allclose(R, [mathUtils.euler_zyx_mat(t) for t in thetas.tolist()], atol=1e-12)
+
+def test_round_trip():
+    thetas = _randomAngles(500)
+    back = mathUtils.euler_zyx_from_mats(mathUtils.euler_zyx_mats(thetas))
+    assert np.allclose(_wrap(back - thetas), 0.0, atol=1e-9)
+    for t,b in zip(thetas[:50].tolist(), back[:50].tolist()):
+        assert np.allclose(mathUtils.euler_zyx_from_mat(mathUtils.euler_zyx_mat(t)), b, atol=1e-12)
+
+def test_round_trip_from_so3():
+    ## Any rotation matrix of so3 is reproduced by the angles
+    rng = random.Random(1)
+    for k in range(200):
+        R = so3.from_rpy((rng.uniform(-math.pi, math.pi), rng.uniform(-1.5, 1.5), rng.uniform(-math.pi, math.pi)))
+        assert np.allclose(mathUtils.euler_zyx_mat(mathUtils.euler_zyx_from_mat(R)), R, atol=1e-9)
+
+@pytest.mark.parametrize("ry", [0.5*math.pi, -0.5*math.pi])
+def test_singularity(ry):
+    ## Gimbal lock: rx is set to 0 and the angles still give the same rotation
+    theta = [0.3, ry, 0.2]
+    R = mathUtils.euler_zyx_mat(theta)
+    angles = mathUtils.euler_zyx_from_mat(R)
+    assert angles[2] == 0.0
+    assert abs(angles[1] - ry) < 1e-6
+    assert np.allclose(mathUtils.euler_zyx_mat(angles), R, atol=1e-9)
+    batched = mathUtils.euler_zyx_from_mats(mathUtils.euler_zyx_mats([theta]))
+    assert np.allclose(batched[0], angles, atol=1e-12)
+    ## The inverses of the rate matrix stay finite and the angles are flagged
+    Ainv,singular = mathUtils.euler_zyx_rate_mats_inv([theta])
+    assert singular.tolist() == [True]
+    assert np.isfinite(Ainv).all()
+    assert np.isfinite(mathUtils.euler_zyx_mat_inv(theta)).all()
+
+def test_rate_mat_inverse():
+    thetas = _randomAngles(500, margin=1e-2)
+    A = mathUtils.euler_zyx_rate_mats(thetas)
+    Ainv,singular = mathUtils.euler_zyx_rate_mats_inv(thetas)
+    assert not singular.any()
+    assert np.allclose(np.einsum("nij,njk->nik", Ainv, A), np.eye(3), atol=1e-9)
+    for t,a,ai in zip(thetas[:50].tolist(), A[:50], Ainv[:50]):
+        assert np.allclose(mathUtils.euler_zyx_rate_mat(t), a, atol=1e-12)
+        assert np.allclose(mathUtils.euler_zyx_mat_inv(t), ai, atol=1e-9)
+
+def test_omegas_match_finite_differences():
+    ## Angular velocity of the rotation: so3.moment(R1*R0^T)/dt
+    thetas = _randomAngles(20, seed=2)
+    dthetas = np.random.RandomState(3).uniform(-1, 1, (20, 3))
+    omegas = mathUtils.euler_zyx_rates_to_omegas(thetas, dthetas)
+    dt = 1e-7
+    for t,dtheta,w in zip(thetas.tolist(), dthetas.tolist(), omegas):
+        R0 = mathUtils.euler_zyx_mat(t)
+        R1 = mathUtils.euler_zyx_mat([a + dt*b for a,b in zip(t, dtheta)])
+        assert np.allclose(np.array(so3.moment(so3.mul(R1, so3.inv(R0))))/dt, w, atol=1e-5)
+
+def test_omegas_round_trip():
+    thetas = _randomAngles(200, seed=4, margin=1e-2)
+    dthetas = np.random.RandomState(5).uniform(-1, 1, (200, 3))
+    rates,singular = mathUtils.omegas_to_euler_zyx_rates(thetas, mathUtils.euler_zyx_rates_to_omegas(thetas, dthetas))
+    assert not singular.any()
+    assert np.allclose(rates, dthetas, atol=1e-9)
@@ -0,0 +1,306 @@
+#!/usr/bin/python
+
+## Binary trajectory recorder and memory-mapped replay (requires NumPy)
+## trajectoryWriter appends, for every step, the time, the robot config, the control inputs and the colliding pairs.
+## The file is a header followed by chunks. A chunk is preallocated for chunkRows steps and stores them column by column:
+##   time (float64), config (chunkRows x numConfig), control (chunkRows x numControl), number of colliding pairs (uint16),
+##   then the collision events (step in the chunk, pair id) and, when the chunk is full, the names of the new pairs.
+## The last chunk is shrunk to the number of steps it holds when the file is closed.
+## The steps are written in a memory map of the chunk, so appending a step does not allocate Python objects.
+## flush() makes the steps written so far readable (e.g. during a long run), close() finalizes the file.
+## trajectoryReader memory-maps the file: the columns of a chunk are NumPy views on the file, and only the
+## chunks that are accessed are read from the disk, so runs of millions of steps can be scrubbed or streamed.
+##
+## Execution:
+##   python trajectoryLog.py info run.ktrj
+##   python trajectoryLog.py replay run.ktrj --world simpleWorld.xml --robot sphero [--speed 1.0] [--start 0]
+
+import sys
+import os
+import json
+import time
+import struct
+import numpy as np
+
+MAGIC = b"KTRJ0001"
+CHUNK_MAGIC = b"CHNK"
+## Chunk header: magic, capacity (steps, events), number of steps, number of events, length of the names block
+_CHUNK_HEADER = struct.Struct("<4sIIIII")
+
+def _pad8(n):
+    return (n + 7) & ~7
+
+def _chunkLayout(meta, rows, events):
+    ## Offsets of the columns in a chunk of capacity (rows, events), relative to the start of the chunk, and total size
+    size = _pad8(_CHUNK_HEADER.size)
+    layout = {}
+    for name,dtype,width in [("time", "float64", 1), ("config", meta["dtype"], meta["numConfig"]),
+                             ("control", meta["dtype"], meta["numControl"]), ("numPairs", "uint16", 1)]:
+        layout[name] = (size, dtype, width)
+        size = _pad8(size + rows * width * np.dtype(dtype).itemsize)
+    layout["events"] = (size, "uint32", 2)
+    size = _pad8(size + events * 2 * 4)
+    return layout, size
+
+def _views(buf, offset, layout, rows, events):
+    ## NumPy views on the columns of the chunk of capacity (rows, events) that starts at offset in buf
+    views = {}
+    for name,(start,dtype,width) in layout.items():
+        n = events if name == "events" else rows
+        a = np.ndarray((n, width), dtype=dtype, buffer=buf, offset=offset + start)
+        views[name] = a[:, 0] if width == 1 and name != "events" else a
+    return views
+
+class trajectoryWriter(object):
+    def __init__ (self, fn, numConfig, numControl = 0, chunkRows = 65536, chunkEvents = None, dtype = "float64", info = {}):
+        ## numConfig, numControl: width of the config and control columns
+        ## chunkRows: steps per chunk, chunkEvents: collision events per chunk (by default 2 per step)
+        ## dtype: type of the config and control columns ("float64" or "float32")
+        ## info: extra metadata stored in the header (e.g. robot name, time step)
+        self.fn = fn
+        self.meta = {"numConfig": int(numConfig), "numControl": int(numControl), "chunkRows": int(chunkRows),
+                     "chunkEvents": int(chunkEvents if chunkEvents is not None else 2*chunkRows), "dtype": np.dtype(dtype).name, "info": info}
+        self.pairIds = {}
+        self._newNames = []
+        self.numSteps = 0
+        self.f = open(fn, "wb+")
+        header = json.dumps(self.meta).encode("utf-8")
+        self.f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.f.write(b"\0" * (_pad8(self.f.tell()) - self.f.tell()))
+        self.end = self.f.tell()
+        self._map = None
+        self._startChunk()
+
+    def _startChunk(self):
+        ## Preallocate the next chunk at the end of the file and map it
+        self.capacity = (self.meta["chunkRows"], self.meta["chunkEvents"])
+        self.layout,self.chunkSize = _chunkLayout(self.meta, *self.capacity)
+        self.f.truncate(self.end + self.chunkSize)
+        self.f.flush()
+        self._map = np.memmap(self.f, dtype=np.uint8, mode="r+", offset=self.end, shape=(self.chunkSize,))
+        self.cols = _views(self._map, 0, self.layout, *self.capacity)
+        self.rows = 0
+        self.events = 0
+
+    def _writeChunkHeader(self, namesLen):
+        header = _CHUNK_HEADER.pack(CHUNK_MAGIC, self.capacity[0], self.capacity[1], self.rows, self.events, namesLen)
+        self._map[:_CHUNK_HEADER.size] = np.frombuffer(header, dtype=np.uint8)
+
+    def _shrinkChunk(self):
+        ## Move the columns of a partially filled chunk so that its capacity is the number of steps and events it holds
+        cols = dict((k, v[:self.events].copy() if k == "events" else v[:self.rows].copy()) for k,v in self.cols.items())
+        self.capacity = (self.rows, self.events)
+        self.layout,self.chunkSize = _chunkLayout(self.meta, *self.capacity)
+        self.cols = _views(self._map, 0, self.layout, *self.capacity)
+        for k,v in cols.items():
+            self.cols[k][:] = v
+
+    def _endChunk(self, shrink = False):
+        if shrink and (self.rows, self.events) != self.capacity:
+            self._shrinkChunk()
+        names = json.dumps(self._newNames).encode("utf-8")
+        self._writeChunkHeader(len(names))
+        self._map.flush()
+        self._map = None
+        self.cols = None
+        self.f.seek(self.end + self.chunkSize)
+        self.f.write(names + b"\0" * (_pad8(len(names)) - len(names)))
+        self.end = self.end + self.chunkSize + _pad8(len(names))
+        self._newNames = []
+
+    def append(self, t, config, control = (), pairs = ()):
+        ## Record one step: time, config, control inputs and the list of colliding pairs (name, name)
+        if self.rows == self.meta["chunkRows"] or self.events + len(pairs) > self.meta["chunkEvents"]:
+            if len(pairs) > self.meta["chunkEvents"]:
+                raise ValueError("More colliding pairs in one step than chunkEvents")
+            self._endChunk()
+            self._startChunk()
+        r = self.rows
+        self.cols["time"][r] = t
+        self.cols["config"][r] = config
+        if self.meta["numControl"]:
+            self.cols["control"][r] = control
+        self.cols["numPairs"][r] = len(pairs)
+        for pair in pairs:
+            pair = tuple(pair)
+            k = self.pairIds.get(pair)
+            if k is None:
+                k = len(self.pairIds)
+                self.pairIds[pair] = k
+                self._newNames.append(list(pair))
+            self.cols["events"][self.events] = (r, k)
+            self.events += 1
+        self.rows += 1
+        self.numSteps += 1
+
+    def flush(self):
+        ## Make the steps written so far visible to a reader (the names of the pairs first seen in the current chunk are written by close())
+        self._writeChunkHeader(0)
+        self._map.flush()
+
+    def close(self):
+        if self.f is None:
+            return
+        if self.rows > 0:
+            self._endChunk(shrink=True)
+        else:
+            self._map = None
+            self.cols = None
+        self.f.truncate(self.end)
+        self.f.close()
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class trajectoryReader(object):
+    def __init__ (self, fn):
+        self.fn = fn
+        self.buf = np.memmap(fn, dtype=np.uint8, mode="r")
+        if self.buf[:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError(fn + " is not a trajectory file")
+        metaLen = struct.unpack("<I", self.buf[len(MAGIC):len(MAGIC) + 4].tobytes())[0]
+        start = len(MAGIC) + 4
+        self.meta = json.loads(self.buf[start:start + metaLen].tobytes().decode("utf-8"))
+        self.info = self.meta["info"]
+        ## Index of the chunks: (offset, first step, number of steps, number of events, capacity)
+        self.chunks = []
+        self.pairNames = []
+        offset = _pad8(start + metaLen)
+        step = 0
+        while offset + _CHUNK_HEADER.size <= len(self.buf):
+            magic,capRows,capEvents,rows,events,namesLen = _CHUNK_HEADER.unpack(self.buf[offset:offset + _CHUNK_HEADER.size].tobytes())
+            size = _chunkLayout(self.meta, capRows, capEvents)[1]
+            if magic != CHUNK_MAGIC or offset + size > len(self.buf):
+                break
+            self.chunks.append((offset, step, rows, events, (capRows, capEvents)))
+            step += rows
+            end = offset + size
+            if namesLen:
+                self.pairNames += [tuple(p) for p in json.loads(self.buf[end:end + namesLen].tobytes().decode("utf-8"))]
+            offset = end + _pad8(namesLen)
+        self.numSteps = step
+        self._starts = np.array([c[1] for c in self.chunks], dtype=np.int64)
+        self._cache = {}
+
+    def __len__(self):
+        return self.numSteps
+
+    def chunk(self, c):
+        ## Views on the columns of chunk c, trimmed to the steps and events it holds
+        views = self._cache.get(c)
+        if views is None:
+            offset,first,rows,events,capacity = self.chunks[c]
+            views = _views(self.buf, offset, _chunkLayout(self.meta, *capacity)[0], *capacity)
+            views = dict((k, v[:events] if k == "events" else v[:rows]) for k,v in views.items())
+            self._cache = {c: views}
+        return views
+
+    def _locate(self, step):
+        if step < 0:
+            step += self.numSteps
+        if step < 0 or step >= self.numSteps:
+            raise IndexError("step out of range")
+        c = int(np.searchsorted(self._starts, step, side="right")) - 1
+        return c, step - self.chunks[c][1]
+
+    def pairName(self, k):
+        return self.pairNames[k] if k < len(self.pairNames) else ("pair#"+str(k), "pair#"+str(k))
+
+    def _pairs(self, views, r):
+        ev = views["events"]
+        lo = np.searchsorted(ev[:, 0], r, side="left")
+        hi = np.searchsorted(ev[:, 0], r, side="right")
+        return [self.pairName(int(k)) for k in ev[lo:hi, 1]]
+
+    def __getitem__(self, step):
+        ## (time, config, control, colliding pairs) of a step
+        c,r = self._locate(step)
+        v = self.chunk(c)
+        return (float(v["time"][r]), v["config"][r], v["control"][r], self._pairs(v, r) if v["numPairs"][r] else [])
+
+    def column(self, name, start = 0, stop = None):
+        ## Copy of the steps [start, stop) of a column ("time", "config", "control", "numPairs"), only the chunks in the range are read
+        stop = self.numSteps if stop is None else min(stop, self.numSteps)
+        parts = []
+        for c,(offset,first,rows,events,capacity) in enumerate(self.chunks):
+            if first + rows <= start or first >= stop:
+                continue
+            parts.append(self.chunk(c)[name][max(start - first, 0):stop - first])
+        if not parts:
+            return self.chunk(0)[name][:0].copy() if self.chunks else np.zeros(0)
+        return np.concatenate(parts)
+
+    def collisionSteps(self):
+        ## Indices of the steps with at least one colliding pair
+        steps = [np.nonzero(self.chunk(c)["numPairs"])[0] + first for c,(offset,first,rows,events,capacity) in enumerate(self.chunks)]
+        return np.concatenate(steps) if steps else np.zeros(0, dtype=np.int64)
+
+    def stream(self, start = 0, stop = None, stride = 1):
+        ## Iterate over the steps (time, config, control, pairs), one chunk in memory at a time
+        stop = self.numSteps if stop is None else min(stop, self.numSteps)
+        step = start
+        while step < stop:
+            c,r = self._locate(step)
+            v = self.chunk(c)
+            rows = self.chunks[c][2]
+            while r < rows and step < stop:
+                yield (float(v["time"][r]), v["config"][r], v["control"][r], self._pairs(v, r) if v["numPairs"][r] else [])
+                r += stride
+                step += stride
+
+    def close(self):
+        self._cache = {}
+        self.buf = None
+
+def replay(reader, robot, vis = None, start = 0, stop = None, speed = 1.0, stride = 1):
+    ## Play the recorded configs back on a robot wrapper, at speed times the recorded time
+    ## If vis is given (klampt.vis or visUpdater), the colliding pairs are shown in the "textCol" text
+    wallStart = time.time()
+    t0 = None
+    for t,q,u,pairs in reader.stream(start, stop, stride):
+        if t0 is None:
+            t0 = t
+        delay = (t - t0)/speed - (time.time() - wallStart)
+        if delay > 0:
+            time.sleep(delay)
+        if vis is not None:
+            vis.lock()
+        robot.setConfig(q.tolist())
+        robot.flush()
+        if vis is not None:
+            vis.addText("textCol", ", ".join(a + " collides with " + b for a,b in pairs) if pairs else "No collision")
+            vis.unlock()
+            if hasattr(vis, "shown") and not vis.shown():
+                break
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Information on a trajectory file, or replay in the visualizer")
+    parser.add_argument("command", choices=["info", "replay"])
+    parser.add_argument("file")
+    parser.add_argument("--world", nargs="+", default=["simpleWorld.xml"])
+    parser.add_argument("--robot", default="sphero", choices=["sphero", "kobuki", "turtlebot"])
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--start", type=int, default=0)
+    args = parser.parse_args()
+    reader = trajectoryReader(args.file)
+    if args.command == "info":
+        print('{0} steps in {1} chunks, {2} steps with collision, {3} colliding pairs'.format(len(reader), len(reader.chunks), len(reader.collisionSteps()), len(reader.pairNames)))
+        print("Metadata: " + json.dumps(reader.meta))
+        if len(reader):
+            t = reader.column("time")
+            print('Time: {0:.3f} to {1:.3f} s'.format(t[0], t[-1]))
+    else:
+        from klampt import vis
+        import headlessSim
+        world = headlessSim.loadWorld(args.world, reader.info.get("room", "door"))
+        vis.add("world", world)
+        robot = headlessSim.makeRobot(world, args.robot, vis=vis)
+        vis.addText("textCol", "No collision")
+        vis.show()
+        replay(reader, robot, vis, args.start, None, args.speed)
+        vis.kill()
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+
+## Throttled, dirty-tracked updates of klampt.vis
+## The class visUpdater has the same add/addText/setColor/setAttribute/edit functions as klampt.vis,
+## so it can be given to the robot wrappers in place of vis.
+## Calls to add, addText and setColor are only recorded (the last value per item wins), except the first add of
+## an item, which goes straight to vis so that setAttribute and edit can be called on the item right away.
+## update() pushes to vis the items whose value differs from what was last pushed,
+## and does it at most fps times per second. It must be called with the vis lock held.
+
+import time
+
+## Items are pushed before their text and colors
+_order = {"add": 0, "text": 1, "color": 2}
+
+class visUpdater(object):
+    def __init__ (self, vis, fps=30.0):
+        self.vis = vis
+        self.fps = fps
+        self.period = 1.0/fps if fps > 0 else 0.0
+        self.lastUpdate = None
+        self.numUpdates = 0
+        self._pending = {} ## (kind, name) -> arguments of the pending call
+        self._pushed = {}  ## (kind, name) -> arguments of the last call pushed to vis
+
+    ## Same interface as klampt.vis
+    def add(self, name, item, keepAppearance=False):
+        key = ("add", name)
+        if key not in self._pushed:
+            ## New item: create it in vis now
+            self.vis.add(name, item, keepAppearance=keepAppearance)
+            self._pushed[key] = (item, keepAppearance)
+            self._pending.pop(key, None)
+            return
+        self._pending[key] = (item, keepAppearance)
+
+    def addText(self, name, text, pos=None):
+        self._pending[("text", name)] = (text, pos)
+
+    def setColor(self, name, r, g, b, a=1.0):
+        self._pending[("color", name)] = (r, g, b, a)
+
+    def setAttribute(self, name, attr, value):
+        ## Attributes are set once when the items are created, so they go straight to vis
+        self.vis.setAttribute(name, attr, value)
+
+    def edit(self, name, doedit=True):
+        self.vis.edit(name, doedit)
+
+    def due(self, now=None):
+        ## True if the next update() would push to vis
+        if self.lastUpdate is None:
+            return True
+        if now is None:
+            now = time.time()
+        return now - self.lastUpdate >= self.period
+
+    def timeToNextUpdate(self, now=None):
+        if self.lastUpdate is None:
+            return 0.0
+        if now is None:
+            now = time.time()
+        return max(0.0, self.lastUpdate + self.period - now)
+
+    def update(self, force=False):
+        ## Push the pending changes to vis if the display period has elapsed
+        ## Returns the number of items sent to vis
+        now = time.time()
+        if not force and not self.due(now):
+            return 0
+        self.lastUpdate = now
+        self.numUpdates += 1
+        numPushed = 0
+        for key,args in sorted(self._pending.items(), key=lambda kv: _order[kv[0][0]]):
+            if self._pushed.get(key) == args:
+                continue
+            kind,name = key
+            if kind == "add":
+                self.vis.add(name, args[0], keepAppearance=args[1])
+            elif kind == "text":
+                if args[1] is None:
+                    self.vis.addText(name, args[0])
+                else:
+                    self.vis.addText(name, args[0], args[1])
+            elif kind == "color":
+                self.vis.setColor(name, *args)
+            self._pushed[key] = args
+            numPushed += 1
+        self._pending.clear()
+        return numPushed
@@ -0,0 +1,218 @@
+#!/usr/bin/python
+
+## Procedural generation of large environments on top of buildWorld
+## The layouts are generated from a seed as streams of walls (dimX, dimY, dimZ, pos, rotZ), the same description as buildWorld.getWall
+##  1. wallLine: Walls along a line with door and window openings (the building block of the layouts)
+##  2. roomGridWalls: N x M grid of rooms with a door or a window on every inner wall
+##  3. corridorWalls: Two rows of rooms on both sides of a corridor, every room has a door to the corridor
+##  4. mazeWalls: Random maze (depth first search) on a grid of cells
+##  5. buildLayout: Add a layout to the world as one merged geometry per static layer.
+##     The layout can be split in square tiles, and only the walls in a region can be built (partial construction)
+##
+## Execution (benchmark of the build time and memory against the number of walls):
+##   python worldGen.py [--sizes 10 20 40] [--nomerge]
+
+import sys
+import os
+import time
+import math
+import random
+from klampt import WorldModel
+try:
+    from . import buildWorld as bW
+except (ImportError, ValueError):
+    import buildWorld as bW
+
+def wallLine(start, length, axis, dimZ, openings = [], wall_thickness = 0.01):
+    ## Walls from start=(x, y) along the x axis (axis=0) or the y axis (axis=1)
+    ## openings is a list of (offset, width, kind), kind is "door" (no wall) or "window"
+    ## A window is a wall of height dimZ/3 below and above the opening, as in buildWorld.getDoubleRoomWindow
+    z3 = dimZ/3.0
+    pos = 0.0
+    for offset,width,kind in sorted(openings):
+        if offset > pos:
+            yield _segment(start, pos, offset - pos, axis, dimZ, 0.0, wall_thickness)
+        if kind == "window":
+            yield _segment(start, offset, width, axis, z3, 0.0, wall_thickness)
+            yield _segment(start, offset, width, axis, z3, 2.0*z3, wall_thickness)
+        pos = offset + width
+    if pos < length:
+        yield _segment(start, pos, length - pos, axis, dimZ, 0.0, wall_thickness)
+
+def _segment(start, offset, length, axis, height, z, wall_thickness):
+    if axis == 0:
+        return (length, wall_thickness, height, [start[0] + offset, start[1], z], 0)
+    return (wall_thickness, length, height, [start[0], start[1] + offset, z], 0)
+
+def _opening(rng, length, width, windowProb):
+    ## Random door or window on a wall of the given length
+    width = min(width, 0.8*length)
+    offset = rng.uniform(0.1*length, 0.9*length - width)
+    kind = "window" if rng.random() < windowProb else "door"
+    return (offset, width, kind)
+
+def roomGridWalls(seed, rows, cols, roomX, roomY, dimZ, doorWidth = 1.0, windowProb = 0.0, wall_thickness = 0.01, origin = (0, 0)):
+    ## rows x cols rooms of size roomX x roomY, every inner wall has one opening (door, or window with probability windowProb)
+    ## The outer walls are closed
+    rng = random.Random(seed)
+    x0,y0 = origin
+    for j in range(rows + 1):
+        for i in range(cols):
+            openings = []
+            if 0 < j < rows:
+                openings.append(_opening(rng, roomX, doorWidth, windowProb))
+            for w in wallLine((x0 + i*roomX, y0 + j*roomY), roomX, 0, dimZ, openings, wall_thickness):
+                yield w
+    for i in range(cols + 1):
+        for j in range(rows):
+            openings = []
+            if 0 < i < cols:
+                openings.append(_opening(rng, roomY, doorWidth, windowProb))
+            for w in wallLine((x0 + i*roomX, y0 + j*roomY), roomY, 1, dimZ, openings, wall_thickness):
+                yield w
+
+def corridorWalls(seed, numRooms, roomX, roomY, corridorWidth, dimZ, doorWidth = 1.0, windowProb = 0.0, wall_thickness = 0.01, origin = (0, 0)):
+    ## Two rows of numRooms rooms on both sides of a corridor along the x axis
+    ## Every room has a door (or a window) to the corridor, the rooms are separated by closed walls
+    rng = random.Random(seed)
+    x0,y0 = origin
+    length = numRooms*roomX
+    yLines = [y0, y0 + roomY, y0 + roomY + corridorWidth, y0 + 2*roomY + corridorWidth]
+    for k,y in enumerate(yLines):
+        for i in range(numRooms):
+            openings = []
+            if k in (1, 2):
+                openings.append(_opening(rng, roomX, doorWidth, windowProb))
+            for w in wallLine((x0 + i*roomX, y), roomX, 0, dimZ, openings, wall_thickness):
+                yield w
+    for i in range(numRooms + 1):
+        yield _segment((x0 + i*roomX, y0), 0.0, roomY, 1, dimZ, 0.0, wall_thickness)
+        yield _segment((x0 + i*roomX, yLines[2]), 0.0, roomY, 1, dimZ, 0.0, wall_thickness)
+    ## Ends of the corridor
+    yield _segment((x0, yLines[1]), 0.0, corridorWidth, 1, dimZ, 0.0, wall_thickness)
+    yield _segment((x0 + length, yLines[1]), 0.0, corridorWidth, 1, dimZ, 0.0, wall_thickness)
+
+def mazeWalls(seed, rows, cols, cell, dimZ, wall_thickness = 0.01, origin = (0, 0)):
+    ## Random maze on a rows x cols grid of square cells of size cell (iterative depth first search)
+    ## Consecutive wall pieces on the same line are merged into a single wall
+    rng = random.Random(seed)
+    x0,y0 = origin
+    ## hWall[j][i]: wall below cell (i, j), j = 0..rows; vWall[j][i]: wall left of cell (i, j), i = 0..cols
+    hWall = [[True]*cols for j in range(rows + 1)]
+    vWall = [[True]*(cols + 1) for j in range(rows)]
+    visited = [[False]*cols for j in range(rows)]
+    stack = [(0, 0)]
+    visited[0][0] = True
+    while stack:
+        i,j = stack[-1]
+        neighbours = []
+        if i > 0 and not visited[j][i-1]:
+            neighbours.append((i-1, j))
+        if i < cols - 1 and not visited[j][i+1]:
+            neighbours.append((i+1, j))
+        if j > 0 and not visited[j-1][i]:
+            neighbours.append((i, j-1))
+        if j < rows - 1 and not visited[j+1][i]:
+            neighbours.append((i, j+1))
+        if not neighbours:
+            stack.pop()
+            continue
+        ni,nj = rng.choice(neighbours)
+        if ni != i:
+            vWall[j][max(i, ni)] = False
+        else:
+            hWall[max(j, nj)][i] = False
+        visited[nj][ni] = True
+        stack.append((ni, nj))
+    for j in range(rows + 1):
+        for first,count in _runs(hWall[j]):
+            yield _segment((x0 + first*cell, y0 + j*cell), 0.0, count*cell, 0, dimZ, 0.0, wall_thickness)
+    for i in range(cols + 1):
+        for first,count in _runs([vWall[j][i] for j in range(rows)]):
+            yield _segment((x0 + i*cell, y0 + first*cell), 0.0, count*cell, 1, dimZ, 0.0, wall_thickness)
+
+def _runs(flags):
+    ## (first, count) of the runs of True values
+    first = None
+    for k,f in enumerate(flags):
+        if f and first is None:
+            first = k
+        elif not f and first is not None:
+            yield (first, k - first)
+            first = None
+    if first is not None:
+        yield (first, len(flags) - first)
+
+def wallBounds(wall):
+    ## (xmin, ymin, xmax, ymax) of a wall
+    vertices = bW.getWallVertices(*wall)
+    xs = [v[0] for v in vertices]
+    ys = [v[1] for v in vertices]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def _overlaps(b, region):
+    return b[0] <= region[2] and b[2] >= region[0] and b[1] <= region[3] and b[3] >= region[1]
+
+def buildLayout(world, walls, name = "layout", merge = True, tileSize = None, region = None, asTerrain = False, color = [0.85, 0.85, 0.85, 1]):
+    ## Add the walls to the world as static layers
+    ## walls can be any iterable (e.g. the generators above), it is consumed once
+    ## merge: one merged triangle mesh per layer, otherwise a group with one element per wall
+    ## tileSize: split the layout into square tiles of this size, one layer per tile (named name_i_j)
+    ## region: (xmin, ymin, xmax, ymax), only the walls overlapping the region are built
+    ## asTerrain: add the layers as terrains instead of rigid objects
+    ## Returns the list of created layers
+    tiles = {}
+    for w in walls:
+        if region is not None or tileSize is not None:
+            b = wallBounds(w)
+            if region is not None and not _overlaps(b, region):
+                continue
+        key = None
+        if tileSize is not None:
+            key = (int(math.floor(0.5*(b[0] + b[2])/tileSize)), int(math.floor(0.5*(b[1] + b[3])/tileSize)))
+        tiles.setdefault(key, []).append(w)
+    layers = []
+    for key in sorted(tiles.keys(), key=lambda k: (k is not None, k)):
+        layerName = name if key is None else name+"_"+str(key[0])+"_"+str(key[1])
+        if asTerrain:
+            layer = world.makeTerrain(layerName)
+        else:
+            layer = world.makeRigidObject(layerName)
+        layer.geometry().set(bW.getWalls(tiles[key], merge))
+        bW.recordWalls(world, tiles[key])
+        layer.appearance().setColor(color[0], color[1], color[2], color[3])
+        layers.append(layer)
+    return layers
+
+def _rssMB():
+    ## Resident memory of the process in MB (Linux), peak resident memory elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (IOError, OSError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark of the procedural world generation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 40, 80], help="maze and room grid sizes")
+    parser.add_argument("--nomerge", action="store_true", help="build every layer as a group of walls instead of one merged mesh (the default of buildLayout)")
+    parser.add_argument("--tile", type=float, default=None, help="tile size (m)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print('{0:>10} {1:>6} {2:>8} {3:>10} {4:>10} {5:>10}'.format("layout", "size", "walls", "gen (s)", "build (s)", "mem (MB)"))
+    for size in args.sizes:
+        for layout in ["roomGrid", "maze"]:
+            world = WorldModel()
+            mem0 = _rssMB()
+            t0 = time.time()
+            if layout == "roomGrid":
+                walls = list(roomGridWalls(args.seed, size, size, 4.0, 4.0, 1.0, windowProb=0.2))
+            else:
+                walls = list(mazeWalls(args.seed, size, size, 1.0, 1.0))
+            t1 = time.time()
+            buildLayout(world, walls, layout, not args.nomerge, args.tile)
+            t2 = time.time()
+            print('{0:>10} {1:>6} {2:>8} {3:>10.4f} {4:>10.4f} {5:>10.1f}'.format(layout, size, len(walls), t1 - t0, t2 - t1, _rssMB() - mem0))